@@ -1,4 +1,5 @@
 from copy import copy, deepcopy
+import os
 from typing import Optional
 
 import Utils
@@ -8,6 +9,11 @@ class Args:
         self._args: list[str] = copy(args)
         if self._args and self._args[0].endswith('.py'):
             self._args = self._args[1:]
+        self._options: dict[str, str] = {}
+        for arg in [x for x in self._args if x.startswith('--')]:
+            key, _, value = arg[2:].partition('=')
+            self._options[key.lower()] = value
+        self._args = [x for x in self._args if not x.startswith('--')]
         if self.feature() == 'name':
             assert self.num_args() <= 2 or not Utils.refers_to_db(self._args[2])
         elif isinstance(self.feature(), str):
@@ -29,6 +35,21 @@ class Args:
         """Returns a list of any additional cli args (all lowercased) entered for the `name` feature."""
         return [x.lower() for x in self._args[2:]]
 
+    def option(self, name: str) -> Optional[str]:
+        """Returns the value of a `--name=value` cli option (an empty string for a bare `--name`),
+           or None if the option wasn't given."""
+        return self._options.get(name)
+
+    def jobs(self) -> int:
+        """Returns how many pgn sources to process at once: 1 without `--jobs`, and for `--jobs=auto` (or
+           `--jobs=0`) however many engines `--calibrate` found to be fastest (or else one per cpu)."""
+        if (jobs := self.option('jobs')) is None:
+            return 1
+        if jobs in ('auto', '0'):
+            import engine
+            return engine.calibrated_jobs() or os.cpu_count() or 1
+        return int(jobs or '1')
+
 _args: Optional[Args] = None
 
 def set_args(args: list[str]) -> None:
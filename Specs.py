@@ -1,7 +1,16 @@
 from __future__ import annotations
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, TYPE_CHECKING
 from copy import copy
 
+from analysis import AnalysisProfile
+from prefilter import Prefilter
+
+if TYPE_CHECKING:
+    from memory import MemoryMonitor
+    from selection import PositionSelection
+    from trajectory import TrajectoryPruner
+    from pipeline import JoinedHits
+
 def file_char_to_int(file_char: str) -> int:
     file_char = file_char.lower()
     assert 'a' <= file_char <= 'h'
@@ -104,6 +113,22 @@ class Specs:
         ) if self._type_of_position != 'name' else 0
         self._substrings_if_name_feature: Optional[List[str]] = None
         self._verbose_name_feature: Optional[bool] = None
+        self._start_offset = 0
+        self._max_games: Optional[int] = None
+        self._checkpoint_interval: Optional[float] = None
+        self._concurrent_engines = 1
+        self._analysis_profile = AnalysisProfile()
+        self._prefilter: Optional[Prefilter] = None
+        self._syzygy_path: Optional[str] = None
+        self._profile_interval: Optional[float] = None
+        self._progress_interval: Optional[float] = None
+        self._memory_monitor: Optional[MemoryMonitor] = None
+        self._sample: Optional[Tuple[int, int]] = None
+        self._position_selection: Optional[PositionSelection] = None
+        self._trajectory_pruner: Optional[TrajectoryPruner] = None
+        self._dedup_path: Optional[str] = None
+        self._extract_dir: Optional[str] = None
+        self._joined_hits: Optional[JoinedHits] = None
 
     def filename_of_output(self) -> str:
         assert self._output_filename is not None
@@ -122,6 +147,18 @@ class Specs:
         assert self._pgn is not None
         return self._pgn
 
+    def set_game_range(self, start_offset: int, max_games: Optional[int]) -> None:
+        """Restricts the search to (at most) `max_games` games, starting at the game that begins at
+           byte offset `start_offset` of the pgn."""
+        self._start_offset, self._max_games = start_offset, max_games
+
+    def start_offset(self) -> int:
+        return self._start_offset
+
+    def max_games(self) -> Optional[int]:
+        """Returns the max number of games to search, or None if the search goes to the end of the pgn."""
+        return self._max_games
+
     def game_num_to_search_after(self) -> Optional[int]:
         return self._game_to_search_after.game_num()
 
@@ -129,12 +166,112 @@ class Specs:
         """If not None, returns a tuple for the name of white, name of black, and date."""
         return self._game_to_search_after.game_details()
 
+    def stop_skipping_games(self) -> None:
+        self._game_to_search_after = GameToSearchAfter(True)
+
     def do_not_skip_any_games(self) -> bool:
         return self._game_to_search_after.game_details() is None and self._game_to_search_after.game_num() == 0
 
     def move_to_begin_at(self) -> int:
         return self._move_to_begin_at
 
+    def set_checkpoint_interval(self, seconds: Optional[float]) -> None:
+        self._checkpoint_interval = seconds
+
+    def checkpoint_interval(self) -> Optional[float]:
+        """Returns the number of seconds between checkpoints of the search, or None if they're off."""
+        return self._checkpoint_interval
+
+    def set_concurrent_engines(self, num_engines: int) -> None:
+        self._concurrent_engines = num_engines
+
+    def set_analysis_profile(self, profile: AnalysisProfile) -> None:
+        self._analysis_profile = profile
+
+    def analysis_profile(self) -> AnalysisProfile:
+        return self._analysis_profile
+
+    def set_prefilter(self, prefilter: Optional[Prefilter]) -> None:
+        self._prefilter = prefilter
+
+    def prefilter(self) -> Optional[Prefilter]:
+        return self._prefilter
+
+    def set_syzygy_path(self, path: Optional[str]) -> None:
+        self._syzygy_path = path
+
+    def syzygy_path(self) -> Optional[str]:
+        """Returns the directory of the Syzygy tablebases to check positions with, or None to only use the engine."""
+        return self._syzygy_path
+
+    def set_profile_interval(self, seconds: Optional[float]) -> None:
+        self._profile_interval = seconds
+
+    def profile_interval(self) -> Optional[float]:
+        """Returns the number of seconds between writes of the profiling data, or None if it isn't written."""
+        return self._profile_interval
+
+    def set_progress_interval(self, seconds: Optional[float]) -> None:
+        self._progress_interval = seconds
+
+    def progress_interval(self) -> Optional[float]:
+        """Returns the number of seconds between progress reports, or None if there aren't any."""
+        return self._progress_interval
+
+    def set_memory_monitor(self, monitor: Optional[MemoryMonitor]) -> None:
+        self._memory_monitor = monitor
+
+    def memory_monitor(self) -> Optional[MemoryMonitor]:
+        return self._memory_monitor
+
+    def set_sample(self, sample: Optional[Tuple[int, int]]) -> None:
+        self._sample = sample
+
+    def sample(self) -> Optional[Tuple[int, int]]:
+        """Returns the number of games to sample from the pgn and the seed to sample them with, or None to
+           search every game."""
+        return self._sample
+
+    def set_position_selection(self, selection: Optional[PositionSelection]) -> None:
+        self._position_selection = selection
+
+    def position_selection(self) -> Optional[PositionSelection]:
+        """Returns which of a game's positions (from the move to begin at on) are checked, or None for all of them."""
+        return self._position_selection
+
+    def set_trajectory_pruner(self, pruner: Optional[TrajectoryPruner]) -> None:
+        self._trajectory_pruner = pruner
+
+    def trajectory_pruner(self) -> Optional[TrajectoryPruner]:
+        return self._trajectory_pruner
+
+    def set_dedup_path(self, path: Optional[str]) -> None:
+        self._dedup_path = path
+
+    def dedup_path(self) -> Optional[str]:
+        """Returns the sqlite database of the games seen so far (to skip games seen before), or None to search
+           every game."""
+        return self._dedup_path
+
+    def set_extract_dir(self, directory: Optional[str]) -> None:
+        self._extract_dir = directory
+
+    def extract_dir(self) -> Optional[str]:
+        """Returns the directory to write the positions to check to (see pipeline.py) instead of checking them,
+           or None to check them."""
+        return self._extract_dir
+
+    def set_joined_hits(self, hits: Optional[JoinedHits]) -> None:
+        self._joined_hits = hits
+
+    def joined_hits(self) -> Optional[JoinedHits]:
+        """Returns the hits already found for the positions (see pipeline.py), or None to check them."""
+        return self._joined_hits
+
+    def concurrent_engines(self) -> int:
+        """Returns how many engines (one per source being searched at once) share this machine's memory."""
+        return self._concurrent_engines
+
     def default_output_interval(self) -> int:
         return {'endgame': 200, 'name': 40000}.get(self.type_of_position(), 40)
 
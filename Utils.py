@@ -1,19 +1,26 @@
 from __future__ import annotations
 
 import shlex
-import os
+from functools import cache
 
 def remove_lines_starting_with(multline_str: str, starting_substr: str) -> str:
     as_lst = multline_str.splitlines()
     return '\n'.join(line for line in as_lst if not line.startswith(starting_substr))
 
+@cache
 def get_aliases() -> dict[str, str]:
+    """Returns the aliases in aliases.txt (read just the first time this is called). The dict
+       shouldn't be modified."""
     try:
         with open('aliases.txt', mode='r') as f:
             return {k.lower(): v for k,v in (line.strip().split(maxsplit=1) for line in f)}
     except FileNotFoundError:
         return {}
 
+@cache
+def _words_in_alias_meanings() -> frozenset[str]:
+    return frozenset(word for meaning in get_aliases().values() for word in shlex.split(meaning))
+
 def refers_to_db(s: str) -> bool:
     """Returns true if s likely refers to an alias, pgn path, or study"""
     return (
@@ -21,9 +28,5 @@ def refers_to_db(s: str) -> bool:
         s in get_aliases().keys() or
         s.count('/') >= 3 or
         s.count('\\') >= 3 or
-        any(s in shlex.split(l) for l in get_aliases().values())
-    )
-
-def most_recent_file(dir: str) -> str:
-    """Returns the filename of the most recent file in the directory."""
-    return max((os.path.join(dir, basename) for basename in os.listdir(dir)), key=os.path.getmtime)
\ No newline at end of file
+        s in _words_in_alias_meanings()
+    )
\ No newline at end of file
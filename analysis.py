@@ -0,0 +1,248 @@
+"""How far the engine searches for each check of a position: to fixed depths (the default), to node
+counts, or for a time that a BudgetScheduler adjusts so that the whole search fits in a time budget."""
+
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+import time
+from typing import TYPE_CHECKING, Iterator, Optional
+
+if TYPE_CHECKING:
+    from models import Stockfish
+
+STEP_FACTOR = 4
+"""For node and time limits, each of a check's searches (besides the last) gets this many times less
+   than the next one, like the fixed depths of a check roughly do."""
+
+@dataclass
+class MoveAnalysis:
+    move: str
+    centipawn: Optional[int]
+    mate: Optional[int]
+    """Both as get_top_moves reports them (so from the perspective of the player to move)."""
+    wdl: Optional[tuple[int, int, int]] = None
+    """Win/draw/loss per mille, if the engine reports it."""
+
+@dataclass
+class AnalysisResult:
+    """The last search a check of a position did, and whether the position satisfied the check. Hits are
+       rendered from it, and it's what gets cached and exported, so that no position is searched twice."""
+
+    fen: str
+    limit: str
+    """E.g., 'depth: 15' or 'nodes: 500000'."""
+    satisfied: bool
+    moves: list[MoveAnalysis]
+    depth: Optional[int] = None
+    nodes: Optional[int] = None
+    time_ms: Optional[int] = None
+
+    @staticmethod
+    def from_top_moves(fen: str, limit: str, top_moves: list[dict], satisfied: bool) -> AnalysisResult:
+        """`top_moves` is what get_top_moves returned (with verbose=True for the depth, nodes, time and wdl)."""
+        moves = [MoveAnalysis(d["Move"], d["Centipawn"], d["Mate"]) for d in top_moves]
+        for move, d in zip(moves, top_moves):
+            if "WDL" in d:
+                win, draw, loss = (int(x) for x in d["WDL"].split())
+                move.wdl = (win, draw, loss)
+        stats = [int(top_moves[0][k]) if top_moves and k in top_moves[0] else None
+                 for k in ("Depth", "Nodes", "Time")]
+        return AnalysisResult(fen, limit, satisfied, moves, *stats)
+
+    def top_moves(self) -> list[dict]:
+        """Returns the moves as the dicts of a (non-verbose) call to get_top_moves."""
+        return [{"Move": m.move, "Centipawn": m.centipawn, "Mate": m.mate} for m in self.moves]
+
+    def to_json(self) -> dict:
+        return asdict(self)
+
+    @staticmethod
+    def from_json(data: dict) -> AnalysisResult:
+        moves = [MoveAnalysis(m["move"], m["centipawn"], m["mate"], None if m["wdl"] is None else tuple(m["wdl"]))
+                 for m in data["moves"]]
+        return AnalysisResult(**{**data, "moves": moves})
+
+class AnalysisCache:
+    """The results of the checks of recently seen positions (e.g., those that many games of an opening
+       share), by the position and the check's bounds."""
+
+    MAX_ENTRIES = 100000
+
+    def __init__(self) -> None:
+        self._results: OrderedDict[tuple, AnalysisResult] = OrderedDict()
+        self._num_lookups = self._num_hits = 0
+
+    def get(self, fen: str, bounds: list[Optional[float]]) -> Optional[AnalysisResult]:
+        self._num_lookups += 1
+        if (result := self._results.get((fen, *bounds))) is not None:
+            self._num_hits += 1
+            self._results.move_to_end((fen, *bounds))
+        return result
+
+    def put(self, result: AnalysisResult, bounds: list[Optional[float]]) -> None:
+        self._results[(result.fen, *bounds)] = result
+        if len(self._results) > self.MAX_ENTRIES:
+            self._results.popitem(last=False)
+
+    def clear(self) -> None:
+        self._results.clear()
+
+    def hit_rate(self) -> Optional[float]:
+        """Returns the fraction of lookups that found a result, or None if there haven't been any lookups."""
+        return self._num_hits / self._num_lookups if self._num_lookups else None
+
+    def report(self) -> Optional[str]:
+        if not self._num_hits:
+            return None
+        return f"Reused the analysis of {self._num_hits} of {self._num_lookups} positions checked"
+
+class BudgetScheduler:
+    """Spreads a time budget for searching a pgn over its remaining positions, by adjusting the time
+       of the last search for each check so the checks done so far would finish on schedule."""
+
+    INITIAL_MOVETIME_MS = 200
+    MIN_MOVETIME_MS = 10
+    CHECKS_PER_ADJUSTMENT = 20
+    MAX_ADJUSTMENT_FACTOR = 2.0
+
+    def __init__(self, seconds: float) -> None:
+        self._seconds = seconds
+        self._start: Optional[float] = None
+        self._deadline: Optional[float] = None
+        self._progress = 0.0
+        self._num_checks = 0
+        self._movetime_ms = float(self.INITIAL_MOVETIME_MS)
+
+    def set_progress(self, fraction: float) -> None:
+        """Sets the fraction of the pgn searched so far. The budget's clock starts at the first call."""
+        if self._start is None:
+            self._start = time.time()
+            self._deadline = self._start + self._seconds
+            # Wall clock time, so that a search resumed from a checkpoint keeps to the original deadline.
+        self._progress = fraction
+
+    def movetime_ms(self) -> int:
+        return max(self.MIN_MOVETIME_MS, round(self._movetime_ms))
+
+    def record_check(self) -> None:
+        self._num_checks += 1
+        if self._num_checks % self.CHECKS_PER_ADJUSTMENT == 0:
+            self._adjust()
+
+    def _adjust(self) -> None:
+        if self._start is None or self._deadline is None or not 0 < self._progress < 1:
+            return
+        now = time.time()
+        seconds_per_check = (now - self._start) / self._num_checks
+        remaining_checks = self._num_checks * (1 - self._progress) / self._progress
+        target_seconds_per_check = max(0.0, self._deadline - now) / remaining_checks
+        factor = target_seconds_per_check / seconds_per_check if seconds_per_check else self.MAX_ADJUSTMENT_FACTOR
+        factor = min(self.MAX_ADJUSTMENT_FACTOR, max(1 / self.MAX_ADJUSTMENT_FACTOR, factor))
+        self._movetime_ms = max(float(self.MIN_MOVETIME_MS),
+                                min(self._movetime_ms * factor, target_seconds_per_check * 1000))
+        # A check's last search can't take longer than the whole check should.
+
+    def seconds_used(self) -> float:
+        return 0.0 if self._start is None else time.time() - self._start
+
+    def seconds(self) -> float:
+        return self._seconds
+
+class AnalysisProfile:
+    def __init__(self, kind: str = 'depth', nodes: int = 0, movetime_ms: int = 0,
+                 scheduler: Optional[BudgetScheduler] = None) -> None:
+        assert kind in ('depth', 'nodes', 'movetime', 'budget')
+        assert (kind == 'nodes') == (nodes > 0) and (kind == 'movetime') == (movetime_ms > 0)
+        assert (kind == 'budget') == (scheduler is not None)
+        self._kind = kind
+        self._nodes = nodes
+        self._movetime_ms = movetime_ms
+        self._scheduler = scheduler
+        self._num_searches = self._total_depth = 0
+        self._min_depth: Optional[int] = None
+        self._max_depth: Optional[int] = None
+        """Of the depths reached by the searches (kept as running totals, since a scan can do millions)."""
+
+    def kind(self) -> str:
+        return self._kind
+
+    def scheduler(self) -> Optional[BudgetScheduler]:
+        return self._scheduler
+
+    def with_budget_share(self, fraction: float) -> AnalysisProfile:
+        """Returns a copy of the profile, with a fresh scheduler for this fraction of the time budget."""
+        if self._scheduler is None:
+            return AnalysisProfile(self._kind, self._nodes, self._movetime_ms)
+        return AnalysisProfile('budget', scheduler=BudgetScheduler(self._scheduler.seconds() * fraction))
+
+    def searches(self, stockfish: Stockfish, num_top_moves: int, depths: list[int],
+                 searchmoves: Optional[list[str]] = None) -> Iterator[tuple[str, list[dict]]]:
+        """Yields the limit and the top moves of each successive search for a check, where `depths` are
+           the check's depths for the 'depth' profile. The check can stop at any point."""
+        try:
+            for i, depth in enumerate(depths):
+                scale_down = STEP_FACTOR ** (len(depths) - 1 - i)
+                if self._kind == 'depth':
+                    stockfish.set_depth(depth)
+                    yield f"depth: {depth}", stockfish.get_top_moves(num_top_moves, verbose=True,
+                                                                     searchmoves=searchmoves)
+                    continue
+                if self._kind == 'nodes':
+                    limit = max(1, self._nodes // scale_down)
+                    top_moves = stockfish.get_top_moves(num_top_moves, verbose=True, num_nodes=limit,
+                                                        searchmoves=searchmoves)
+                else:
+                    movetime = self._movetime_ms if self._scheduler is None else self._scheduler.movetime_ms()
+                    limit = max(1, movetime // scale_down)
+                    top_moves = stockfish.get_top_moves(num_top_moves, verbose=True, movetime=limit,
+                                                        searchmoves=searchmoves)
+                if top_moves:
+                    self._record_depth(int(top_moves[0]["Depth"]))
+                yield f"{'nodes' if self._kind == 'nodes' else 'movetime'}: {limit}", top_moves
+        finally:
+            # Also reached when the check stops early (i.e., when it closes this generator).
+            if self._scheduler is not None:
+                self._scheduler.record_check()
+
+    def _record_depth(self, depth: int) -> None:
+        self._num_searches += 1
+        self._total_depth += depth
+        self._min_depth = depth if self._min_depth is None else min(self._min_depth, depth)
+        self._max_depth = depth if self._max_depth is None else max(self._max_depth, depth)
+
+    def set_progress(self, fraction: float) -> None:
+        if self._scheduler is not None:
+            self._scheduler.set_progress(fraction)
+
+    def report(self) -> Optional[str]:
+        """Returns a summary of the depths reached by the searches (or None for the 'depth' profile)."""
+        if self._kind == 'depth':
+            return None
+        summary = "No searches were done" if not self._num_searches else (
+            f"Effective depth: {self._total_depth / self._num_searches:.1f} on average "
+            f"(from {self._min_depth} to {self._max_depth}) over {self._num_searches} searches"
+        )
+        if self._scheduler is not None:
+            summary += (f", {self._scheduler.seconds_used() / 60:.1f} of the {self._scheduler.seconds() / 60:.1f} "
+                        f"minute budget used (last movetime {self._scheduler.movetime_ms()} ms)")
+        return summary
+
+def parse_duration(duration: str) -> float:
+    """Returns the seconds in a duration such as '2h', '90m', '45s', or '3600'."""
+    units = {'h': 3600, 'm': 60, 's': 1}
+    if duration[-1:].lower() in units:
+        return float(duration[:-1]) * units[duration[-1].lower()]
+    return float(duration)
+
+def profile_from_options(analysis: Optional[str], budget: Optional[str]) -> AnalysisProfile:
+    """Returns the profile for the `--analysis=depth|nodes:N|movetime:MS` and `--budget=DURATION` options."""
+    if budget is not None:
+        assert analysis is None, "--budget sets the search times itself, so it can't be used with --analysis."
+        return AnalysisProfile('budget', scheduler=BudgetScheduler(parse_duration(budget)))
+    kind, _, value = (analysis or 'depth').lower().partition(':')
+    if kind == 'nodes':
+        return AnalysisProfile('nodes', nodes=int(value))
+    if kind == 'movetime':
+        return AnalysisProfile('movetime', movetime_ms=int(value))
+    assert kind == 'depth' and not value, f"Unknown analysis profile: {analysis}"
+    return AnalysisProfile()
@@ -0,0 +1,128 @@
+"""Calibrates the engine settings for this machine, by timing real searches of positions sampled from the
+user's databases with each combination of how many engines run at once, Threads per engine and Hash.
+The fastest settings are saved to engine.PROFILE_FILE, which later searches load automatically."""
+
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+import json
+import os
+import queue
+import random
+import time
+
+import chess.pgn
+
+import engine
+from models import Stockfish
+import pgn_index
+
+DEFAULT_NUM_POSITIONS = 40
+SEARCH_DEPTH = 15
+"""The deepest depth the bound checks search to (for all but the last check for an underpromotion)."""
+BENCH_DEPTH = 10
+HASH_SIZES_MB = (16, 64, 256, engine.MAX_HASH_MB)
+MIN_MOVE_TO_SAMPLE = 10
+"""Positions are sampled from after this move of a game, since the opening would all be book moves."""
+
+@dataclass
+class Measurement:
+    num_engines: int
+    threads: int
+    hash_mb: int
+    nodes_per_second: int
+    """Of all the engines together, as measured by their `bench` commands running at once."""
+    positions_per_second: float
+    """Of all the engines together, for searching the sampled positions to SEARCH_DEPTH."""
+
+def sample_fens(pgn_paths: list[str], num_positions: int, seed: int = 0) -> list[str]:
+    """Returns the fens of up to `num_positions` positions, each from a different randomly chosen game."""
+    rng = random.Random(seed)
+    games = [(path, offset) for path in pgn_paths for offset in pgn_index.game_offsets(path)]
+    fens: list[str] = []
+    for path, offset in rng.sample(games, len(games)):
+        if len(fens) == num_positions:
+            break
+        with open(path, "r", errors="replace", encoding="utf-8-sig") as pgn:
+            pgn.seek(offset)
+            game = chess.pgn.read_game(pgn)
+        if game is None:
+            continue
+        board = game.board()
+        positions = []
+        for move in game.mainline_moves():
+            board.push(move)
+            if board.fullmove_number > MIN_MOVE_TO_SAMPLE and not board.is_game_over():
+                positions.append(board.fen())
+        if positions:
+            fens.append(rng.choice(positions))
+    return fens
+
+def candidates(num_cpus: int) -> list[tuple[int, int, int]]:
+    """Returns each (number of engines, Threads per engine, Hash per engine) to try, where the engines
+       together use no more threads than there are cpus, and no more Hash than engine.hash_size_mb allows."""
+    powers_of_2 = [1 << i for i in range(num_cpus.bit_length()) if 1 << i <= num_cpus]
+    return [
+        (num_engines, threads, hash_mb)
+        for num_engines in powers_of_2
+        for threads in powers_of_2 if num_engines * threads <= num_cpus
+        for hash_mb in HASH_SIZES_MB if hash_mb <= engine.hash_size_mb(num_engines)
+    ]
+
+def measure(fens: list[str], num_engines: int, threads: int, hash_mb: int) -> Measurement:
+    engines = [Stockfish(depth=SEARCH_DEPTH, parameters={"Threads": threads, "Hash": hash_mb})
+               for _ in range(num_engines)]
+    bench_params = Stockfish.BenchmarkParameters(ttSize=hash_mb, threads=threads, limit=BENCH_DEPTH)
+    with ThreadPoolExecutor(max_workers=num_engines) as executor:
+        nodes_per_second = sum(
+            int(line.split(":")[1]) for line in executor.map(lambda x: x.benchmark(bench_params), engines)
+        )
+        remaining_fens: queue.SimpleQueue[str] = queue.SimpleQueue()
+        for fen in fens:
+            remaining_fens.put(fen)
+
+        def search_remaining_fens(stockfish: Stockfish) -> None:
+            while True:
+                try:
+                    fen = remaining_fens.get_nowait()
+                except queue.Empty:
+                    return
+                stockfish.set_fen_position(fen)
+                stockfish.get_top_moves(2)
+
+        start = time.perf_counter()
+        list(executor.map(search_remaining_fens, engines))
+        seconds = time.perf_counter() - start
+    for stockfish in engines:
+        stockfish.send_quit_command()
+    return Measurement(num_engines, threads, hash_mb, nodes_per_second, len(fens) / seconds)
+
+def best_settings(measurements: list[Measurement]) -> dict:
+    """Returns the profile for the measurements: the fastest Threads and Hash for each number of engines,
+       and the fastest number of engines overall (as 'jobs')."""
+    fastest: dict[int, Measurement] = {}
+    for m in measurements:
+        if m.num_engines not in fastest or m.positions_per_second > fastest[m.num_engines].positions_per_second:
+            fastest[m.num_engines] = m
+    return {
+        "jobs": max(fastest.values(), key=lambda m: m.positions_per_second).num_engines,
+        "engines": {str(n): {"Threads": m.threads, "Hash": m.hash_mb} for n, m in sorted(fastest.items())},
+        "measurements": [asdict(m) for m in measurements],
+    }
+
+def calibrate(pgn_paths: list[str], num_positions: int) -> None:
+    fens = sample_fens(pgn_paths, num_positions)
+    assert fens, "There are no positions to calibrate with in these databases."
+    print(f"Searching {len(fens)} positions to depth {SEARCH_DEPTH} with each setting:\n")
+    print("engines  threads  hash (MB)  nodes/s (bench)  positions/s")
+    measurements: list[Measurement] = []
+    for num_engines, threads, hash_mb in candidates(os.cpu_count() or 1):
+        measurements.append(m := measure(fens, num_engines, threads, hash_mb))
+        print(f"{m.num_engines:7}  {m.threads:7}  {m.hash_mb:9}  {m.nodes_per_second:15}  {m.positions_per_second:11.2f}")
+    profile = best_settings(measurements)
+    os.makedirs(os.path.dirname(engine.PROFILE_FILE), exist_ok=True)
+    with open(temp_path := f"{engine.PROFILE_FILE}.tmp", "w") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(temp_path, engine.PROFILE_FILE)
+    print(f"\nSaved to {engine.PROFILE_FILE}: --jobs={profile['jobs']} by default, and for each number of "
+          f"engines running at once: {profile['engines']}")
@@ -0,0 +1,82 @@
+"""Measures the games/s and positions/s of each feature, on a synthetic database with the fake engine.
+
+Run with `python benchmarks/bench_features.py [num_games] [latency_ms] [mean_plies] [annotation_density]`.
+Each feature runs main.py in a fresh temporary directory, with benchmarks/fake_uci_engine.py as the
+'stockfish' on the PATH (taking latency_ms per search), and its speed is read from the profiling data
+(`--profile`) it writes. Since the fake engine's searches take no real time besides the latency, this
+measures the overhead of the driver and the engine wrapper themselves.
+"""
+
+from __future__ import annotations
+import glob
+import json
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from synthetic_pgn import write_corpus # pylint: disable=wrong-import-position
+
+FEATURES = {
+    # The feature's cli args, and the answers to its prompts (after the first two, for the game to start
+    # after and the move to start at, and the prompt for the databases).
+    'name': (['name', 'db', 'Carlsen'], []),
+    'endgame': (['endgame'], ['', 'R', '']),
+    'top moves': (['top moves'], ['-1', '1', '', '']),
+    'skip move': (['skip move'], ['-1', '1', '-1', '1']),
+    'underpromotion': (['underpromotion'], []),
+}
+MOVE_TO_BEGIN_AT = 20
+
+def write_fake_stockfish(bin_dir: str) -> None:
+    """Writes a 'stockfish' executable running the fake engine, for main.py to find on the PATH."""
+    path = os.path.join(bin_dir, 'stockfish')
+    with open(path, 'w') as f:
+        f.write(f"#!{sys.executable}\nimport runpy\n"
+                f"runpy.run_path({os.path.join(BENCHMARKS_DIR, 'fake_uci_engine.py')!r}, run_name='__main__')\n")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+def run_feature(feature: str, work_dir: str, env: dict) -> dict:
+    """Returns the profiling data of a search of the database with the feature."""
+    cli_args, answers = FEATURES[feature]
+    if feature != 'name':
+        answers = ['', str(MOVE_TO_BEGIN_AT), 'db'] + answers
+    subprocess.run([sys.executable, os.path.join(REPO_DIR, 'main.py'), *cli_args, '--profile=3600',
+                    '--checkpoint-interval=0', '--jobs=1'],
+                   cwd=work_dir, env=env, input='\n'.join(answers) + '\n', text=True, check=True,
+                   stdout=subprocess.DEVNULL)
+    profile_paths = glob.glob(os.path.join(work_dir, 'results', '*-profile.json'))
+    assert len(profile_paths) == 1
+    with open(profile_paths[0]) as f:
+        data = json.load(f)
+    for path in glob.glob(os.path.join(work_dir, 'results', '*')):
+        os.remove(path)
+    return data
+
+def main(num_games: int, latency_ms: float, mean_plies: int, annotation_density: float) -> None:
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.makedirs(bin_dir := os.path.join(work_dir, 'bin'))
+        write_fake_stockfish(bin_dir)
+        write_corpus(os.path.join(work_dir, 'db.pgn'), num_games, mean_plies, annotation_density)
+        env = {**os.environ, 'PATH': bin_dir + os.pathsep + os.environ.get('PATH', ''),
+               'FAKE_UCI_LATENCY_MS': str(latency_ms)}
+        print(f"{num_games} games of {mean_plies} plies on average, annotation density {annotation_density}, "
+              f"{latency_ms} ms per engine search:\n")
+        print(f"{'feature':16}{'games/s':>10}{'positions/s':>13}{'searches':>10}{'seconds':>9}  slowest stages")
+        for feature in FEATURES:
+            data = run_feature(feature, work_dir, env)
+            seconds = data["elapsed_seconds"]
+            stages = sorted(data["stages"].items(), key=lambda x: -x[1]["seconds"])[:3]
+            print(f"{feature:16}{num_games / seconds:10.1f}{data['counters'].get('positions', 0) / seconds:13.1f}"
+                  f"{data['stages'].get('engine_search', {}).get('calls', 0):10}{seconds:9.2f}  " +
+                  ", ".join(f"{name} {t['seconds'] / seconds:.0%}" for name, t in stages))
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 200, float(args[1]) if len(args) > 1 else 0.0,
+         int(args[2]) if len(args) > 2 else 80, float(args[3]) if len(args) > 3 else 0.1)
@@ -0,0 +1,41 @@
+"""Measures how long the program takes to start up, and to do a quick 'name' lookup.
+
+Run with `python benchmarks/bench_startup.py [num_runs]`. Each measurement is a fresh interpreter,
+and the median wall time over the runs is reported.
+"""
+
+from __future__ import annotations
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def median_ms(cmd: list[str], cwd: str, num_runs: int) -> float:
+    times = []
+    for _ in range(num_runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+def main(num_runs: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir, 'db.pgn'), 'w') as f:
+            for i in range(200):
+                f.write(f'[Event "Event {i}"]\n[White "White {i}"]\n[Black "Black {i}"]\n[Result "*"]\n\n'
+                        f'1. e4 e5 2. Nf3 Nc6 *\n\n')
+        baseline = median_ms([sys.executable, '-c', 'pass'], tmp_dir, num_runs)
+        imports = median_ms([sys.executable, '-c', f'import sys; sys.path.insert(0, {REPO_DIR!r}); import main'],
+                            tmp_dir, num_runs)
+        lookup = median_ms([sys.executable, os.path.join(REPO_DIR, 'name.py'), 'db.pgn', 'White 7'],
+                           tmp_dir, num_runs)
+    print(f"Interpreter startup:               {baseline:7.1f} ms")
+    print(f"Importing main (beyond startup):   {imports - baseline:7.1f} ms")
+    print(f"'name' lookup in 200 games, total: {lookup:7.1f} ms")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
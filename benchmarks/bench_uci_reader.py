@@ -0,0 +1,102 @@
+"""Measures the Python overhead of reading a search's output in get_top_moves.
+
+Run with `python benchmarks/bench_uci_reader.py [num_searches] [multipv] [depth]`. A child process
+prints the output of `num_searches` searches (an info line for every multipv at every depth, like
+Stockfish does, then a bestmove line), which is read once the way models.Stockfish used to (a text
+pipe, polling the process and splitting every line) and once with its current reader.
+"""
+
+from __future__ import annotations
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from models import Stockfish # pylint: disable=wrong-import-position
+
+def search_output(multipv: int, depth: int) -> bytes:
+    lines = []
+    for d in range(1, depth + 1):
+        for i in range(1, multipv + 1):
+            lines.append(f"info depth {d} seldepth {d + 4} multipv {i} score cp {30 - i} wdl 450 500 50 "
+                         f"nodes {d * 9000} nps 900000 hashfull {d} tbhits 0 time {d * 10} "
+                         f"pv e2e4 e7e5 g1f3 b8c6 f1b5 a7a6")
+    lines.append("bestmove e2e4 ponder e7e5")
+    return ("\n".join(lines) + "\n").encode()
+
+def child(blob_path: str, num_searches: int, text_mode: bool) -> subprocess.Popen:
+    code = f"import sys; sys.stdout.buffer.write(open({blob_path!r}, 'rb').read() * {num_searches})"
+    if text_mode:
+        return subprocess.Popen([sys.executable, '-c', code], universal_newlines=True, stdout=subprocess.PIPE)
+    return subprocess.Popen([sys.executable, '-c', code], bufsize=Stockfish._PIPE_BUFFER_SIZE,
+                            stdout=subprocess.PIPE)
+
+def old_reader(process: subprocess.Popen, depth: int) -> list[dict]:
+    """The reading and parsing get_top_moves did before, for a depth search."""
+    def pick(line: list[str], value: str, index: int = 1) -> str:
+        return line[line.index(value) + index]
+    lines = []
+    while True:
+        process.poll()
+        lines.append(process.stdout.readline().strip())
+        if lines[-1].startswith("bestmove"):
+            break
+    top_moves = []
+    for line in reversed([x.split(" ") for x in lines]):
+        if line[0] == "bestmove":
+            continue
+        if "multipv" not in line or "depth" not in line or int(pick(line, "depth")) != depth:
+            break
+        top_moves.insert(0, {
+            "Move": pick(line, "pv"),
+            "Centipawn": int(pick(line, "cp")) if "cp" in line else None,
+            "Mate": int(pick(line, "mate")) if "mate" in line else None,
+            "WDL": " ".join([pick(line, "wdl", 1), pick(line, "wdl", 2), pick(line, "wdl", 3)]),
+        })
+    return top_moves
+
+def new_reader(stockfish: Stockfish) -> list[dict]:
+    final_lines = stockfish._read_final_multipv_lines(0)
+    return [{
+        "Move": fields[b"pv"].decode(),
+        "Centipawn": int(fields[b"cp"]) if b"cp" in fields else None,
+        "Mate": int(fields[b"mate"]) if b"mate" in fields else None,
+        "WDL": " ".join(x.decode() for x in fields[b"wdl"]),
+    } for _, fields in sorted(final_lines.items())]
+
+def main(num_searches: int, multipv: int, depth: int) -> None:
+    blob = search_output(multipv, depth)
+    with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as f:
+        f.write(blob)
+
+    process = child(f.name, num_searches, True)
+    start = time.perf_counter()
+    old_results = [old_reader(process, depth) for _ in range(num_searches)]
+    old_seconds = time.perf_counter() - start
+    process.wait()
+
+    stockfish = Stockfish.__new__(Stockfish)
+    stockfish._stockfish = child(f.name, num_searches, False)
+    stockfish._debug_view = False
+    stockfish._depth = depth
+    start = time.perf_counter()
+    new_results = [new_reader(stockfish) for _ in range(num_searches)]
+    new_seconds = time.perf_counter() - start
+    stockfish._stockfish.wait()
+    stockfish._has_quit_command_been_sent = True
+    os.remove(f.name)
+
+    assert old_results == new_results
+    lines_per_search = blob.count(b"\n")
+    print(f"{num_searches} searches, {lines_per_search} lines each (multipv {multipv}, depth {depth}):")
+    print(f"Old reader: {old_seconds / num_searches * 1e3:8.3f} ms per search")
+    print(f"New reader: {new_seconds / num_searches * 1e3:8.3f} ms per search "
+          f"({old_seconds / new_seconds:.1f}x faster)")
+
+if __name__ == '__main__':
+    args = [int(x) for x in sys.argv[1:]]
+    main(*(args + [200, 50, 25][len(args):]))
@@ -0,0 +1,118 @@
+"""A fake UCI engine for benchmarking the driver without Stockfish: it answers the commands models.Stockfish
+sends with canned output, so the time a search takes is just the Python overhead plus a set latency.
+
+A move's eval is the material after it plus a fixed pseudo-random amount (the same for the same position
+and move every time), and a search prints an info line for each multipv at every depth, like Stockfish.
+Set by environment variables:
+    FAKE_UCI_LATENCY_MS   milliseconds each `go` takes before answering (default 0)
+    FAKE_UCI_LOG          a file to append each command received to
+"""
+
+from __future__ import annotations
+import os
+import sys
+import time
+import zlib
+
+import chess
+
+PIECE_VALUES = {chess.PAWN: 100, chess.KNIGHT: 300, chess.BISHOP: 320, chess.ROOK: 500, chess.QUEEN: 900,
+                chess.KING: 0}
+OPTIONS = ("Threads", "Hash", "MultiPV", "UCI_ShowWDL", "Skill Level", "UCI_Elo", "UCI_LimitStrength")
+DEFAULT_DEPTH = 10
+
+def material(board: chess.Board, color: chess.Color) -> int:
+    return sum(PIECE_VALUES[p.piece_type] * (1 if p.color == color else -1) for p in board.piece_map().values())
+
+def score_move(board: chess.Board, move: chess.Move) -> tuple[str, int]:
+    """Returns the eval of the move for the player making it, as ('cp', centipawns) or ('mate', 1)."""
+    mover = board.turn
+    board.push(move)
+    try:
+        if board.is_checkmate():
+            return "mate", 1
+        return "cp", material(board, mover) + zlib.crc32(f"{board.fen()} {move.uci()}".encode()) % 41 - 20
+    finally:
+        board.pop()
+
+def board_lines(board: chess.Board) -> list[str]:
+    """The output of the `d` command."""
+    lines = [""]
+    for rank in range(7, -1, -1):
+        lines.append(" +---+---+---+---+---+---+---+---+")
+        squares = (board.piece_at(chess.square(file, rank)) for file in range(8))
+        lines.append(" | " + " | ".join(p.symbol() if p else " " for p in squares) + f" | {rank + 1}")
+    lines += [" +---+---+---+---+---+---+---+---+", "   a   b   c   d   e   f   g   h", "",
+              f"Fen: {board.fen()}", "Key: 0000000000000000", "Checkers: "]
+    return lines
+
+def search_lines(board: chess.Board, words: list[str], multipv: int) -> list[str]:
+    """The output of a `go` command."""
+    depth = DEFAULT_DEPTH
+    if "depth" in words:
+        depth = int(words[words.index("depth") + 1])
+    if "movetime" in words:
+        movetime = int(words[words.index("movetime") + 1])
+        time.sleep(movetime / 1000)
+        depth = 4 + movetime.bit_length() # Deeper the longer it gets, like a real search.
+    searchmoves = words[words.index("searchmoves") + 1:] if "searchmoves" in words else None
+    moves = [m for m in board.legal_moves if searchmoves is None or m.uci() in searchmoves]
+    if not moves:
+        return ["info depth 0 score " + ("mate 0" if board.is_checkmate() else "cp 0"), "bestmove (none)"]
+    scored = sorted(((score_move(board, m), m) for m in moves), key=lambda x: (x[0][0] != "mate", -x[0][1]))
+    lines = [
+        f"info depth {d} seldepth {d + 2} multipv {i} score {kind} {value} wdl 500 400 100 nodes {d * 1000} "
+        f"nps 1000000 hashfull 0 tbhits 0 time {d} pv {move.uci()}"
+        for d in range(1, depth + 1)
+        for i, ((kind, value), move) in enumerate(scored[:multipv], 1)
+    ]
+    return lines + [f"bestmove {scored[0][1].uci()}"]
+
+def main() -> None:
+    latency = float(os.environ.get("FAKE_UCI_LATENCY_MS", "0")) / 1000
+    log_path = os.environ.get("FAKE_UCI_LOG")
+    board = chess.Board()
+    multipv = 1
+    for command in map(str.strip, sys.stdin):
+        if log_path:
+            with open(log_path, "a") as log:
+                log.write(command + "\n")
+        words = command.split()
+        lines: list[str] = []
+        if not words:
+            continue
+        if words[0] == "uci":
+            lines = ["id name Stockfish 16 (fake)", "id author benchmarks"]
+            lines += [f"option name {name} type spin default 1 min 1 max 1024" for name in OPTIONS]
+            lines.append("uciok")
+        elif words[0] == "isready":
+            lines = ["readyok"]
+        elif words[0] == "setoption" and command.split(" name ", 1)[1].startswith("MultiPV value "):
+            multipv = int(command.rsplit(" ", 1)[1])
+        elif words[0] == "ucinewgame":
+            board = chess.Board()
+        elif words[0] == "position":
+            board = chess.Board() if words[1] == "startpos" else chess.Board(" ".join(words[2:8]))
+            moves = words[words.index("moves") + 1:] if "moves" in words else []
+            for move in moves:
+                board.push_uci(move)
+        elif words[0] == "flip":
+            board = board.mirror()
+        elif words[0] == "d":
+            lines = board_lines(board)
+        elif words[0] == "eval":
+            lines = (["Final evaluation: none (in check)"] if board.is_check() else
+                     [f"Final evaluation       {material(board, chess.WHITE) / 100:+.2f} (white side)", ""])
+        elif words[0] == "go":
+            time.sleep(latency)
+            lines = search_lines(board, words, multipv)
+        elif words[0] == "bench":
+            lines = ["Total time (ms) : 1000", "Nodes searched  : 1000000", "Nodes/second    : 1000000"]
+        elif words[0] == "quit":
+            break
+        if lines:
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Writes a synthetic pgn database, the same for the same arguments, for benchmarking without real databases.
+
+Run with `python benchmarks/synthetic_pgn.py path [num_games] [mean_plies] [annotation_density] [seed]`.
+The games are random legal games (preferring captures and promotions, so that there are endgames and
+underpromotions to find) of mean_plies half-moves on average, and annotation_density is the chance of a
+move having a comment and a NAG (and a quarter of it, of the move having a side variation).
+"""
+
+from __future__ import annotations
+import random
+import sys
+
+import chess
+import chess.pgn
+
+PLAYERS = ("Carlsen", "Nakamura", "Caruana", "Ding", "Firouzja", "Giri", "So", "Aronian", "Nepomniachtchi",
+           "Rapport", "Duda", "Vachier-Lagrave", "Mamedyarov", "Anand", "Gukesh", "Praggnanandhaa")
+OPENINGS = ("Sicilian Defense", "Ruy Lopez", "Queen's Gambit Declined", "King's Indian Defense",
+            "French Defense", "Caro-Kann Defense", "English Opening", "Nimzo-Indian Defense")
+COMMENTS = ("A natural move.", "Better was to keep the tension.", "The only move.", "[%clk 0:03:12]",
+            "[%eval 0.34] [%clk 0:01:02]", "White is slightly better here, with more space on the kingside.")
+
+def random_move(rng: random.Random, board: chess.Board) -> chess.Move:
+    moves = list(board.legal_moves)
+    promotions = [m for m in moves if m.promotion]
+    if promotions and rng.random() < 0.8:
+        return rng.choice(promotions)
+    captures = [m for m in moves if board.is_capture(m)]
+    return rng.choice(captures if captures and rng.random() < 0.5 else moves)
+
+def random_game(rng: random.Random, index: int, mean_plies: int, annotation_density: float) -> chess.pgn.Game:
+    game = chess.pgn.Game()
+    white, black = rng.sample(PLAYERS, 2)
+    game.headers.update({
+        "Event": f"Synthetic Open {index // 100 + 1}", "Site": f"https://lichess.org/{index:08d}",
+        "Date": f"{2000 + index % 25}.{index % 12 + 1:02d}.{index % 28 + 1:02d}", "Round": str(index % 9 + 1),
+        "White": white, "Black": black, "Opening": rng.choice(OPENINGS),
+    })
+    node: chess.pgn.GameNode = game
+    board = game.board()
+    for _ in range(rng.randint(mean_plies // 2, mean_plies * 3 // 2)):
+        if board.is_game_over():
+            break
+        move = random_move(rng, board)
+        child = node.add_main_variation(move)
+        if rng.random() < annotation_density / 4 and board.legal_moves.count() > 1:
+            node.add_variation(rng.choice([m for m in board.legal_moves if m != move]))
+        node = child
+        board.push(move)
+        if rng.random() < annotation_density:
+            node.comment = rng.choice(COMMENTS)
+            node.nags.add(rng.choice((1, 2, 3, 4, 5, 6)))
+    game.headers["Result"] = board.result()
+    return game
+
+def write_corpus(path: str, num_games: int, mean_plies: int = 80, annotation_density: float = 0.1,
+                 seed: int = 0) -> None:
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(num_games):
+            print(random_game(rng, i, mean_plies, annotation_density), file=f, end="\n\n")
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    write_corpus(args[0], *(int(x) for x in args[1:3]), *(float(x) for x in args[3:4]), *(int(x) for x in args[4:5]))
@@ -0,0 +1,64 @@
+"""Periodic checkpoints of a search, so that a long run can be resumed exactly where it left off."""
+
+from __future__ import annotations
+from copy import deepcopy
+from dataclasses import dataclass
+import os
+import pickle
+from typing import Callable, Optional
+
+from analysis import AnalysisCache
+from output_obj import Output
+from Specs import Specs
+
+CHECKPOINTS_FOLDER = 'checkpoints'
+
+@dataclass
+class Checkpoint:
+    specs: Specs
+    """Set to continue at the first game that hadn't been searched yet, in the very file that was being
+       read (so for a lichess study, the cached copy of it rather than a fresh download)."""
+    process_args: tuple
+    output_data: Output
+    cache: Optional[AnalysisCache] = None
+    """The results of the positions analysed most recently, so that a resumed search doesn't analyse them again."""
+
+def path_for(specs: Specs) -> str:
+    return os.path.join(CHECKPOINTS_FOLDER, f"{specs.filename_of_output()}.checkpoint")
+
+def save(specs: Specs, process_args: tuple, pgn_path: str, offset: int, output_data: Output,
+         cache: Optional[AnalysisCache] = None) -> None:
+    """Saves a checkpoint for a search that has gotten up to byte `offset` of the file at `pgn_path`,
+       with all the games before that offset reflected in `output_data`."""
+    resume_specs = deepcopy(specs)
+    resume_specs.set_pgn(pgn_path)
+    resume_specs.set_game_range(offset, specs.max_games())
+    resume_specs.stop_skipping_games()
+    output_data.record_spill_sizes()
+    os.makedirs(CHECKPOINTS_FOLDER, exist_ok=True)
+    with open(temp_path := f"{path_for(specs)}.tmp", 'wb') as f:
+        pickle.dump(Checkpoint(resume_specs, process_args, output_data, cache), f)
+    os.replace(temp_path, path_for(specs))
+    # Replacing the old checkpoint in one step, so that a crash while saving can't corrupt it.
+
+def remove(specs: Specs) -> None:
+    """Called once the search is done, since there's nothing left to resume."""
+    if os.path.isfile(path := path_for(specs)):
+        os.remove(path)
+
+def load(path: str) -> Checkpoint:
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def resume(path: Optional[str], process_pgn: Callable[..., None]) -> None:
+    """Resumes the search saved in the checkpoint at `path`, or every saved search if `path` is None."""
+    paths = [path] if path else sorted(
+        os.path.join(CHECKPOINTS_FOLDER, x) for x in os.listdir(CHECKPOINTS_FOLDER) if x.endswith('.checkpoint')
+    ) if os.path.isdir(CHECKPOINTS_FOLDER) else []
+    for checkpoint_path in paths:
+        checkpoint = load(checkpoint_path)
+        checkpoint.output_data.rewind_spill_files()
+        print(f"Resuming the search of {checkpoint.specs.pgn()} after game {checkpoint.output_data.num_games()}:\n\n")
+        process_pgn(checkpoint.specs, *checkpoint.process_args, output_data=checkpoint.output_data,
+                    cache=checkpoint.cache)
+        print("****===================================****\n\n")
@@ -0,0 +1,130 @@
+"""Skipping games already seen in another source (or earlier in the same one): overlapping databases like
+TWIC dumps, lichess exports and curated collections often have the same games. Each game is identified by a
+hash of its players' surnames, its year and its mainline moves, all read from its raw text (so before it's
+parsed or replayed), and the hashes are kept in an sqlite database that the sources searched at once share,
+and that can be kept for later searches too."""
+
+from __future__ import annotations
+from dataclasses import dataclass
+import hashlib
+import os
+import re
+import sqlite3
+from typing import Optional, TextIO
+
+HEADER = re.compile(r'\[([A-Za-z0-9_+#=:-]+)\s+"(.*)"\s*\]')
+MOVETEXT_TOKEN = re.compile(r"\{[^}]*\}?|;[^\n]*|[()]|[^\s(){};]+")
+MOVE_NUMBER = re.compile(r"^\d+\.+")
+CASTLING_WITH_ZEROS = re.compile(r"^0-0(-0)?$")
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+@dataclass
+class GameText:
+    headers: dict[str, str]
+    movetext: str
+    text: str
+    """All the lines read for the game, for chess.pgn.read_game to parse if it's searched."""
+
+def read_game_text(pgn: TextIO) -> Optional[GameText]:
+    """Reads the next game's headers and movetext, consuming the same lines chess.pgn.read_game would (so that
+       `pgn` is left at the start of the next game), but without parsing the moves. Returns None if there's no
+       game left."""
+    lines: list[str] = []
+
+    def readline() -> str:
+        lines.append(line := pgn.readline())
+        return line
+
+    line = readline().lstrip("\ufeff")
+    while line.isspace() or line.startswith("%") or line.startswith(";"):
+        line = readline()
+    if not line:
+        return None
+    headers: dict[str, str] = {}
+    consecutive_empty_lines = 0
+    while line:
+        if line.startswith("%") or line.startswith(";"):
+            line = readline()
+            continue
+        if consecutive_empty_lines < 1 and line.isspace():
+            consecutive_empty_lines += 1
+            line = readline()
+            continue
+        if not line.startswith("["):
+            break
+        consecutive_empty_lines = 0
+        if (tag := HEADER.match(line)) is not None:
+            headers[tag.group(1)] = tag.group(2)
+        line = readline()
+    movetext_lines: list[str] = []
+    in_comment = False
+    while line and (in_comment or not line.isspace()):
+        if not in_comment and (line.startswith("%") or line.startswith(";")):
+            line = readline()
+            continue
+        movetext_lines.append(line)
+        for token in re.findall(r"[{}]", line):
+            in_comment = token == "{"
+        line = readline()
+    return GameText(headers, "".join(movetext_lines), "".join(lines).lstrip("\ufeff"))
+
+def surname(name: str) -> str:
+    """E.g., 'carlsen' for each of 'Carlsen, Magnus', 'Carlsen,M.' and 'Magnus Carlsen'."""
+    name = name.split(",")[0] if "," in name else (name.split() or [""])[-1]
+    return "".join(c for c in name.lower() if c.isalnum())
+
+def mainline_moves(movetext: str) -> list[str]:
+    """Returns the mainline's moves in SAN, without the likes of annotations, checks and move numbers."""
+    moves: list[str] = []
+    depth = 0
+    for token in MOVETEXT_TOKEN.findall(movetext):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth = max(0, depth - 1)
+        elif depth == 0 and not token.startswith(("{", ";", "$")) and token not in RESULTS:
+            if move := MOVE_NUMBER.sub("", token).rstrip("!?+#"):
+                moves.append(move.replace("0", "O") if CASTLING_WITH_ZEROS.match(move) else move)
+    return moves
+
+def game_key(game: GameText) -> bytes:
+    headers = game.headers
+    fields = [surname(headers.get("White", "")), surname(headers.get("Black", "")),
+              headers.get("Date", "")[:4].strip("?"), headers.get("FEN", "")] + mainline_moves(game.movetext)
+    return hashlib.blake2b(" ".join(fields).encode(), digest_size=16).digest()
+
+class GameSet:
+    """The games seen so far, each with the source and offset it was first seen at."""
+
+    def __init__(self, path: str) -> None:
+        if folder := os.path.dirname(path):
+            os.makedirs(folder, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        # Committing each game as it's added, so that sources searched at once see each other's games.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS games "
+                         "(key BLOB PRIMARY KEY, source TEXT NOT NULL, offset INTEGER NOT NULL) WITHOUT ROWID")
+        self._num_games = self._num_duplicates = 0
+
+    def is_duplicate(self, key: bytes, source: str, offset: int) -> bool:
+        """Returns whether the game was first seen somewhere else, adding it to the set if it's new. A game seen
+           at the very same source and offset before isn't a duplicate (e.g., when resuming a search)."""
+        self._num_games += 1
+        if self._db.execute("INSERT OR IGNORE INTO games VALUES (?, ?, ?)", (key, source, offset)).rowcount:
+            return False
+        first_seen = self._db.execute("SELECT source, offset FROM games WHERE key = ?", (key,)).fetchone()
+        if is_duplicate := tuple(first_seen) != (source, offset):
+            self._num_duplicates += 1
+        return is_duplicate
+
+    def close(self) -> None:
+        self._db.close()
+
+    def report(self) -> str:
+        return f"Dedup: skipped {self._num_duplicates} of {self._num_games} games as duplicates of games seen before"
+
+def remove_game_set(path: str) -> None:
+    for file_path in (path, f"{path}-wal", f"{path}-shm"):
+        if os.path.exists(file_path):
+            os.remove(file_path)
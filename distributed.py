@@ -0,0 +1,234 @@
+"""Coordinator/worker mode, for spreading a scan of large databases over several processes or machines.
+
+The coordinator splits each pgn database into shards of games, and hands them out to the workers that
+connect to it. Each worker runs `process_pgn` on a shard and streams its hits back. A shard whose worker
+disconnects (or goes quiet for too long) is handed out again, and once every shard is done the hits are
+merged in the order of the shards, so the results files don't depend on which worker did what.
+"""
+
+from __future__ import annotations
+from collections import deque
+from copy import deepcopy
+from dataclasses import dataclass, field
+from multiprocessing.connection import Client, Connection, Listener
+from multiprocessing import AuthenticationError
+import threading
+from typing import TYPE_CHECKING, Callable, Optional
+
+from engine import LazyEngine
+from output_obj import Output, console_lock
+from Specs import Specs
+import pgn_index
+
+if TYPE_CHECKING:
+    from analysis import AnalysisResult
+
+WORKER_TIMEOUT = 120.0
+"""Seconds a worker can go without sending anything before its shard is given to another worker."""
+HEARTBEAT_INTERVAL = 10.0
+"""Seconds between the messages a worker sends (from a thread of its own, so even during a long search) to
+   show it's still alive while working on a shard."""
+DEFAULT_AUTHKEY = 'position-finder'
+
+def authkey(cli_option: Optional[str]) -> bytes:
+    return (cli_option or DEFAULT_AUTHKEY).encode()
+
+def parse_address(address: str) -> tuple[str, int]:
+    """Parses 'host:port' (or just 'port', for localhost)."""
+    host, _, port = address.rpartition(':')
+    return (host or 'localhost', int(port))
+
+@dataclass(frozen=True)
+class Shard:
+    index: int
+    source_index: int
+    start_offset: int
+    num_games: Optional[int]
+    """None if the shard goes to the end of the source (e.g., for a lichess study)."""
+
+@dataclass
+class _ShardResult:
+    hits: list[tuple[str, bool, bool, Optional[list[AnalysisResult]]]] = field(default_factory=list)
+    num_games: int = 0
+
+class _ShardOutput(Output):
+    """Used by a worker: rather than printing hits and writing them to a file, each one is sent
+       to the coordinator."""
+
+    def __init__(self, send: Callable[[tuple], None], shard: Shard) -> None:
+        super().__init__()
+        self._send = send
+        self._shard = shard
+
+    def add_newest_hit(self, newest_hit: str, update_primary_vars: bool = True,
+                       update_secondary_vars: bool = False,
+                       analyses: Optional[list[AnalysisResult]] = None) -> None:
+        super().add_newest_hit(newest_hit, update_primary_vars, update_secondary_vars, analyses)
+        self._send(('hit', self._shard.index, newest_hit, update_primary_vars, update_secondary_vars, analyses))
+
+    def print_and_write_data(self, specs: Specs) -> None:
+        pass
+
+    def shed_memory(self, specs: Specs) -> None:
+        """The hits have all been sent to the coordinator already, so they can just be dropped."""
+        self._output_str = self._secondary_output_str = ''
+        self._analyses = []
+
+def run_worker(address: tuple[str, int], authkey: bytes, process_pgn: Callable[..., None]) -> None:
+    """Connects to the coordinator at `address`, and runs `process_pgn` on the shards it hands out
+       until there are none left."""
+    with Client(address, authkey=authkey) as conn:
+        send_lock = threading.Lock()
+
+        def send(message: tuple) -> None:
+            with send_lock:
+                conn.send(message)
+
+        engine: Optional[LazyEngine] = None
+        # Shared by the shards, so that the engine is started once for the worker rather than for each shard.
+        try:
+            while True:
+                send(('ready',))
+                message = conn.recv()
+                if message[0] == 'done':
+                    return
+                _, shard, specs, process_args = message
+                engine = engine or LazyEngine(num_engines=specs.concurrent_engines())
+                output_data = _ShardOutput(send, shard)
+                stop_heartbeat = threading.Event()
+                heartbeat = threading.Thread(target=_send_heartbeats, args=(send, shard, stop_heartbeat),
+                                             daemon=True)
+                heartbeat.start()
+                try:
+                    process_pgn(specs, *process_args, output_data=output_data, engine=engine)
+                finally:
+                    stop_heartbeat.set()
+                    heartbeat.join()
+                send(('finished', shard.index, output_data.num_games() - 1))
+                # -1 since `process_pgn` calls `prep_for_new_game` once more before finding no game left.
+        finally:
+            if engine is not None:
+                engine.close()
+
+def _send_heartbeats(send: Callable[[tuple], None], shard: Shard, stop: threading.Event) -> None:
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        send(('alive', shard.index))
+
+class _Coordinator:
+    def __init__(self, all_specs: list[Specs], process_args: tuple, games_per_shard: int) -> None:
+        assert all(specs.do_not_skip_any_games() for specs in all_specs)
+        self._all_specs = all_specs
+        self._process_args = process_args
+        self._shards: list[Shard] = []
+        for source_index, specs in enumerate(all_specs):
+            source_shards: list[tuple[int, Optional[int]]] = (
+                list(pgn_index.shards(specs.pgn(), games_per_shard)) if specs.pgn().endswith('.pgn')
+                else [(0, None)] # A lichess study is fetched by the worker, so it can't be split up.
+            )
+            self._shards.extend(Shard(len(self._shards) + i, source_index, start_offset, num_games)
+                                for i, (start_offset, num_games) in enumerate(source_shards))
+        self._pending = deque(self._shards)
+        self._results: dict[int, _ShardResult] = {}
+        self._cond = threading.Condition()
+        self._worker_threads: list[threading.Thread] = []
+
+    def _is_done(self) -> bool:
+        return len(self._results) == len(self._shards)
+
+    def wait_until_done(self) -> None:
+        with self._cond:
+            self._cond.wait_for(self._is_done)
+
+    def _next_shard(self) -> Optional[Shard]:
+        """Returns None once every shard is done. If no shard is pending but some are still being
+           worked on, waits in case one of them has to be handed out again."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or self._is_done())
+            return self._pending.popleft() if self._pending else None
+
+    def _specs_for(self, shard: Shard) -> Specs:
+        specs = deepcopy(self._all_specs[shard.source_index])
+        specs.set_game_range(shard.start_offset, shard.num_games)
+        specs.set_checkpoint_interval(None)
+        specs.set_concurrent_engines(1)
+        return specs
+
+    def accept_workers(self, listener: Listener) -> None:
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError):
+                continue # Not a worker, or it disconnected during the handshake.
+            except OSError:
+                return # The listener has been closed.
+            self._worker_threads.append(thread := threading.Thread(target=self._serve_worker, args=(conn,), daemon=True))
+            thread.start()
+
+    def dismiss_workers(self) -> None:
+        """Gives the threads serving the workers a chance to tell them there are no shards left."""
+        for thread in self._worker_threads:
+            thread.join(timeout=5)
+
+    def _serve_worker(self, conn: Connection) -> None:
+        shard: Optional[Shard] = None
+        result = _ShardResult()
+        try:
+            with conn:
+                while True:
+                    if not conn.poll(WORKER_TIMEOUT):
+                        return
+                    message = conn.recv()
+                    if message[0] == 'ready':
+                        if (shard := self._next_shard()) is None:
+                            conn.send(('done',))
+                            return
+                        result = _ShardResult()
+                        conn.send(('shard', shard, self._specs_for(shard), self._process_args))
+                    elif message[0] == 'hit':
+                        assert shard is not None and message[1] == shard.index
+                        result.hits.append(message[2:])
+                        with console_lock():
+                            print(f"Hit from {self._all_specs[shard.source_index].pgn()}:\n{message[2]}\n\n")
+                    elif message[0] == 'finished':
+                        assert shard is not None and message[1] == shard.index
+                        result.num_games = message[2]
+                        with self._cond:
+                            self._results[shard.index] = result
+                            self._cond.notify_all()
+                        shard = None
+        except (EOFError, OSError):
+            pass # The worker died.
+        finally:
+            if shard is not None:
+                with self._cond:
+                    self._pending.appendleft(shard)
+                    self._cond.notify_all()
+
+    def merged_outputs(self) -> list[Output]:
+        """Returns an Output object for each source, with the hits in the order of the shards."""
+        outputs = [Output() for _ in self._all_specs]
+        for shard in self._shards:
+            output_data, result = outputs[shard.source_index], self._results[shard.index]
+            for hit in result.hits:
+                output_data.add_newest_hit(*hit)
+                output_data.clear_newest_hit()
+            output_data.add_games_parsed(result.num_games)
+        return outputs
+
+def coordinate(all_specs: list[Specs], process_args: tuple, address: tuple[str, int],
+               authkey: bytes, games_per_shard: int) -> list[Output]:
+    """Hands out shards of the sources in `all_specs` to workers connecting to `address`, until all of
+       them are done. Then prints and writes each source's results, and returns the merged Output objects."""
+    coordinator = _Coordinator(all_specs, process_args, games_per_shard)
+    with Listener(address, authkey=authkey) as listener:
+        threading.Thread(target=coordinator.accept_workers, args=(listener,), daemon=True).start()
+        with console_lock():
+            print(f"Waiting for workers on {address[0]}:{address[1]}\n")
+        coordinator.wait_until_done()
+        coordinator.dismiss_workers()
+    outputs = coordinator.merged_outputs()
+    for specs, output_data in zip(all_specs, outputs):
+        print(f"Results for {specs.pgn()}:\n\n")
+        output_data.print_and_write_data(specs)
+        print("****===================================****\n\n")
+    return outputs
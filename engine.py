@@ -0,0 +1,68 @@
+from __future__ import annotations
+from functools import cache
+import json
+import os
+from typing import Optional
+
+from models import Stockfish
+
+PROFILE_FILE = os.path.join('engine-cache', 'profile.json')
+"""The engine settings found to be fastest on this machine by `python3 main.py --calibrate`."""
+MIN_HASH_MB = 16
+MAX_HASH_MB = 512
+"""Stockfish clears its whole hash table for each new game, so a bigger one than this costs more in
+   clearing than it saves in searching (for the positions of a single game)."""
+
+def hash_size_mb(num_engines: int = 1) -> int:
+    """Returns the Hash size (in MB) for each of `num_engines` engines, splitting half of the memory
+       that's currently available between them."""
+    try:
+        available_mb = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') >> 20
+    except (AttributeError, ValueError, OSError):
+        return MIN_HASH_MB
+    per_engine_mb = available_mb // 2 // num_engines
+    if per_engine_mb < MIN_HASH_MB:
+        return MIN_HASH_MB
+    return min(MAX_HASH_MB, 1 << (per_engine_mb.bit_length() - 1))
+    # Rounding down to a power of 2, so the size doesn't change with every little change in free memory.
+
+@cache
+def calibrated_profile() -> dict:
+    try:
+        with open(PROFILE_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def calibrated_jobs() -> Optional[int]:
+    """Returns the number of engines that were fastest to run at once, if the engine has been calibrated."""
+    return calibrated_profile().get('jobs')
+
+def engine_parameters(num_engines: int = 1) -> dict:
+    """Returns the Threads and Hash for each of `num_engines` engines running at once. These come from
+       the calibrated profile (for the most engines it was calibrated with, up to `num_engines`), if
+       there is one."""
+    calibrated = {int(k): v for k, v in calibrated_profile().get('engines', {}).items() if int(k) <= num_engines}
+    if calibrated:
+        return calibrated[max(calibrated)]
+    return {"Threads": 1, "Hash": hash_size_mb(num_engines)}
+
+class LazyEngine:
+    """Holds the Stockfish engine for a search, which is only started the first time it's needed
+       (so e.g. the 'name' feature never starts one)."""
+
+    def __init__(self, path: str = "stockfish", num_engines: int = 1) -> None:
+        self._path = path
+        self._num_engines = num_engines
+        self._stockfish: Optional[Stockfish] = None
+
+    def get(self) -> Stockfish:
+        if self._stockfish is None:
+            self._stockfish = Stockfish(path=self._path, parameters=engine_parameters(self._num_engines))
+        return self._stockfish
+
+    def close(self) -> None:
+        """Quits the engine, if it was started."""
+        if self._stockfish is not None:
+            self._stockfish.send_quit_command()
+            self._stockfish = None
@@ -1,5 +1,6 @@
 from __future__ import annotations
 from typing import Optional
+import io
 import itertools
 from copy import deepcopy
 import time
@@ -7,16 +8,32 @@ import os
 import shlex
 import sys
 from itertools import product
-import requests
-
-import chess.pgn
-from models import Stockfish
-from output_obj import Output
+from typing import TYPE_CHECKING, Callable, Iterable, TextIO
+
+from analysis import AnalysisCache, AnalysisProfile, AnalysisResult, profile_from_options
+from prefilter import Prefilter, prefilter_from_option
+from memory import monitor_from_options
+from sampling import Sample, sample_from_option
+from selection import selection_from_options
+from trajectory import pruner_from_option
+from engine import LazyEngine
+from output_obj import Output, console_lock, set_console_lock
 from Specs import Piece_Quantities, Specs
-import studies
 import Utils
+import checkpoint
+import profiling
 from Args import set_args, args
 
+if TYPE_CHECKING:
+    import chess
+    from models import Stockfish
+    from tablebase import Tablebase
+    from trajectory import TrajectoryPruner
+    from dedup import GameSet
+    from pipeline import PositionWriter
+# The modules for a study, an engine feature, or a cli option are only imported once they're needed,
+# so that the likes of a quick 'name' search start up fast.
+
 PIECE_CHARS: list[str] = ["P", "p", "N", "n", "B", "b", "R", "r", "Q", "q", "K", "k"]
 
 def get_endgame_specs_from_user() -> list[Piece_Quantities]:
@@ -34,34 +51,41 @@ def file_int_to_char(file_int: int) -> str:
     assert 1 <= file_int <= 8
     return chr(ord('a') + file_int - 1)
 
-def is_piece_in_board(stockfish: Stockfish, piece_char: str, row_start: int, row_end: int,
+def is_piece_in_board(board: chess.Board, piece_char: str, row_start: int, row_end: int,
                       col_start: int, col_end: int, num_of_this_piece: Optional[int] = None) -> bool:
     """If the optional num_of_this_piece param is left as None, then the function returns true iff
        at least one of the specified piece char is in the board.
        Otherwise, exactly the specified number of the piece must be present."""
 
+    import chess
     hit_counter = 0
     for row, col in product(range(row_start, row_end+1), range(col_start, col_end+1)):
         square = file_int_to_char(col) + str(row)
-        if ((square_contents := stockfish.get_what_is_on_square(square)) is not None and
-            square_contents.value == piece_char):
+        if ((square_contents := board.piece_at(chess.parse_square(square))) is not None and
+            square_contents.symbol() == piece_char):
             if num_of_this_piece is None:
                 return True
             hit_counter += 1
     return num_of_this_piece is not None and hit_counter == num_of_this_piece
 
-def does_board_meet_piece_reqs(stockfish: Stockfish, pieces: Piece_Quantities) -> bool:
-    """Pre-condition: the stockfish object must be set to the position in question."""
+def does_board_meet_piece_reqs(board: chess.Board, pieces: Piece_Quantities) -> bool:
     init_row, end_row = pieces.start_row(), pieces.end_row()
     init_file, end_file = pieces.start_file(), pieces.end_file()
     should_exclude = pieces.should_exclude()
-    return all(should_exclude != is_piece_in_board(stockfish, requirement[0], init_row, end_row,
+    return all(should_exclude != is_piece_in_board(board, requirement[0], init_row, end_row,
                                                    init_file, end_file, num_of_this_piece=requirement[1])
                for requirement in pieces.get_requirements())
 
-def does_position_satisfy_specs(stockfish: Stockfish, fen: str, position_specs: list[Piece_Quantities]) -> bool:
-    stockfish.set_fen_position(fen, send_ucinewgame_token = False)
-    return all(does_board_meet_piece_reqs(stockfish, spec) for spec in position_specs)
+def set_position(stockfish: Stockfish, fen: str) -> None:
+    """Sets the engine to the fen, unless it's already there (e.g., since it was set to the game position
+       leading to the fen, which lets it reuse its search of the game's earlier positions)."""
+    if stockfish.get_fen_position() != fen:
+        stockfish.set_fen_position(fen, send_ucinewgame_token = False)
+
+@profiling.timed("checks")
+def does_position_satisfy_specs(board: chess.Board, position_specs: list[Piece_Quantities]) -> bool:
+    """Read off the board itself, since there's nothing for the engine to search."""
+    return all(does_board_meet_piece_reqs(board, spec) for spec in position_specs)
 
 def satisfies_bound(move_dict: dict, bound: Optional[float], is_lower_bound: bool) -> bool:
     """bound is in centipawn evaluation, as a float (e.g., 2.17) or None.
@@ -73,51 +97,165 @@ def satisfies_bound(move_dict: dict, bound: Optional[float], is_lower_bound: boo
         (move_dict["Centipawn"] <= bound if move_dict["Mate"] is None else move_dict["Mate"] < 0)
     )
 
-def does_position_satisfy_bounds(stockfish: Stockfish, fen: str, bounds: list[Optional[float]]) -> bool:
+def do_top_moves_satisfy_bounds(fen: str, top_moves: list[dict], bounds: list[Optional[float]]) -> bool:
     """bounds is a list, where the 0th element is the lower bound for the first move,
        the 1st element is the upper bound for the first move, etc (for however many
        top moves). It may just be the one top move, or it could be 1 more, 2 more, etc.
-       len(bounds) will be even."""
+       len(bounds) will be even. top_moves are as get_top_moves returned them (and aren't modified)."""
 
     # Also allow for if it's Black to move (so if the evals are negative, in Black's favour).
-    stockfish.set_fen_position(fen, send_ucinewgame_token = False)
-    depth_increments = [8, 12, 15]
+    if len(top_moves) != len(bounds) / 2:
+        return False
+    top_moves = deepcopy(top_moves)
     eval_multiplier = 1 if "w" in fen else -1
     # In order to work with evaluations that are relative to the player whose turn it is,
     # rather than positive being white and negative being black.
-    for depth in depth_increments:
-        stockfish.set_depth(depth)
-        top_moves: list[dict] = stockfish.get_top_moves(int(len(bounds) / 2))
-        if len(top_moves) != len(bounds) / 2:
-            return False
-        for i in range(len(top_moves)):
-            if top_moves[i]["Centipawn"] is not None:
-                top_moves[i]["Centipawn"] *= (eval_multiplier * 0.01)
-            if top_moves[i]["Mate"] is not None:
-                top_moves[i]["Mate"] *= eval_multiplier
-        if any(not satisfies_bound(top_moves[int(i/2)], e, i % 2 == 0) for i,e in enumerate(bounds)):
-            return False
-    # End of outer for loop - if control makes it here, return True.
-    return True
-
-def is_underpromotion_best(stockfish: Stockfish, fen: str) -> bool | str:
-    """Returns False if not. Otherwise, returns the underpromotion move (e.g., e7e8r)."""
-
-    stockfish.set_fen_position(fen, send_ucinewgame_token = False)
+    for i in range(len(top_moves)):
+        if top_moves[i]["Centipawn"] is not None:
+            top_moves[i]["Centipawn"] *= (eval_multiplier * 0.01)
+        if top_moves[i]["Mate"] is not None:
+            top_moves[i]["Mate"] *= eval_multiplier
+    return all(satisfies_bound(top_moves[int(i/2)], e, i % 2 == 0) for i,e in enumerate(bounds))
+
+def does_position_satisfy_bounds(stockfish: Stockfish, fen: str, bounds: list[Optional[float]],
+                                 analysis: AnalysisProfile) -> AnalysisResult:
+    """Returns the result of the last search done, which is satisfied iff the position's top moves satisfy
+       the bounds at each depth searched to."""
+    set_position(stockfish, fen)
+    depth_increments = [8, 12, 15]
+    for limit, top_moves in analysis.searches(stockfish, int(len(bounds) / 2), depth_increments):
+        result = AnalysisResult.from_top_moves(fen, limit, top_moves,
+                                               do_top_moves_satisfy_bounds(fen, top_moves, bounds))
+        if not result.satisfied:
+            return result
+    # End of for loop - if control makes it here, the bounds are satisfied.
+    return result
+
+def check_with_prefilter(prefilter: Optional[Prefilter], stockfish: Stockfish, fen: str,
+                         bounds: list[Optional[float]],
+                         full_check: Callable[[], AnalysisResult]) -> Optional[AnalysisResult]:
+    """Returns full_check(), unless the prefilter (if there is one) rules the position out first
+       based on the bounds for its top move (returning None)."""
+    if prefilter is None:
+        return full_check()
+    result: Optional[AnalysisResult] = None
+    def run_full_check() -> bool:
+        nonlocal result
+        result = full_check()
+        return result.satisfied
+    prefilter.check(stockfish, fen, bounds[0], bounds[1], run_full_check)
+    return result
+
+@profiling.timed("checks")
+def check_bounds(stockfish: Stockfish, fen: str, bounds: list[Optional[float]], analysis: AnalysisProfile,
+                 cache: AnalysisCache, prefilter: Optional[Prefilter] = None,
+                 tablebase: Optional[Tablebase] = None) -> Optional[AnalysisResult]:
+    """Returns the result of checking the position against the bounds, reusing the result for the position
+       if it's been checked already. The tablebase (if there is one) answers for the positions it covers, and
+       otherwise the engine does. None if the prefilter ruled the position out."""
+    if (result := cache.get(fen, bounds)) is None:
+        if tablebase is not None and (top_moves := tablebase.top_moves(fen)) is not None:
+            top_moves = top_moves[:len(bounds) // 2]
+            result = AnalysisResult.from_top_moves(fen, "tablebase", top_moves,
+                                                   do_top_moves_satisfy_bounds(fen, top_moves, bounds))
+        else:
+            result = check_with_prefilter(prefilter, stockfish, fen, bounds,
+                                          lambda: does_position_satisfy_bounds(stockfish, fen, bounds, analysis))
+        if result is not None:
+            cache.put(result, bounds)
+    return result
+
+def check_along_trajectory(trajectory: Optional[TrajectoryPruner], ply: int, played_move: chess.Move,
+                           stockfish: Stockfish, fen: str, bounds: list[Optional[float]], analysis: AnalysisProfile,
+                           cache: AnalysisCache, prefilter: Optional[Prefilter] = None,
+                           tablebase: Optional[Tablebase] = None) -> Optional[AnalysisResult]:
+    """Returns check_bounds for the position, unless the trajectory pruner (if there is one) predicts from the
+       game's previous position that it's out of range for the top move's bounds (returning None)."""
+    if trajectory is None:
+        return check_bounds(stockfish, fen, bounds, analysis, cache, prefilter, tablebase)
+    if trajectory.is_out_of_range(ply, played_move.uci(), fen, bounds[0], bounds[1]):
+        return None
+    result = check_bounds(stockfish, fen, bounds, analysis, cache, prefilter, tablebase)
+    trajectory.record(result)
+    return result
+
+def hit_text(feature: str, board_str_rep: str, results: list[AnalysisResult]) -> str:
+    """Returns the text of a 'top moves' or 'skip move' hit, from the results of its checks."""
+    if feature == 'top moves':
+        return board_str_rep + "\nTop moves:\n" + ', '.join(str(d) for d in results[0].top_moves())
+    return (board_str_rep + "\nTop move, and top move if the turn is skipped:\n" +
+            ', '.join(str(r.top_moves()[0]) for r in results))
+
+def analyse_position(stockfish: Stockfish, fen: str, feature: str, bounds: list[Optional[float]],
+                     analysis: AnalysisProfile, cache: AnalysisCache,
+                     tablebase: Optional[Tablebase] = None) -> tuple[bool, list[AnalysisResult]]:
+    """Checks the position for the 'top moves' or 'skip move' feature on its own (not as part of a game, as
+       for the pipeline's analyse phase). Returns whether it's a hit, and the results of the checks done."""
+    if feature == 'top moves':
+        result = check_bounds(stockfish, fen, bounds, analysis, cache, tablebase=tablebase)
+        assert result is not None
+        return result.satisfied, [result]
+    result = check_bounds(stockfish, fen, bounds[0:2], analysis, cache, tablebase=tablebase)
+    assert result is not None
+    if not result.satisfied or not stockfish.is_fen_valid(switch_whose_turn(fen)):
+        return False, [result]
+    skipped_result = check_bounds(stockfish, switch_whose_turn(fen), bounds[2:4], analysis, cache, tablebase=tablebase)
+    assert skipped_result is not None
+    return skipped_result.satisfied, [result, skipped_result]
+
+def underpromotions(board: chess.Board) -> list[str]:
+    """Returns the legal underpromotions in the position."""
+    import chess
+    pawns_about_to_promote = board.pieces_mask(chess.PAWN, board.turn) & (
+        chess.BB_RANK_7 if board.turn == chess.WHITE else chess.BB_RANK_2
+    )
+    if not pawns_about_to_promote:
+        return []
+    return [move.uci() for move in board.generate_legal_moves(from_mask=pawns_about_to_promote)
+            if move.promotion in (chess.KNIGHT, chess.BISHOP, chess.ROOK)]
+
+def move_score(move_dict: dict) -> float:
+    """For comparing the engine's evals of moves (for the player to move), where a quicker mate is better."""
+    if move_dict["Mate"] is None:
+        return move_dict["Centipawn"]
+    return (1e6 if move_dict["Mate"] > 0 else -1e6) - move_dict["Mate"]
+
+@profiling.timed("checks")
+def is_underpromotion_best(position_in_engine: Callable[[], Stockfish], board: chess.Board,
+                           analysis: AnalysisProfile, tablebase: Optional[Tablebase] = None) -> bool | str:
+    """Returns False if not. Otherwise, returns the underpromotion move (e.g., e7e8r). `position_in_engine`
+       returns the engine set to the position, and is only called if there's an underpromotion to search."""
+
+    if not (candidates := underpromotions(board)):
+        return False # Since an underpromotion is not even possible.
+    other_moves = [move.uci() for move in board.legal_moves if move.uci() not in candidates]
+    fen = board.fen()
     depth_increments = [12, 15, 25]
     eval_multiplier = 1 if "w" in fen else -1
     # In order to work with evaluations that are relative to the player whose turn it is,
     # rather than positive being white and negative being black.
 
-    if (("w" in fen and not does_board_meet_piece_reqs(stockfish, Piece_Quantities("row 7: P"))) or
-        ("w" not in fen and not does_board_meet_piece_reqs(stockfish, Piece_Quantities("row 2: p")))):
-        return False # Since a promotion is not even possible.
+    comparisons: Iterable[tuple[str, list[dict], list[dict]]]
+    if tablebase is not None and (tablebase_moves := tablebase.top_moves(fen)) is not None:
+        comparisons = [("tablebase", [m for m in tablebase_moves if m["Move"] in candidates][:1],
+                        [m for m in tablebase_moves if m["Move"] not in candidates][:1])]
+    else:
+        stockfish = position_in_engine()
+        set_position(stockfish, fen)
+        comparisons = (
+            (limit, best_underpromotion, best_other_move) for (limit, best_underpromotion), (_, best_other_move)
+            in zip(analysis.searches(stockfish, 1, depth_increments, candidates),
+                   analysis.searches(stockfish, 1, depth_increments, other_moves))
+        )
+        # Each search is restricted (with searchmoves) to either the underpromotions or the other moves,
+        # so the two top moves are the best underpromotion and the best move that isn't one.
 
-    for depth in depth_increments:
-        stockfish.set_depth(depth)
-        top_moves: list[dict] = stockfish.get_top_moves(2)
-        if len(top_moves) != 2:
+    for limit, best_underpromotion, best_other_move in comparisons:
+        if not best_underpromotion or not best_other_move:
             return False
+        if move_score(best_underpromotion[0]) < move_score(best_other_move[0]):
+            return False # top move isn't an underpromotion
+        top_moves = best_underpromotion + best_other_move
         for i in range(len(top_moves)):
             assert (top_moves[i]["Centipawn"] is None) != (top_moves[i]["Mate"] is None)
             if top_moves[i]["Centipawn"] is not None:
@@ -125,8 +263,6 @@ def is_underpromotion_best(stockfish: Stockfish, fen: str) -> bool | str:
             if top_moves[i]["Mate"] is not None:
                 top_moves[i]["Mate"] *= eval_multiplier
 
-        if len(top_moves[0]["Move"]) != 5 or top_moves[0]["Move"][4] not in ('n', 'b', 'r'):
-            return False # top move isn't an underpromotion
         if top_moves[1]["Mate"] is not None:
             if top_moves[1]["Mate"] > 0:
                 return False # Second best move would lead to mate for the player anyway.
@@ -143,9 +279,10 @@ def is_underpromotion_best(stockfish: Stockfish, fen: str) -> bool | str:
                 if top_moves[0]["Centipawn"] - top_moves[1]["Centipawn"] < 0.5:
                     return False # Underpromoting is not significantly better.
                 else:
-                    print("top move centipawn for player: " + str(top_moves[0]["Centipawn"]))
-                    print("second top move centipawn for player: " + str(top_moves[1]["Centipawn"]))
-                    print(fen + "   depth: " + str(depth))
+                    with console_lock():
+                        print("top move centipawn for player: " + str(top_moves[0]["Centipawn"]))
+                        print("second top move centipawn for player: " + str(top_moves[1]["Centipawn"]))
+                        print(fen + "   " + limit)
     # End of outer for loop
 
     return top_moves[0]["Move"]
@@ -155,6 +292,20 @@ def get_bounds_from_user(input_messages: list[str]) -> list[Optional[float]]:
     return [(None if current_bound_str in ["", "None"] else float(current_bound_str))
             for current_bound_str in map(input, input_messages)]
 
+def get_feature_bounds_from_user(feature: str) -> list[Optional[float]]:
+    # The bounds will be used later in the main while loop. The list will store 4 floats, representing
+    # the info asked for (in that order). So, lower bound for the top move in the first spot in the list, etc.
+    if feature == "top moves":
+        return get_bounds_from_user(["Enter the lower bound for the top move's eval: ",
+                                     "Upper bound for top move's eval: ",
+                                     "Lower bound for the second top move's eval: ",
+                                     "Upper bound for the second top move's eval: "])
+    assert feature == "skip move"
+    return get_bounds_from_user(["Enter the lower bound eval for a position: ",
+                                 "Upper bound for a position: ",
+                                 "Lower bound eval (relative to opponent this time) for the position with move skipped : ",
+                                 "Upper bound for the position with move skipped : "])
+
 def switch_whose_turn(fen: str) -> str:
     return fen.replace("w", "b") if "w" in fen else fen.replace(" b ", " w ")
 
@@ -168,24 +319,146 @@ def try_apply_aliases(inputs: list[str]) -> list[str]:
         meanings.extend(shlex.split(pairs[alias.lower()]) if alias.lower() in pairs else [alias])
     return meanings if set(x.lower() for x in meanings) == set(x.lower() for x in inputs) else try_apply_aliases(meanings)
 
+def get_pgns() -> list[str]:
+    return [
+        name + ('.pgn' if not name.endswith('.pgn') and len(name) != 8 else '')
+        for name in try_apply_aliases(
+            args().dbs_aliases() or
+            shlex.split(input("Enter the names (or aliases) of your databases/studies: "))
+        )
+    ]
+
 def process_pgn(specs: Specs, name_contains: Optional[list[str]],
-                num_pieces_desired_endgame: Optional[int], endgame_specs, bounds) -> None:
-    stockfish = Stockfish(path="stockfish")
+                num_pieces_desired_endgame: Optional[int], endgame_specs, bounds,
+                output_data: Optional[Output] = None, cache: Optional[AnalysisCache] = None,
+                engine: Optional[LazyEngine] = None) -> None:
+    """Searches the pgn source of `specs`. The engine is started when it's first needed, and quit at the end,
+       unless it's passed in (e.g. by a worker searching one shard after another), in which case it's left to
+       the caller."""
+    search_engine = engine or LazyEngine(num_engines=specs.concurrent_engines())
+    try:
+        _search_pgn(specs, name_contains, num_pieces_desired_endgame, endgame_specs, bounds, output_data, cache,
+                    search_engine)
+    finally:
+        if engine is None:
+            search_engine.close()
+
+def _search_pgn(specs: Specs, name_contains: Optional[list[str]],
+                num_pieces_desired_endgame: Optional[int], endgame_specs, bounds,
+                output_data: Optional[Output], cache: Optional[AnalysisCache], engine: LazyEngine) -> None:
+    import chess.pgn
     if specs.pgn().endswith('.pgn'):
         pgn = open(specs.pgn(), "r", errors="replace", encoding="utf-8-sig")
     else:
-        os.makedirs(cache_dir := os.path.join('lichess-cache', study_id := specs.pgn()), exist_ok=True)
-        try:
-            pgn_data = studies.get_study_pgn(study_id)
-            with open(os.path.join(cache_dir, f"{study_id}-{time.time_ns()}.pgn"), "w") as f:
-                f.write(pgn_data)
-        except requests.exceptions.ConnectionError:
-            pass
-        pgn = open(Utils.most_recent_file(cache_dir), "r")
-    output_data = Output()
-    reached_first_game_for_search = specs.do_not_skip_any_games()
+        import studies
+        pgn = open(studies.cached_study_path(specs.pgn()), "r")
+    pgn.seek(specs.start_offset())
+    output_data = output_data or Output()
+    analysis = specs.analysis_profile()
+    prefilter = specs.prefilter()
+    cache = cache or AnalysisCache()
+    if (syzygy_path := specs.syzygy_path()) is not None:
+        from tablebase import open_tablebase
+        tablebase: Optional[Tablebase] = open_tablebase(syzygy_path)
+    else:
+        tablebase = None
+    pgn_size = os.path.getsize(pgn.name)
+    profiling.reset()
+    if (profile_interval := specs.profile_interval()) is not None:
+        exporter: Optional[profiling.Exporter] = profiling.Exporter(
+            os.path.join('results', f"{specs.filename_of_output()}-profile"), specs.pgn(), profile_interval
+        )
+    else:
+        exporter = None
+    if (progress_interval := specs.progress_interval()) is not None:
+        from progress import ProgressReporter
+        reporter: Optional[ProgressReporter] = ProgressReporter(specs.pgn(), progress_interval)
+    else:
+        reporter = None
+
+    if (monitor := specs.memory_monitor()) is not None:
+        monitor.start()
+    if (dedup_path := specs.dedup_path()) is not None:
+        import dedup
+        games_seen: Optional[GameSet] = dedup.GameSet(dedup_path)
+    else:
+        games_seen = None
+    selection = specs.position_selection()
+    if (extract_dir := specs.extract_dir()) is not None:
+        import pipeline
+        writer: Optional[PositionWriter] = pipeline.PositionWriter(
+            extract_dir, specs, (name_contains, num_pieces_desired_endgame, endgame_specs, bounds)
+        )
+    else:
+        writer = None
+    joined = specs.joined_hits()
+    trajectory = specs.trajectory_pruner()
+    if (sample_args := specs.sample()) is not None:
+        sample: Optional[Sample] = Sample(pgn.name, specs.start_offset(), *sample_args)
+        with console_lock():
+            print(f"{specs.pgn()}: sampling {min(sample_args[0], sample.population())} of its "
+                  f"{sample.population()} games\n")
+    else:
+        sample = None
+
+    def shed_load() -> None:
+        cache.clear()
+        output_data.shed_memory(specs)
+
+    is_game_in_engine = False
+    def position_in_engine() -> Stockfish:
+        """Returns the engine, set to the current position of the game. The first time in each game, this
+           starts a new game in the engine (clearing its hash table), so games that are never searched don't
+           cost a reset, and the positions of a game are searched as one continuous game."""
+        nonlocal is_game_in_engine
+        stockfish = engine.get()
+        with profiling.timer('engine_position'):
+            stockfish.set_game_position(starting_fen, [m.uci() for m in board.move_stack], not is_game_in_engine)
+        is_game_in_engine = True
+        return stockfish
+
+    def hits_so_far() -> dict[str, int]:
+        if specs.type_of_position() == 'underpromotion':
+            return {"games where underpromotion is best": output_data.num_hits(True),
+                    "games where it's best and missed": output_data.num_hits()}
+        return {"hits": output_data.num_hits()}
+
+    def fraction_searched() -> float:
+        if sample is not None:
+            return sample.fraction_searched()
+        if (max_games := specs.max_games()) is not None:
+            return output_data.num_games() / max_games
+        return (pgn.buffer.tell() - specs.start_offset()) / max(1, pgn_size - specs.start_offset())
+
+    reached_first_game_for_search = specs.do_not_skip_any_games() or sample is not None
+    # A sample is of all the games, wherever the search would otherwise start.
+    last_checkpoint_time = time.monotonic()
     while True:
+        if (reached_first_game_for_search and (interval := specs.checkpoint_interval()) is not None and
+            time.monotonic() - last_checkpoint_time >= interval):
+            with profiling.timer('checkpoint'):
+                checkpoint.save(specs, (name_contains, num_pieces_desired_endgame, endgame_specs, bounds),
+                                pgn.name, pgn.tell(), output_data, cache)
+            last_checkpoint_time = time.monotonic()
+        if exporter is not None:
+            exporter.maybe_write()
+        if reporter is not None and reporter.due():
+            reporter.report(fraction_searched(), output_data.num_games(), cache.hit_rate())
         output_data.prep_for_new_game()
+        if (max_games := specs.max_games()) is not None and output_data.num_games() > max_games:
+            break
+        if joined is not None:
+            game_num, offset = joined.next_game()
+            output_data.add_games_parsed(game_num - output_data.num_games())
+            # As if the games without hits had been read too.
+            if offset is None:
+                break
+            pgn.seek(offset)
+        if sample is not None:
+            if (offset := sample.next_offset()) is None:
+                break
+            pgn.seek(offset)
+            game_start_time, hits_before = time.monotonic(), hits_so_far()
         if not reached_first_game_for_search:
             headers = chess.pgn.read_headers(pgn)
             if (game_num := specs.game_num_to_search_after()) is not None:
@@ -197,15 +470,29 @@ def process_pgn(specs: Specs, name_contains: Optional[list[str]],
                     headers is not None and white in headers.get("White", "?") and
                     black in headers.get("Black", "?") and date in headers.get("Date", "?")
                 )
-            if reached_first_game_for_search:
-                print("Done skipping games")
-            if output_data.num_games() % 20000 == 0:
-                print("Skipped " + str(output_data.num_games()))
+            with console_lock():
+                if reached_first_game_for_search:
+                    print("Done skipping games")
+                if reporter is None and output_data.num_games() % 20000 == 0:
+                    print("Skipped " + str(output_data.num_games()))
             continue
 
-        if specs.type_of_position() == 'name':
-            game = chess.pgn.read_game(pgn) if specs.verbose_for_name_feature() else None
-            headers = game.headers if game else chess.pgn.read_headers(pgn)
+        game_offset = pgn.tell() if games_seen is not None or writer is not None or joined is not None else 0
+        game_pgn: TextIO = pgn
+        is_duplicate = False
+        if games_seen is not None:
+            if (game_text := dedup.read_game_text(pgn)) is None:
+                break
+            is_duplicate = games_seen.is_duplicate(dedup.game_key(game_text), os.path.abspath(pgn.name), game_offset)
+            game_pgn = io.StringIO(game_text.text)
+            # Parsing the text already read, rather than reading the game from the file again.
+
+        if is_duplicate:
+            pass # Still counted below, as a game without any hits.
+        elif specs.type_of_position() == 'name':
+            with profiling.timer('pgn_parse'):
+                game = chess.pgn.read_game(game_pgn) if specs.verbose_for_name_feature() else None
+                headers = game.headers if game else chess.pgn.read_headers(game_pgn)
             if headers is None:
                 break
             white, black, opening, event, source = (
@@ -223,30 +510,65 @@ def process_pgn(specs: Specs, name_contains: Optional[list[str]],
                     else f"{white}-{black}, opening: {opening}, event: {event}, source: {source}"
                 )
         else:
-            if (current_game := chess.pgn.read_game(pgn)) is None:
+            with profiling.timer('pgn_parse'):
+                current_game = chess.pgn.read_game(game_pgn)
+            if current_game is None:
                 break
-            current_game_as_str = Utils.remove_lines_starting_with(
-                str(current_game), '[Site "https://lichess.org/'
-            )
+            profiling.count('games')
+            if analysis.scheduler() is not None:
+                analysis.set_progress(fraction_searched())
+            if writer is None:
+                with profiling.timer('game_str'):
+                    current_game_as_str = Utils.remove_lines_starting_with(
+                        str(current_game), '[Site "https://lichess.org/'
+                    )
 
             board = current_game.board()
+            starting_fen, is_game_in_engine = board.fen(), False
             move_counter = 0
             prev_move = None
+            first_ply = max(1, specs.move_to_begin_at() * 2)
+            num_selected_in_game = 0
+            last_ply = current_game.end().ply() if selection is not None else 0
+            if trajectory is not None:
+                trajectory.new_game()
             for move in current_game.mainline_moves():
                 if output_data.newest_hit_exists():
                     output_data.print_and_write_data(specs)
                     output_data.clear_newest_hit()
 
-                if specs.type_of_position() == "underpromotion":
-                    if prev_move is not None:
-                        board.push(prev_move)
-                    prev_move = move # Note - prev_move is a misnomer for the rest of this loop iteration now.
-                else:
-                    board.push(move)
+                with profiling.timer('board_push'):
+                    if specs.type_of_position() == "underpromotion":
+                        if prev_move is not None:
+                            board.push(prev_move)
+                        prev_move = move # Note - prev_move is a misnomer for the rest of this loop iteration now.
+                    else:
+                        board.push(move)
                 move_counter += 1
-                if move_counter < specs.move_to_begin_at() * 2:
+                if move_counter < first_ply:
+                    continue
+                if selection is not None:
+                    if selection.is_game_done(move_counter, num_selected_in_game, last_ply):
+                        break
+                    if not selection.selects(board, move_counter - first_ply):
+                        continue
+                    num_selected_in_game += 1
+                    # Before anything is done with the position, so that a skipped one costs next to nothing.
+                profiling.count('positions')
+                if writer is not None:
+                    writer.add(board, output_data.num_games(), game_offset, move_counter)
                     continue
-                board_str_rep = board.fen() + "\n" + str(board) + "\nfrom:\n" + current_game_as_str
+                with profiling.timer('fen'):
+                    board_str_rep = board.fen() + "\n" + str(board) + "\nfrom:\n" + current_game_as_str
+                if joined is not None:
+                    if (results := joined.results(game_offset, move_counter)) is not None:
+                        output_data.add_newest_hit(hit_text(specs.type_of_position(), board_str_rep, results),
+                                                   analyses=results)
+                    continue
+                if specs.type_of_position() in ("top moves", "skip move"):
+                    stockfish = position_in_engine()
+                    # Not for underpromotions, since the engine is only needed for the rare positions
+                    # where one is legal.
 
                 if specs.type_of_position() == "endgame":
                     num_pieces_in_current_fen = num_pieces_in_fen(board.fen())
@@ -255,48 +577,150 @@ def process_pgn(specs: Specs, name_contains: Optional[list[str]],
                         break  # Too few pieces to ever reach the desired endgame now.
                     if (    (num_pieces_desired_endgame is None or
                             num_pieces_in_current_fen == num_pieces_desired_endgame)
-                        and does_position_satisfy_specs(stockfish, board.fen(), endgame_specs)):
+                        and does_position_satisfy_specs(board, endgame_specs)):
                         output_data.add_newest_hit(board_str_rep)
                         break  # On to the next game
 
                 elif specs.type_of_position() == "top moves":
-                    if does_position_satisfy_bounds(stockfish, board.fen(), bounds):
-                        output_data.add_newest_hit(board_str_rep + "\nTop moves:\n" +
-                                                   ', '.join(str(d) for d in stockfish.get_top_moves(2)))
+                    if (result := check_along_trajectory(trajectory, move_counter, move, stockfish, board.fen(),
+                                                         bounds, analysis, cache, prefilter, tablebase)) and \
+                       result.satisfied:
+                        output_data.add_newest_hit(hit_text(specs.type_of_position(), board_str_rep, [result]),
+                                                   analyses=[result])
 
                 elif specs.type_of_position() == "skip move":
-                    if (does_position_satisfy_bounds(stockfish, board.fen(), bounds[0:2]) and
+                    if ((result := check_along_trajectory(trajectory, move_counter, move, stockfish, board.fen(),
+                                                          bounds[0:2], analysis, cache, prefilter, tablebase)) and
+                        result.satisfied and
                         stockfish.is_fen_valid(switch_whose_turn(board.fen())) and
-                        does_position_satisfy_bounds(stockfish, switch_whose_turn(board.fen()),
-                                                    bounds[2:4])):
-                        output_data.add_newest_hit(board_str_rep)
+                        (skipped_result := check_bounds(stockfish, switch_whose_turn(board.fen()), bounds[2:4],
+                                                        analysis, cache, tablebase=tablebase)) and
+                        skipped_result.satisfied):
+                        output_data.add_newest_hit(
+                            hit_text(specs.type_of_position(), board_str_rep, [result, skipped_result]),
+                            analyses=[result, skipped_result]
+                        )
 
                 elif specs.type_of_position() == "underpromotion":
-                    underpromotion_move = is_underpromotion_best(stockfish, board.fen())
+                    underpromotion_move = is_underpromotion_best(position_in_engine, board, analysis, tablebase)
                     if underpromotion_move:
                         assert isinstance(underpromotion_move, str)
                         output_data.add_newest_hit(board_str_rep, underpromotion_move != move.uci(), True)
 
                 # End of for loop for iterating over the moves of the current game
 
-        if output_data.newest_hit_exists() or output_data.num_games() % specs.default_output_interval() == 0:
+        if output_data.newest_hit_exists() or (
+            output_data.num_games() % specs.default_output_interval() == 0 if reporter is None else reporter.due()
+        ):
             output_data.print_and_write_data(specs)
+            # With a reporter, the results are refreshed as often as it reports, rather than every so many games.
+        if monitor is not None:
+            monitor.after_game(output_data.num_games(), specs.pgn(), shed_load)
+        if sample is not None:
+            sample.record(time.monotonic() - game_start_time,
+                          {kind: num_hits - hits_before[kind] for kind, num_hits in hits_so_far().items()})
     # End of the while loop for iterating over all the games.
     pgn.close()
+    if tablebase is not None:
+        tablebase.close()
+    if games_seen is not None:
+        games_seen.close()
+    extract_report = writer.close(output_data.num_games() - 1) if writer is not None else None
+    if exporter is not None:
+        exporter.write()
+    if monitor is not None:
+        monitor.stop()
+    if reporter is not None:
+        reporter.report(1.0, output_data.num_games() - 1, cache.hit_rate())
+        # -1 since `prep_for_new_game` was called once more before finding no game left.
+    for report in (extract_report, analysis.report(), prefilter.report() if prefilter else None,
+                   tablebase.report() if tablebase else None, games_seen.report() if games_seen else None,
+                   cache.report(),
+                   profiling.summary() if exporter else None, monitor.report() if monitor else None,
+                   selection.report() if selection else None, trajectory.report() if trajectory else None,
+                   sample.report() if sample else None):
+        if report is not None:
+            with console_lock():
+                print(f"{specs.pgn()}: {report}\n")
+    checkpoint.remove(specs)
+    output_data.remove_spill_files()
+
+def source_size(pgn: str) -> int:
+    """Returns the size in bytes of the pgn source, where a study is sized by its current cached copy
+       (or 0 if it hasn't been cached yet)."""
+    if pgn.endswith('.pgn'):
+        return os.path.getsize(pgn) if os.path.isfile(pgn) else 0
+    import studies
+    return os.path.getsize(path) if (path := studies.cached_copy(pgn)) is not None else 0
+
+def process_source(specs: Specs, name_contains: Optional[list[str]],
+                   num_pieces_desired_endgame: Optional[int], endgame_specs, bounds,
+                   concurrent: bool = False) -> None:
+    with console_lock():
+        print(f"Results for {specs.pgn()}:\n\n")
+    process_pgn(specs, name_contains, num_pieces_desired_endgame, endgame_specs, bounds)
+    with console_lock():
+        print(f"****===================================****{f' ({specs.pgn()} done)' if concurrent else ''}\n\n")
+
+def process_sources(all_specs: list[Specs], name_contains: Optional[list[str]],
+                    num_pieces_desired_endgame: Optional[int], endgame_specs, bounds, jobs: int) -> None:
+    """Processes each source in `all_specs`. If `jobs` is more than 1, up to that many sources are
+       processed at once in separate processes, starting with the largest ones (so that small
+       sources don't end up waiting for a huge one at the end)."""
+    if jobs <= 1:
+        for specs in all_specs:
+            process_source(specs, name_contains, num_pieces_desired_endgame, endgame_specs, bounds)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    lock = multiprocessing.Lock()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=set_console_lock, initargs=(lock,)) as executor:
+        futures = [
+            executor.submit(process_source, specs, name_contains, num_pieces_desired_endgame, endgame_specs,
+                            bounds, True)
+            for specs in sorted(all_specs, key=lambda x: source_size(x.pgn()), reverse=True)
+        ]
+        for future in futures:
+            future.result()
 
 def main(argv: Optional[list[str]] = None) -> None:
     if not __debug__:
         raise RuntimeError("Python isn't running in the default debug mode.")
     set_args(sys.argv if argv is None else argv)
+    if (worker_of := args().option('worker')) is not None:
+        import distributed
+        distributed.run_worker(distributed.parse_address(worker_of), distributed.authkey(args().option('authkey')),
+                               process_pgn)
+        return
+    if (resume_from := args().option('resume')) is not None:
+        checkpoint.resume(resume_from, process_pgn)
+        return
+    if (num_positions := args().option('calibrate')) is not None:
+        import autotune
+        import studies
+        autotune.calibrate([pgn if pgn.endswith('.pgn') else studies.cached_study_path(pgn) for pgn in get_pgns()],
+                           int(num_positions or autotune.DEFAULT_NUM_POSITIONS))
+        return
+    if (analyse_dir := args().option('analyse')) is not None:
+        import pipeline
+        pipeline.analyse(analyse_dir, get_feature_bounds_from_user(pipeline.extracted_feature(analyse_dir)),
+                         profile_from_options(args().option('analysis'), None), args().option('analysis'),
+                         args().option('syzygy'), pipeline.part_from_option(args().option('part')), args().jobs(),
+                         analyse_position)
+        return
+    if (join_from := args().option('join')) is not None:
+        import pipeline
+        pipeline.join(join_from, process_pgn)
+        return
     specs = Specs(args().feature())
     endgame_specs = bounds = num_pieces_desired_endgame = name_contains = None
-    pgns = [
-        name + ('.pgn' if not name.endswith('.pgn') and len(name) != 8 else '')
-        for name in try_apply_aliases(
-            args().dbs_aliases() or
-            shlex.split(input("Enter the names (or aliases) of your databases/studies: "))
-        )
-    ]
+    pgns = get_pgns()
+    if (extract_dir := args().option('extract')) is not None:
+        import pipeline
+        assert specs.type_of_position() in pipeline.FEATURES and args().option('coordinator') is None
+        if extracted := [pgn for pgn in pgns if pipeline.is_extracted(extract_dir, pgn)]:
+            print(f"\nAlready extracted to {extract_dir}, so skipping: {extracted}")
+            pgns = [pgn for pgn in pgns if pgn not in extracted]
     print(f"\nWill be applying the '{specs.type_of_position()}' feature to these pgn sources:\n{pgns}")
 
     if specs.type_of_position() == "endgame":
@@ -309,21 +733,10 @@ def main(argv: Optional[list[str]] = None) -> None:
         # E.g.: "~row 2: PK2p" (for a requirement) means to not have any of a white pawn, white king, or
         # 2 black pawns in row 2.
 
-    elif specs.type_of_position() == "top moves":
-        bounds = get_bounds_from_user(["Enter the lower bound for the top move's eval: ",
-                                       "Upper bound for top move's eval: ",
-                                       "Lower bound for the second top move's eval: ",
-                                       "Upper bound for the second top move's eval: "])
-        # bounds will be used later in the main while loop. This list will store 4 floats,
-        # representing the info above (in that order). So, lower bound for the top move in the
-        # first spot in the list, etc.
-
-    elif specs.type_of_position() == "skip move":
-        bounds = get_bounds_from_user(["Enter the lower bound eval for a position: ",
-                                       "Upper bound for a position: ",
-                                       "Lower bound eval (relative to opponent this time) for the position with move skipped : ",
-                                       "Upper bound for the position with move skipped : "])
-        # Again, like in the elif above, here bounds will be used later in the main loop.
+    elif specs.type_of_position() in ("top moves", "skip move"):
+        if extract_dir is None:
+            bounds = get_feature_bounds_from_user(specs.type_of_position())
+        # When extracting, the bounds are only needed once the positions are analysed.
 
     elif specs.type_of_position() == 'name':
         user_input = args().additional_args() or (
@@ -334,13 +747,67 @@ def main(argv: Optional[list[str]] = None) -> None:
         specs.set_substrs_name_feature(name_contains)
         print(f"Checking for these substrings: {name_contains}\n")
 
+    if study_ids := [pgn for pgn in pgns if not pgn.endswith('.pgn')]:
+        import studies
+        studies.update_cached_studies(study_ids)
+    analysis_profile = profile_from_options(args().option('analysis'), args().option('budget'))
+    assert analysis_profile.scheduler() is None or args().option('coordinator') is None, \
+        "--budget only applies to searches run on this machine."
+    sample = sample_from_option(args().option('sample'))
+    assert sample is None or args().option('coordinator') is None, \
+        "--sample only applies to searches run on this machine."
+    if (dedup_option := args().option('dedup')) is not None:
+        dedup_path: Optional[str] = dedup_option or os.path.join('results', f"{time.time_ns()}-games.sqlite")
+        # Without a path, a set of games just for this search (shared by all its sources).
+    else:
+        dedup_path = None
+    num_engines = min(args().jobs(), len(pgns))
+    total_size = sum(source_size(pgn) for pgn in pgns)
+    all_specs: list[Specs] = []
     for pgn in pgns:
-        print(f"Results for {pgn}:\n\n")
         specs_copy = deepcopy(specs)
         specs_copy.set_output_filename(str(time.time_ns()))
         specs_copy.set_pgn(pgn)
-        process_pgn(specs_copy, name_contains, num_pieces_desired_endgame, endgame_specs, bounds)
-        print("****===================================****\n\n")
+        specs_copy.set_checkpoint_interval(
+            None if sample or extract_dir else float(args().option('checkpoint-interval') or '300') or None
+        )
+        # A sample is quick, and a checkpoint of one couldn't be resumed as the rest of the sample anyway.
+        # Likewise an extraction, which starts a source over if it gets interrupted.
+        specs_copy.set_extract_dir(extract_dir)
+        specs_copy.set_sample(sample)
+        specs_copy.set_dedup_path(dedup_path)
+        specs_copy.set_trajectory_pruner(pruner_from_option(args().option('trajectory')))
+        specs_copy.set_position_selection(selection_from_options(
+            args().option('end-ply'), args().option('ply-stride'), args().option('quiet'),
+            args().option('max-positions')
+        ))
+        specs_copy.set_concurrent_engines(num_engines)
+        specs_copy.set_prefilter(prefilter_from_option(args().option('prefilter')))
+        specs_copy.set_syzygy_path(args().option('syzygy'))
+        if (progress_interval := args().option('progress')) is not None:
+            specs_copy.set_progress_interval(float(progress_interval or '2'))
+        specs_copy.set_memory_monitor(monitor_from_options(args().option('memory-profile'),
+                                                           args().option('memory-limit')))
+        if (profile_interval := args().option('profile')) is not None:
+            specs_copy.set_profile_interval(float(profile_interval or '30'))
+        specs_copy.set_analysis_profile(analysis_profile.with_budget_share(
+            min(1.0, num_engines * source_size(pgn) / max(1, total_size))
+        ))
+        # With several sources searched at once, each one's share of the budget is of the total time
+        # for that many engines.
+        all_specs.append(specs_copy)
+    if (coordinator_address := args().option('coordinator')) is not None:
+        import distributed
+        distributed.coordinate(all_specs, (name_contains, num_pieces_desired_endgame, endgame_specs, bounds),
+                               distributed.parse_address(coordinator_address),
+                               distributed.authkey(args().option('authkey')),
+                               int(args().option('shard-games') or '1000'))
+    else:
+        process_sources(all_specs, name_contains, num_pieces_desired_endgame, endgame_specs, bounds,
+                        min(args().jobs(), len(pgns)))
+    if dedup_path is not None and not dedup_option:
+        from dedup import remove_game_set
+        remove_game_set(dedup_path)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,97 @@
+"""Keeps an eye on the memory of a long search: optionally sampling it with tracemalloc to report the top
+allocation sites every so many games, and enforcing a ceiling on the process's RSS by having the caches
+and output buffers shed what they hold before the process runs out of memory."""
+
+from __future__ import annotations
+import gc
+import os
+import sys
+import tracemalloc
+from typing import Callable, Optional
+
+from output_obj import console_lock
+
+def rss_mb() -> Optional[float]:
+    """Returns the resident set size of the process in MB (or its peak, where the current one isn't available),
+       or None if it can't be found."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+    # ru_maxrss is in bytes on macOS, and in KB elsewhere.
+
+class MemoryMonitor:
+    CHECK_INTERVAL_GAMES = 100
+    """How often the RSS is checked against the ceiling."""
+    RESHED_GROWTH = 0.05
+    """Since memory freed by shedding is reused by Python rather than returned to the OS, the RSS doesn't
+       drop afterwards. So load is only shed again once the RSS has grown by this fraction of the ceiling."""
+    NUM_TOP_SITES = 10
+
+    def __init__(self, profile_every_games: Optional[int] = None, ceiling_mb: Optional[float] = None) -> None:
+        assert profile_every_games is not None or ceiling_mb is not None
+        self._profile_every_games = profile_every_games
+        self._ceiling_mb = ceiling_mb
+        self._rss_at_last_shed: Optional[float] = None
+        self._num_sheds = 0
+        self._peak_rss_mb = 0.0
+
+    def start(self) -> None:
+        if self._profile_every_games is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self) -> None:
+        if self._profile_every_games is not None and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def after_game(self, num_games: int, source: str, shed_load: Callable[[], None]) -> None:
+        """Called after each game, with `shed_load` freeing what the caches and output buffers hold."""
+        if self._profile_every_games is not None and num_games % self._profile_every_games == 0:
+            self._report_top_sites(num_games, source)
+        if self._ceiling_mb is None or num_games % self.CHECK_INTERVAL_GAMES or (rss := rss_mb()) is None:
+            return
+        self._peak_rss_mb = max(self._peak_rss_mb, rss)
+        if rss > self._ceiling_mb and (
+            self._rss_at_last_shed is None or rss > self._rss_at_last_shed + self.RESHED_GROWTH * self._ceiling_mb
+        ):
+            shed_load()
+            gc.collect()
+            self._rss_at_last_shed = rss
+            self._num_sheds += 1
+            with console_lock():
+                print(f"{source}: RSS of {rss:.0f} MB is over the {self._ceiling_mb:.0f} MB ceiling after "
+                      f"{num_games} games, so the caches and output buffers were cleared\n")
+
+    def _report_top_sites(self, num_games: int, source: str) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        )).statistics('lineno')
+        rss_str = f"RSS {rss:.0f} MB, " if (rss := rss_mb()) is not None else ""
+        lines = [f"{source}: memory after {num_games} games: {rss_str}traced {current / 2**20:.1f} MB "
+                 f"(peak {peak / 2**20:.1f} MB). Top allocation sites:"]
+        lines += [f"    {stat.traceback[0].filename}:{stat.traceback[0].lineno}: {stat.size / 2**10:.0f} KB "
+                  f"in {stat.count} blocks" for stat in stats[:self.NUM_TOP_SITES]]
+        with console_lock():
+            print("\n".join(lines) + "\n")
+
+    def report(self) -> Optional[str]:
+        if self._ceiling_mb is None:
+            return None
+        return (f"Memory: peak RSS {self._peak_rss_mb:.0f} MB (ceiling {self._ceiling_mb:.0f} MB), "
+                f"load shed {self._num_sheds} times")
+
+def monitor_from_options(profile: Optional[str], ceiling: Optional[str]) -> Optional[MemoryMonitor]:
+    """Returns the monitor for the `--memory-profile[=GAMES]` and `--memory-limit=MB` options (None if neither
+       was given)."""
+    if profile is None and ceiling is None:
+        return None
+    return MemoryMonitor(None if profile is None else int(profile or '1000'),
+                         None if ceiling is None else float(ceiling))
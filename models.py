@@ -7,15 +7,22 @@
 
 from __future__ import annotations
 import subprocess
-from typing import Any, List, Optional, Union, Dict, Tuple
+from typing import Any, List, Optional, Union, Dict, Tuple, TYPE_CHECKING
 import copy
+import json
 import os
+import shutil
 from dataclasses import dataclass
 from enum import Enum
 import re
 import datetime
 import warnings
 
+import profiling
+
+if TYPE_CHECKING:
+    import chess
+
 
 class Stockfish:
     """Integrates the [Stockfish chess engine](https://stockfishchess.org/) with Python."""
@@ -23,6 +30,19 @@ class Stockfish:
     _del_counter = 0
     # Used in test_models: will count how many times the del function is called.
 
+    PROBE_CACHE_FILE: Optional[str] = os.path.join("engine-cache", "probes.json")
+    # Where what's learned from an engine binary's `uci` output is saved, so that new instances (in this
+    # process or later ones) can skip asking again. Set to None to only cache within this process.
+    _probe_cache: Optional[Dict[str, dict]] = None
+
+    _PIPE_BUFFER_SIZE = 1 << 16
+    # The engine's output is read in binary mode through a buffer this big, since a search at a high
+    # MultiPV and depth can print thousands of info lines.
+
+    _INFO_FIELDS = re.compile(rb" (depth|seldepth|multipv|nodes|nps|time|cp|mate|pv) (\S+)")
+    _INFO_WDL = re.compile(rb" wdl (\d+) (\d+) (\d+)")
+    _INFO_NODES = re.compile(rb" nodes (\d+)")
+
     _RELEASES = {
         "16.0": "2023-06-30",
         "15.1": "2022-12-04",
@@ -91,7 +111,7 @@ class Stockfish:
         self._path: str = path
         self._stockfish = subprocess.Popen(
             self._path,
-            universal_newlines=True,
+            bufsize=self._PIPE_BUFFER_SIZE,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
@@ -102,9 +122,16 @@ class Stockfish:
 
         self._has_quit_command_been_sent: bool = False
 
-        self._set_stockfish_version()
+        self._board: Optional[chess.Board] = None
+        # A mirror of the engine's position, so that questions about the position itself (the fen, what's
+        # on a square, whether a move is legal) don't need a round trip to the engine. It's None whenever
+        # the engine was given a position python-chess can't parse, in which case the engine is asked.
+        self._game_start_fen: Optional[str] = None
+        self._game_moves: List[str] = []
+        # Set by set_game_position, for the game the engine's position is part of.
 
-        self._put("uci")
+        self._probe: dict = self._get_engine_probe()
+        self._parse_stockfish_version(self._probe["version_text"])
 
         self.set_depth(depth)
         self.set_num_nodes(num_nodes)
@@ -113,13 +140,17 @@ class Stockfish:
         self.info: str = ""
 
         self._parameters: dict = {}
-        self.update_engine_parameters(self._DEFAULT_STOCKFISH_PARAMS)
-        self.update_engine_parameters(parameters)
+        options = self._prepare_parameter_updates(self._DEFAULT_STOCKFISH_PARAMS)
+        self._parameters = copy.deepcopy(options)
+        options.update(self._prepare_parameter_updates(parameters))
+        self._send_options(options)
 
         if self.does_current_engine_version_have_wdl_option():
-            self._set_option("UCI_ShowWDL", True, False)
+            self._set_option("UCI_ShowWDL", True, False, False)
 
         self._prepare_for_new_position(True)
+        # All the options above are only followed by this one `isready`.
+        self._board = self._mirror_of("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
 
     def set_debug_view(self, activate: bool) -> None:
         self._debug_view = activate
@@ -158,8 +189,14 @@ class Stockfish:
         """
         if not parameters:
             return
+        self._send_options(self._prepare_parameter_updates(parameters))
+        self.set_fen_position(self.get_fen_position(), False)
+        # Getting SF to set the position again, since UCI option(s) have been updated.
 
-        new_param_values = copy.deepcopy(parameters)
+    def _prepare_parameter_updates(self, parameters: Optional[dict]) -> dict:
+        """Validates the new parameter values, and returns them along with any other values that have
+        to change with them, in the order they should be sent to the engine."""
+        new_param_values = copy.deepcopy(parameters or {})
 
         for key in new_param_values:
             if len(self._parameters) > 0 and key not in self._parameters:
@@ -198,10 +235,17 @@ class Stockfish:
             new_param_values["Threads"] = threads_value
             new_param_values["Hash"] = hash_value
 
-        for name, value in new_param_values.items():
-            self._set_option(name, value)
-        self.set_fen_position(self.get_fen_position(), False)
-        # Getting SF to set the position again, since UCI option(s) have been updated.
+        return new_param_values
+
+    def _send_options(self, options: dict) -> None:
+        """Sends a `setoption` for each of the options the engine supports, without waiting on the engine.
+        The caller is responsible for an `isready` afterwards."""
+        for name, value in options.items():
+            if not self._probe["options"] or name in self._probe["options"]:
+                self._set_option(name, value, wait_until_ready=False)
+            else:
+                self._validate_param_val(name, value)
+                self._parameters.update({name: value})
 
     def reset_engine_parameters(self) -> None:
         """Resets the Stockfish engine parameters.
@@ -225,19 +269,24 @@ class Stockfish:
         if self._stockfish.poll() is None and not self._has_quit_command_been_sent:
             if self._debug_view:
                 print(f">>> {command}\n")
-            self._stockfish.stdin.write(f"{command}\n")
+            self._stockfish.stdin.write(f"{command}\n".encode())
             self._stockfish.stdin.flush()
             if command == "quit":
                 self._has_quit_command_been_sent = True
 
     def _read_line(self) -> str:
+        return self._read_raw_line().decode().strip()
+
+    def _read_raw_line(self) -> bytes:
+        """Returns the next line of output, undecoded. Only checks on the process once its output has
+        run dry, rather than for every line."""
         if not self._stockfish.stdout:
             raise BrokenPipeError()
-        if self._stockfish.poll() is not None:
+        line = self._stockfish.stdout.readline()
+        if not line:
             raise StockfishException("The Stockfish process has crashed")
-        line = self._stockfish.stdout.readline().strip()
         if self._debug_view:
-            print(line)
+            print(line.decode().strip())
         return line
 
     def _discard_remaining_stdout_lines(self, substr_in_last_line: str) -> None:
@@ -246,7 +295,11 @@ class Stockfish:
             pass
 
     def _set_option(
-        self, name: str, value: Any, update_parameters_attribute: bool = True
+        self,
+        name: str,
+        value: Any,
+        update_parameters_attribute: bool = True,
+        wait_until_ready: bool = True,
     ) -> None:
         self._validate_param_val(name, value)
         str_rep_value = str(value)
@@ -255,7 +308,8 @@ class Stockfish:
         self._put(f"setoption name {name} value {str_rep_value}")
         if update_parameters_attribute:
             self._parameters.update({name: value})
-        self._is_ready()
+        if wait_until_ready:
+            self._is_ready()
 
     def _validate_param_val(self, name: str, value: Any) -> None:
         if name not in Stockfish._PARAM_RESTRICTIONS:
@@ -273,14 +327,14 @@ class Stockfish:
         while self._read_line() != "readyok":
             pass
 
-    def _go(self) -> None:
-        self._put(f"go depth {self._depth}")
+    def _go(self, searchmoves: str = "") -> None:
+        self._put(f"go depth {self._depth}{searchmoves}")
 
-    def _go_nodes(self) -> None:
-        self._put(f"go nodes {self._num_nodes}")
+    def _go_nodes(self, searchmoves: str = "") -> None:
+        self._put(f"go nodes {self._num_nodes}{searchmoves}")
 
-    def _go_time(self, time: int) -> None:
-        self._put(f"go movetime {time}")
+    def _go_time(self, time: int, searchmoves: str = "") -> None:
+        self._put(f"go movetime {time}{searchmoves}")
 
     def _go_remaining_time(self, wtime: Optional[int], btime: Optional[int]) -> None:
         cmd = "go"
@@ -325,6 +379,60 @@ class Stockfish:
         """
         self._prepare_for_new_position(send_ucinewgame_token)
         self._put(f"position fen {fen_position}")
+        self._board = self._mirror_of(fen_position)
+        self._game_start_fen = None
+
+    def set_game_position(
+        self, starting_fen: str, moves: List[str], send_ucinewgame_token: bool = False
+    ) -> None:
+        """Sets the position reached by playing `moves` from `starting_fen`, with the engine being
+        told the moves too (rather than just the resulting position).
+
+        Meant to be called for successive positions of a game, with `send_ucinewgame_token` only
+        being `True` at the start of each game. The engine then keeps its transposition table
+        entries from the game's earlier positions (which makes searching later ones much faster),
+        and is aware of repetitions.
+
+        Args:
+            starting_fen:
+              FEN string of the position the game started from.
+
+            moves:
+              The moves played so far in the game, in full algebraic notation.
+
+            send_ucinewgame_token:
+              Whether to send the `ucinewgame` token to the Stockfish engine.
+
+        Returns:
+            `None`
+
+        Example:
+            >>> stockfish.set_game_position(chess.STARTING_FEN, ["e2e4", "e7e5", "g1f3"])
+        """
+        if send_ucinewgame_token:
+            self._prepare_for_new_position(True)
+        else:
+            self.info = ""
+        self._put(f"position fen {starting_fen}" + (f" moves {' '.join(moves)}" if moves else ""))
+        if (
+            self._board is None
+            or self._game_start_fen != starting_fen
+            or moves[: len(self._game_moves)] != self._game_moves
+        ):
+            self._board = self._mirror_of(starting_fen)
+            self._game_moves = []
+        if self._board is not None:
+            for move in moves[len(self._game_moves) :]:
+                self._board.push_uci(move)
+        self._game_start_fen, self._game_moves = starting_fen, copy.copy(moves)
+
+    def _mirror_of(self, fen_position: str) -> Optional[chess.Board]:
+        import chess
+
+        try:
+            return chess.Board(fen_position, chess960=self._parameters["UCI_Chess960"])
+        except ValueError:
+            return None
 
     def set_position(self, moves: Optional[List[str]] = None) -> None:
         """Sets current board position.
@@ -362,6 +470,17 @@ class Stockfish:
         if not moves:
             return
         self._prepare_for_new_position(False)
+        if self._board is not None:
+            fen_before_moves = self._board.fen()
+            self._game_start_fen = None
+            for i, move in enumerate(moves):
+                if not self.is_move_correct(move):
+                    if i > 0:
+                        self._put(f"position fen {fen_before_moves} moves {' '.join(moves[:i])}")
+                    raise ValueError(f"Cannot make move: {move}")
+                self._board.push_uci(move)
+            self._put(f"position fen {fen_before_moves} moves {' '.join(moves)}")
+            return
         for move in moves:
             if not self.is_move_correct(move):
                 raise ValueError(f"Cannot make move: {move}")
@@ -406,11 +525,11 @@ class Stockfish:
         if not perspective_white and self._board_visual_black_perspective is not None:
             return self._board_visual_black_perspective
 
-        self._put("d")
+        visual_lines = iter(self._board_visual_lines())
         board_rep_lines: List[str] = []
         count_lines: int = 0
         while count_lines < 17:
-            board_str: str = self._read_line()
+            board_str: str = next(visual_lines)
             if "+" in board_str or "|" in board_str:
                 count_lines += 1
                 if perspective_white:
@@ -425,15 +544,13 @@ class Stockfish:
                     board_rep_lines.append(f"{board_part[::-1]}{number_part}")
         if not perspective_white:
             board_rep_lines = board_rep_lines[::-1]
-        board_str = self._read_line()
+        board_str = next(visual_lines)
         if "a   b   c" in board_str:
             # Engine being used is recent enough to have coordinates, so add them:
             if perspective_white:
                 board_rep_lines.append(f"  {board_str}")
             else:
                 board_rep_lines.append(f"  {board_str[::-1]}")
-        self._discard_remaining_stdout_lines("Checkers")
-        # "Checkers" is in the last line outputted by Stockfish for the "d" command.
         board_rep = "\n".join(board_rep_lines) + "\n"
 
         if perspective_white:
@@ -443,6 +560,27 @@ class Stockfish:
 
         return board_rep
 
+    def _board_visual_lines(self) -> List[str]:
+        """Returns the lines of the `d` command's output up to the file coordinates under the board,
+        drawn from the local mirror of the position, or (if there isn't one) by asking the engine."""
+        if self._board is not None:
+            border = "+---+---+---+---+---+---+---+---+"
+            lines: List[str] = []
+            for rank in range(7, -1, -1):
+                pieces = [self._board.piece_at(rank * 8 + file) for file in range(8)]
+                lines.append(border)
+                lines.append(
+                    "| " + " | ".join(p.symbol() if p else " " for p in pieces) + f" | {rank + 1}"
+                )
+            return lines + [border, "a   b   c   d   e   f   g   h"]
+        self._put("d")
+        lines = []
+        while "a   b   c" not in (line := self._read_line()) and not line.startswith("Fen:"):
+            lines.append(line)
+        self._discard_remaining_stdout_lines("Checkers")
+        # "Checkers" is in the last line outputted by Stockfish for the "d" command.
+        return lines + [line]
+
     def get_fen_position(self) -> str:
         """Returns current board position in Forsyth-Edwards notation (FEN).
 
@@ -451,6 +589,8 @@ class Stockfish:
 
             For example: `rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1`
         """
+        if self._board is not None:
+            return self._board.fen()
         self._put("d")
         while True:
             text = self._read_line()
@@ -717,6 +857,11 @@ class Stockfish:
         Example:
             >>> is_correct = stockfish.is_move_correct("f4f5")
         """
+        if self._board is not None:
+            try:
+                return bool(self._board.parse_uci(move_value))
+            except ValueError:
+                return False
         old_self_info = self.info
         self._put(f"go depth 1 searchmoves {move_value}")
         is_move_correct = self._get_best_move_from_sf_popen_process() is not None
@@ -756,14 +901,7 @@ class Stockfish:
         Returns:
             `True` if Stockfish has the `WDL` option, otherwise `False`.
         """
-        self._put("uci")
-        while True:
-            splitted_text = self._read_line().split(" ")
-            if splitted_text[0] == "uciok":
-                return False
-            elif "UCI_ShowWDL" in splitted_text:
-                self._discard_remaining_stdout_lines("uciok")
-                return True
+        return self._probe["wdl"]
 
     def get_evaluation(
         self, searchtime: Optional[int] = None
@@ -834,11 +972,14 @@ class Stockfish:
                 else:
                     return float(static_eval) * compare
 
+    @profiling.timed("engine_search")
     def get_top_moves(
         self,
         num_top_moves: int = 5,
         verbose: bool = False,
         num_nodes: int = 0,
+        movetime: int = 0,
+        searchmoves: Optional[List[str]] = None,
     ) -> List[dict]:
         """Returns info on the top moves in the position.
 
@@ -857,13 +998,22 @@ class Stockfish:
               Option to search until a certain number of nodes have been searched, instead of depth.
               Default is 0.
 
+            movetime:
+              Option to search for a certain number of milliseconds, instead of depth (if `num_nodes`
+              is 0). The top moves are then those of the deepest iteration the search got to.
+              Default is 0.
+
+            searchmoves:
+              Option to only consider these moves (in full algebraic notation) as the top moves.
+              Default is `None`, for all legal moves.
+
         Returns:
             A list of dictionaries, where each dictionary contains keys for `Move`, `Centipawn`, and `Mate`.
             The corresponding value for either the `Centipawn` or `Mate` key will be `None`.
             If there are no moves in the position, an empty list is returned.
 
-            If `verbose` is `True`, the dictionary will also include the following keys: `SelectiveDepth`, `Time`,
-            `Nodes`, `NodesPerSecond`, `MultiPVLine`, and `WDL` (if available).
+            If `verbose` is `True`, the dictionary will also include the following keys: `Depth`, `SelectiveDepth`,
+            `Time`, `Nodes`, `NodesPerSecond`, `MultiPVLine`, and `WDL` (if available).
 
         Example:
             >>> moves = stockfish.get_top_moves(2, num_nodes=1000000, verbose=True)
@@ -885,19 +1035,21 @@ class Stockfish:
         if num_top_moves != self._parameters["MultiPV"]:
             self._set_option("MultiPV", num_top_moves)
 
-        # start engine. will go until reaches self._depth or self._num_nodes
-        if num_nodes == 0:
-            self._go()
-        else:
+        # start engine. will go until reaches self._depth, self._num_nodes, or movetime
+        searchmoves_str = f" searchmoves {' '.join(searchmoves)}" if searchmoves else ""
+        if num_nodes > 0:
             self._num_nodes = num_nodes
-            self._go_nodes()
+            self._go_nodes(searchmoves_str)
+        elif movetime > 0:
+            self._go_time(movetime, searchmoves_str)
+        else:
+            self._go(searchmoves_str)
 
-        lines: List[List[str]] = [
-            line.split(" ") for line in self._get_sf_go_command_output()
-        ]
+        final_lines: Dict[int, Dict[bytes, Any]] = self._read_final_multipv_lines(
+            num_nodes, movetime > 0
+        )
 
-        # Stockfish is now done evaluating the position,
-        # and the output is stored in the list 'lines'
+        # Stockfish is now done evaluating the position.
         top_moves: List[dict] = []
 
         # Set perspective of evaluations. If get_turn_perspective() is True, or white to move,
@@ -906,61 +1058,30 @@ class Stockfish:
             1 if self.get_turn_perspective() or ("w" in self.get_fen_position()) else -1
         )
 
-        # loop through Stockfish output lines in reverse order
-        for line in reversed(lines):
-            # If the line is a "bestmove" line, and the best move is "(none)", then
-            # there are no top moves, and we're done. Otherwise, continue with the next line.
-            if line[0] == "bestmove":
-                if line[1] == "(none)":
-                    top_moves = []
-                    break
-                continue
-
-            # if the line has no relevant info, we're done
-            if ("multipv" not in line) or ("depth" not in line):
-                break
-
-            # if we're searching depth and the line is not our desired depth, we're done
-            if (num_nodes == 0) and (int(self._pick(line, "depth")) != self._depth):
-                break
-
-            # if we're searching nodes and the line has less than desired number of nodes, we're done
-            if (num_nodes > 0) and (int(self._pick(line, "nodes")) < self._num_nodes):
-                break
-
+        for multipv in sorted(final_lines):
+            fields = final_lines[multipv]
             move_evaluation: Dict[str, Union[str, int, None]] = {
-                # get move
-                "Move": self._pick(line, "pv"),
-                # get cp if available
-                "Centipawn": int(self._pick(line, "cp")) * perspective
-                if "cp" in line
-                else None,
-                # get mate if available
-                "Mate": int(self._pick(line, "mate")) * perspective
-                if "mate" in line
-                else None,
+                "Move": fields[b"pv"].decode(),
+                "Centipawn": int(fields[b"cp"]) * perspective if b"cp" in fields else None,
+                "Mate": int(fields[b"mate"]) * perspective if b"mate" in fields else None,
             }
 
             # add more info if verbose
             if verbose:
-                move_evaluation["Time"] = self._pick(line, "time")
-                move_evaluation["Nodes"] = self._pick(line, "nodes")
-                move_evaluation["MultiPVLine"] = self._pick(line, "multipv")
-                move_evaluation["NodesPerSecond"] = self._pick(line, "nps")
-                move_evaluation["SelectiveDepth"] = self._pick(line, "seldepth")
+                move_evaluation["Depth"] = fields[b"depth"].decode()
+                move_evaluation["Time"] = fields[b"time"].decode()
+                move_evaluation["Nodes"] = fields[b"nodes"].decode()
+                move_evaluation["MultiPVLine"] = fields[b"multipv"].decode()
+                move_evaluation["NodesPerSecond"] = fields[b"nps"].decode()
+                move_evaluation["SelectiveDepth"] = fields[b"seldepth"].decode()
 
                 # add wdl if available
                 if self.does_current_engine_version_have_wdl_option():
                     move_evaluation["WDL"] = " ".join(
-                        [
-                            self._pick(line, "wdl", 1),
-                            self._pick(line, "wdl", 2),
-                            self._pick(line, "wdl", 3),
-                        ][::perspective]
+                        x.decode() for x in fields[b"wdl"][::perspective]
                     )
 
-            # add move to list of top moves
-            top_moves.insert(0, move_evaluation)
+            top_moves.append(move_evaluation)
 
         # reset MultiPV to global value
         if old_multipv != self._parameters["MultiPV"]:
@@ -972,6 +1093,40 @@ class Stockfish:
 
         return top_moves
 
+    def _read_final_multipv_lines(
+        self, num_nodes: int, any_depth: bool = False
+    ) -> Dict[int, Dict[bytes, Any]]:
+        """Precondition - a "go" command must have been sent to SF before calling this function.
+
+        Reads the search's output up to the "bestmove" line, and returns the fields of the last line
+        for each multipv that reached the final depth (or at least `num_nodes` nodes, if that's
+        nonzero, or any depth if `any_depth`), keyed by the multipv number. Lines for earlier depths are passed over without being
+        decoded or tokenized. Returns an empty dict if the position has no legal moves."""
+        final_depth_prefix = b"info depth %d " % self._depth
+        final_lines: Dict[int, Dict[bytes, Any]] = {}
+        while not (line := self._read_raw_line()).startswith(b"bestmove"):
+            if b" multipv " not in line:
+                continue
+            if num_nodes == 0 and not any_depth and not line.startswith(final_depth_prefix):
+                continue
+            if num_nodes > 0 and int(self._INFO_NODES.search(line)[1]) < self._num_nodes:
+                continue
+            fields = self._tokenize_info_line(line)
+            final_lines[int(fields[b"multipv"])] = fields
+        if line.split()[1] == b"(none)":
+            return {}
+        return final_lines
+
+    def _tokenize_info_line(self, line: bytes) -> Dict[bytes, Any]:
+        """Returns the fields of an 'info' line in one pass, with 'pv' being the first move of the
+        line and 'wdl' (if present) being a list of the three numbers."""
+        fields: Dict[bytes, Any] = {}
+        for key, value in self._INFO_FIELDS.findall(line):
+            fields.setdefault(key, value)
+        if wdl := self._INFO_WDL.search(line):
+            fields[b"wdl"] = list(wdl.groups())
+        return fields
+
     def get_perft(self, depth: int) -> Tuple[int, dict[str, int]]:
         """Returns perft information of the current position for a given depth
 
@@ -1012,9 +1167,10 @@ class Stockfish:
     def flip(self) -> None:
         """Flip the side to move"""
         self._put("flip")
-
-    def _pick(self, line: list[str], value: str = "", index: int = 1) -> str:
-        return line[line.index(value) + index]
+        self._game_start_fen = None
+        if self._board is not None:
+            self._board = self._board.mirror()
+            # Stockfish's flip mirrors the board vertically and swaps the colours, as this does.
 
     def get_what_is_on_square(self, square: str) -> Optional[Piece]:
         """Returns what is on the specified square.
@@ -1043,6 +1199,11 @@ class Stockfish:
             raise ValueError(
                 "square argument to the get_what_is_on_square function isn't valid."
             )
+        if self._board is not None:
+            import chess
+
+            piece = self._board.piece_at(chess.parse_square(f"{file_letter}{rank_num}"))
+            return None if piece is None else Stockfish.Piece(piece.symbol())
         rank_visual: str = self.get_board_visual().splitlines()[17 - 2 * rank_num]
         piece_as_char: str = rank_visual[2 + (ord(file_letter) - ord("a")) * 4]
         return None if piece_as_char == " " else Stockfish.Piece(piece_as_char)
@@ -1126,15 +1287,54 @@ class Stockfish:
         """
         return self._version["is_dev_build"]
 
-    def _set_stockfish_version(self) -> None:
+    def _probe_cache_key(self) -> Optional[str]:
+        """Identifies the engine binary by its path, size, and modification time."""
+        resolved_path = shutil.which(self._path)
+        if resolved_path is None:
+            return None
+        stat = os.stat(resolved_path)
+        return f"{os.path.realpath(resolved_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    @classmethod
+    def _loaded_probe_cache(cls) -> Dict[str, dict]:
+        if cls._probe_cache is None:
+            cls._probe_cache = {}
+            if cls.PROBE_CACHE_FILE is not None and os.path.isfile(cls.PROBE_CACHE_FILE):
+                with open(cls.PROBE_CACHE_FILE) as f:
+                    cls._probe_cache = json.load(f)
+        return cls._probe_cache
+
+    def _get_engine_probe(self) -> dict:
+        """Returns the engine's version text, the names of its options, and whether it has the
+        UCI_ShowWDL option -- from the probe cache if this binary has been probed before."""
         self._put("uci")
-        # read version text:
-        while True:
-            line = self._read_line()
-            if line.startswith("id name"):
-                self._discard_remaining_stdout_lines("uciok")
-                self._parse_stockfish_version(line.split(" ")[3])
-                return
+        # Sent either way, since UCI has it be the first command an engine gets.
+        key = self._probe_cache_key()
+        probe_cache = Stockfish._loaded_probe_cache()
+        if key is not None and key in probe_cache:
+            self._discard_remaining_stdout_lines("uciok")
+            return probe_cache[key]
+        probe = self._probe_engine()
+        if key is not None:
+            probe_cache[key] = probe
+            if Stockfish.PROBE_CACHE_FILE is not None:
+                os.makedirs(os.path.dirname(Stockfish.PROBE_CACHE_FILE) or ".", exist_ok=True)
+                temp_path = f"{Stockfish.PROBE_CACHE_FILE}.{os.getpid()}.tmp"
+                with open(temp_path, "w") as f:
+                    json.dump(probe_cache, f)
+                os.replace(temp_path, Stockfish.PROBE_CACHE_FILE)
+        return probe
+
+    def _probe_engine(self) -> dict:
+        """Reads the version and the option names from the output of `uci`."""
+        probe: dict = {"version_text": "", "options": []}
+        while (line := self._read_line()) != "uciok":
+            if line.startswith("id name") and not probe["version_text"]:
+                probe["version_text"] = line.split(" ")[3]
+            elif line.startswith("option name "):
+                probe["options"].append(line[len("option name ") :].split(" type ")[0])
+        probe["wdl"] = "UCI_ShowWDL" in probe["options"]
+        return probe
 
     def _parse_stockfish_version(self, version_text: str = "") -> None:
         try:
@@ -1,13 +1,36 @@
 from __future__ import annotations
+import json
 import os
-from typing import Optional
-
-import rich.console
-from rich.style import Style
+import shutil
+from typing import IO, Optional, Any, TYPE_CHECKING
+from contextlib import nullcontext
 
 from Specs import Specs
+import profiling
+
+if TYPE_CHECKING:
+    import rich.console
+    from analysis import AnalysisResult
+
+_console: Optional[rich.console.Console] = None
+_console_lock: Optional[Any] = None
+
+def set_console_lock(lock: Any) -> None:
+    """Called in each worker process when several pgn sources are processed at once, so that
+       everything printed for one hit stays together on the console."""
+    global _console_lock
+    _console_lock = lock
+
+def console_lock() -> Any:
+    return _console_lock if _console_lock is not None else nullcontext()
 
-console = rich.console.Console()
+def console() -> rich.console.Console:
+    """Returns the console for printing in color, with rich only being imported the first time."""
+    global _console
+    if _console is None:
+        import rich.console
+        _console = rich.console.Console()
+    return _console
 
 class Output:
     """Represents a number of variables used in outputting results to the user on games found."""
@@ -16,6 +39,12 @@ class Output:
         self._output_str = self._secondary_output_str = ''
         self._hits = self._secondary_hits = self._num_games_parsed = 0
         self._newest_hit: Optional[str] = None
+        self._analyses: list[list[dict]] = []
+        """For each hit with analyses, the json of the engine's analyses of it."""
+        self._spill_paths: dict[str, str] = {}
+        """The files the output strings and analyses have been moved to (see shed_memory), if they have been."""
+        self._spill_sizes: dict[str, int] = {}
+        """The sizes of the spill files as of the last checkpoint of the search."""
 
     def increment_hits(self, secondary_one: bool = False) -> None:
         if secondary_one:
@@ -28,6 +57,9 @@ class Output:
         self._num_games_parsed += 1
         self.clear_newest_hit()
 
+    def add_games_parsed(self, num_games: int) -> None:
+        self._num_games_parsed += num_games
+
     def append_to_output_str(self, append: str, secondary_one: bool = False) -> None:
         if secondary_one:
             self._secondary_output_str += append
@@ -35,9 +67,12 @@ class Output:
             self._output_str += append
 
     def add_newest_hit(self, newest_hit: str, update_primary_vars: bool = True,
-                       update_secondary_vars: bool = False) -> None:
+                       update_secondary_vars: bool = False,
+                       analyses: Optional[list[AnalysisResult]] = None) -> None:
         assert self._newest_hit is None
         self._newest_hit = f"{newest_hit}\n\n\n"
+        if analyses:
+            self._analyses.append([x.to_json() for x in analyses])
         if update_primary_vars:
             self.append_to_output_str(self._newest_hit)
             self.increment_hits()
@@ -45,6 +80,46 @@ class Output:
             self.append_to_output_str(self._newest_hit, True)
             self.increment_hits(True)
 
+    def shed_memory(self, specs: Specs) -> None:
+        """Moves the output strings and analyses held so far to files in the results folder, to free the memory
+           they take up. They're still written to the results files, but no longer printed with each update."""
+        os.makedirs('results', exist_ok=True)
+        for key, text in (('primary', self._output_str), ('secondary', self._secondary_output_str),
+                          ('analyses', ''.join(json.dumps({"analyses": x}) + "\n" for x in self._analyses))):
+            if text:
+                is_new = key not in self._spill_paths
+                path = self._spill_paths.setdefault(
+                    key, os.path.join('results', f"{specs.filename_of_output()}-{key}.spill")
+                )
+                with open(path, "w" if is_new else "a") as f:
+                    # Overwriting at first, since the file could be left over from a crashed run of the search.
+                    f.write(text)
+        self._output_str = self._secondary_output_str = ''
+        self._analyses = []
+
+    def record_spill_sizes(self) -> None:
+        """Called when the search is checkpointed, so that a resumed search can go back to these sizes."""
+        self._spill_sizes = {key: os.path.getsize(path) for key, path in self._spill_paths.items()}
+
+    def rewind_spill_files(self) -> None:
+        """Called when the search is resumed from a checkpoint: removes what was moved to the spill files
+           after the checkpoint, since those hits are from games the resumed search will search again."""
+        for key, path in self._spill_paths.items():
+            with open(path, "a") as f:
+                f.truncate(self._spill_sizes[key])
+
+    def remove_spill_files(self) -> None:
+        for path in self._spill_paths.values():
+            if os.path.exists(path):
+                os.remove(path)
+        self._spill_paths.clear()
+
+    def _write_spilled(self, key: str, f: IO[str]) -> None:
+        """Writes what was moved to a file by shed_memory for the key (if anything) to `f`."""
+        if (path := self._spill_paths.get(key)) is not None:
+            with open(path) as spill:
+                shutil.copyfileobj(spill, f)
+
     def clear_newest_hit(self) -> None:
         self._newest_hit = None
 
@@ -68,6 +143,7 @@ class Output:
         if specs.type_of_position() != 'name' or specs.verbose_for_name_feature():
             print(self.newest_hit())
             return
+        from rich.style import Style
         line, rem_lines = self.newest_hit().split('\n', 1)
         texts = {
             'players': line.split(', opening: ')[0],
@@ -87,11 +163,16 @@ class Output:
             if k != 'players':
                 print(f", {k}: ", end='')
             color = "#ff5555" if k == red_key else "#0000ee" if 'https' in text else "#ffffff"
-            console.print(text, end='', highlight=False, style=Style(color=color))
+            console().print(text, end='', highlight=False, style=Style(color=color))
         print('\n' + rem_lines)
 
+    @profiling.timed("output")
     def print_and_write_data(self, specs: Specs) -> None:
         """Prints the data and writes it to a file."""
+        with console_lock():
+            self._print_and_write_data(specs)
+
+    def _print_and_write_data(self, specs: Specs) -> None:
         os.makedirs((folder_name := 'results'), exist_ok=True)
         output_filename = os.path.join(folder_name, specs.filename_of_output())
         if specs.type_of_position() == "underpromotion":
@@ -103,11 +184,13 @@ class Output:
             print(f"#Games parsed: {self.num_games()}")
 
             f = open(f"{output_filename}-games where underpromotion is best move.pgn", "w")
+            self._write_spilled('secondary', f)
             f.write(f"{self.output_str(True)}#Games parsed: {self.num_games()}\nHit counter: " +
                     f"{self.num_hits(True)}\n\n")
             f.close()
 
             f = open(f"{output_filename}-games where underpromotion is best and player missed it.pgn", "w")
+            self._write_spilled('primary', f)
             f.write(f"{self.output_str()}#Games parsed: {self.num_games()}\nHit counter: " +
                     f"{self.num_hits()}\n\n")
             f.close()
@@ -122,6 +205,11 @@ class Output:
                 print(f"Hit from {source_name}:")
                 self.print_newest_hit(specs)
             f = open(f"{output_filename}.pgn", "w")
+            self._write_spilled('primary', f)
             f.write(f"{self.output_str()}#Games parsed: {self.num_games()}\nHit counter: " +
                     f"{self.num_hits()}\n\n")
             f.close()
+            if self._analyses or 'analyses' in self._spill_paths:
+                with open(f"{output_filename}-analyses.jsonl", "w") as f:
+                    self._write_spilled('analyses', f)
+                    f.writelines(json.dumps({"analyses": x}) + "\n" for x in self._analyses)
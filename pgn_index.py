@@ -0,0 +1,25 @@
+from __future__ import annotations
+from typing import Iterator
+
+def game_offsets(path: str) -> Iterator[int]:
+    """Yields the byte offset of the start of each game in the pgn file, where a game starts at the
+       first header line after some non-header line (or at the start of the file)."""
+    with open(path, 'rb') as f:
+        offset = 0
+        prev_line_is_header = False
+        for line in f:
+            is_header = line.lstrip(b'\xef\xbb\xbf').startswith(b'[')
+            if is_header and not prev_line_is_header:
+                yield offset
+            prev_line_is_header = is_header
+            offset += len(line)
+
+def shards(path: str, games_per_shard: int) -> list[tuple[int, int]]:
+    """Splits the pgn file into shards of (at most) `games_per_shard` games each.
+       Returns a list of (byte offset of the shard's first game, number of games in the shard)."""
+    assert games_per_shard > 0
+    offsets = list(game_offsets(path))
+    return [
+        (offsets[i], min(games_per_shard, len(offsets) - i))
+        for i in range(0, len(offsets), games_per_shard)
+    ]
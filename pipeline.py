@@ -0,0 +1,301 @@
+"""A search split into three phases that can each run (and be re-run) on their own, and on different machines:
+
+1. Extract (`--extract=DIR`): the games are streamed as usual, but rather than being checked, the positions
+   that would be (after the move to begin at, the position selection and dedup) are written to EPD shards in
+   DIR, each position once per source with the games and plies it came from. This is the cheap part.
+2. Analyse (`--analyse=DIR`): the positions of the shards are checked against the bounds by a pool of
+   engines, with the results written next to the shards (in a folder for the bounds and analysis limits, so
+   that the same extraction can be analysed with different bounds).
+3. Join (`--join=DIR/analysis-...`): the hits are matched back to their games, which are read (and only
+   those) to write the usual results files.
+
+A rerun of a phase carries on from where it left off: sources already extracted and shards already
+analysed are skipped.
+"""
+
+from __future__ import annotations
+from copy import deepcopy
+from dataclasses import dataclass
+import glob
+import hashlib
+import json
+import os
+import pickle
+import re
+import shutil
+import time
+from typing import TYPE_CHECKING, Any, Callable, Optional, TextIO
+
+from analysis import AnalysisCache, AnalysisProfile, AnalysisResult
+from engine import LazyEngine
+from output_obj import console_lock, set_console_lock
+
+if TYPE_CHECKING:
+    import chess
+    from Specs import Specs
+    from tablebase import Tablebase
+
+POSITIONS_PER_SHARD = 10000
+SOURCE_FILE = 'source.pickle'
+"""Written once a source has been extracted in full, with what the later phases need to know about it."""
+META_FILE = 'meta.json'
+REPEATS_FILE = 'repeats.txt'
+"""The games and plies reaching positions already written to an earlier shard of the source, by the fen."""
+FEATURES = ('top moves', 'skip move')
+
+def source_key(pgn: str) -> str:
+    """The name of the folder in the extraction for the pgn source (unique even for sources with the same
+       file name in different folders)."""
+    stem = re.sub(r'[^A-Za-z0-9_-]', '_', os.path.splitext(os.path.basename(pgn))[0])
+    return f"{stem}-{hashlib.blake2b(os.path.abspath(pgn).encode(), digest_size=4).hexdigest()}"
+
+@dataclass
+class ExtractedSource:
+    specs: Specs
+    process_args: tuple
+    num_games: int
+
+def is_extracted(directory: str, pgn: str) -> bool:
+    return os.path.isfile(os.path.join(directory, source_key(pgn), SOURCE_FILE))
+
+def extracted_sources(directory: str) -> dict[str, ExtractedSource]:
+    """Returns the sources extracted in full to the directory, by their folders."""
+    sources = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*', SOURCE_FILE))):
+        with open(path, 'rb') as f:
+            sources[os.path.dirname(path)] = pickle.load(f)
+    return sources
+
+class PositionWriter:
+    """Phase one, for a source: collects the positions to check, and writes them to the source's shards.
+       A position that several games reach is written once, with the references of the games reaching it
+       while it's in the shard being collected, and those of the later ones in the source's REPEATS_FILE."""
+
+    def __init__(self, directory: str, specs: Specs, process_args: tuple) -> None:
+        assert specs.type_of_position() in FEATURES
+        self._folder = os.path.join(directory, source_key(specs.pgn()))
+        shutil.rmtree(self._folder, ignore_errors=True)
+        # Anything there is from an extraction of the source that didn't finish, which is started over.
+        os.makedirs(self._folder)
+        self._specs = specs
+        self._process_args = process_args
+        self._positions: dict[str, list[str]] = {}
+        """The EPD of each position (with its move counters), and the 'number:offset:ply' of each game reaching it."""
+        self._written: set[bytes] = set()
+        """Digests of the EPDs of the positions in the shards written so far."""
+        self._repeats: Optional[TextIO] = None
+        self._num_shards = self._num_positions = 0
+
+    def add(self, board: chess.Board, game_num: int, game_offset: int, ply: int) -> None:
+        epd = board.epd(hmvc=board.halfmove_clock, fmvn=board.fullmove_number)
+        ref = f"{game_num}:{game_offset}:{ply}"
+        self._num_positions += 1
+        if epd not in self._positions and epd_digest(epd) in self._written:
+            if self._repeats is None:
+                self._repeats = open(os.path.join(self._folder, REPEATS_FILE), 'w')
+            self._repeats.write(f"{board.fen()}\t{ref}\n")
+            return
+        self._positions.setdefault(epd, []).append(ref)
+        if len(self._positions) == POSITIONS_PER_SHARD:
+            self._write_shard()
+
+    def _write_shard(self) -> None:
+        path = os.path.join(self._folder, f"{self._num_shards:05d}.epd")
+        with open(f"{path}.tmp", 'w') as f:
+            f.writelines(f'{epd} id "{" ".join(refs)}";\n' for epd, refs in self._positions.items())
+        os.replace(f"{path}.tmp", path)
+        self._written.update(epd_digest(x) for x in self._positions)
+        self._positions = {}
+        self._num_shards += 1
+
+    def close(self, num_games: int) -> str:
+        """Writes the rest of the positions, and marks the source as extracted. Returns a report."""
+        if self._positions:
+            self._write_shard()
+        if self._repeats is not None:
+            self._repeats.close()
+        with open(temp_path := os.path.join(self._folder, f"{SOURCE_FILE}.tmp"), 'wb') as f:
+            pickle.dump(ExtractedSource(self._specs, self._process_args, num_games), f)
+        os.replace(temp_path, os.path.join(self._folder, SOURCE_FILE))
+        return (f"Extracted {self._num_positions} positions of {num_games} games to {self._num_shards} shards "
+                f"in {self._folder}")
+
+def epd_digest(epd: str) -> bytes:
+    """Kept for each position written rather than its EPD, since a source can have millions of them."""
+    return hashlib.blake2b(epd.encode(), digest_size=8).digest()
+
+def extracted_feature(directory: str) -> str:
+    """Returns the feature the positions in the extraction are for."""
+    features = {x.specs.type_of_position() for x in extracted_sources(directory).values()}
+    assert len(features) == 1, f"Expected the sources extracted to {directory} to be for one feature: {features}"
+    return features.pop()
+
+def analysis_folder(directory: str, feature: str, bounds: list[Optional[float]], analysis_option: Optional[str],
+                    syzygy_path: Optional[str]) -> str:
+    """The folder the phase two results for the bounds and analysis settings go in."""
+    settings = json.dumps([feature, bounds, analysis_option, syzygy_path])
+    return os.path.join(directory, f"analysis-{hashlib.blake2b(settings.encode(), digest_size=4).hexdigest()}")
+
+AnalysePosition = Callable[..., tuple[bool, list[AnalysisResult]]]
+"""Called with the engine, the fen, the feature, the bounds, the AnalysisProfile, the AnalysisCache and the
+   Tablebase (or None), and returns whether the position is a hit and the results of its checks."""
+
+_worker: Optional[tuple[LazyEngine, AnalysisCache, Optional[Tablebase]]] = None
+"""The engine, cache and tablebase that the shards analysed in this process share."""
+
+def init_worker(lock: Any, num_engines: int, syzygy_path: Optional[str]) -> None:
+    """Called once in each process analysing shards (so that its engine is started, and its tablebase opened,
+       just once, and its cache is kept from shard to shard)."""
+    global _worker
+    if lock is not None:
+        set_console_lock(lock)
+        from multiprocessing import util
+        util.Finalize(None, _close_worker, exitpriority=1)
+        # Run as the pool's process exits (which atexit functions aren't).
+    if syzygy_path is not None:
+        from tablebase import open_tablebase
+        tablebase = open_tablebase(syzygy_path)
+    else:
+        tablebase = None
+    _worker = (LazyEngine(num_engines=num_engines), AnalysisCache(), tablebase)
+
+def _close_worker() -> None:
+    global _worker
+    if _worker is not None:
+        engine, _, tablebase = _worker
+        engine.close()
+        if tablebase is not None:
+            tablebase.close()
+        _worker = None
+
+def analyse_shard(shard_path: str, results_path: str, feature: str, bounds: list[Optional[float]],
+                  analysis: AnalysisProfile, analyse_position: AnalysePosition) -> int:
+    """Phase two, for a shard: writes a json line for each of its positions, with the games and plies it came
+       from, whether it's a hit and the results of its checks. Returns the number of hits."""
+    import chess
+    assert _worker is not None
+    engine, cache, tablebase = _worker
+    num_hits = 0
+    with open(shard_path) as shard, open(f"{results_path}.tmp", 'w') as f:
+        for line in shard:
+            board, operations = chess.Board.from_epd(line)
+            satisfied, results = analyse_position(engine.get(), board.fen(), feature, bounds, analysis, cache,
+                                                  tablebase)
+            num_hits += satisfied
+            f.write(json.dumps({"fen": board.fen(), "refs": str(operations["id"]).split(), "satisfied": satisfied,
+                                "analyses": [x.to_json() for x in results]}) + "\n")
+    os.replace(f"{results_path}.tmp", results_path)
+    # Only once the shard is done, so that an interrupted shard is analysed again in full.
+    return num_hits
+
+def analyse(directory: str, bounds: list[Optional[float]], analysis: AnalysisProfile,
+            analysis_option: Optional[str], syzygy_path: Optional[str], part: tuple[int, int], jobs: int,
+            analyse_position: AnalysePosition) -> None:
+    """Phase two: analyses the shards of the extraction in `directory` not analysed with these settings yet.
+       With `part` (k, n), just the kth of every n shards are (so that n machines can split them)."""
+    sources = extracted_sources(directory)
+    feature = extracted_feature(directory)
+    folder = analysis_folder(directory, feature, bounds, analysis_option, syzygy_path)
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, META_FILE), 'w') as f:
+        json.dump({"feature": feature, "bounds": bounds, "analysis": analysis_option, "syzygy": syzygy_path}, f)
+    shards = [(shard_path, os.path.join(folder, os.path.basename(source_folder),
+                                        os.path.basename(shard_path).replace('.epd', '.jsonl')))
+              for source_folder in sources for shard_path in sorted(glob.glob(os.path.join(source_folder, '*.epd')))]
+    k, n = part
+    to_analyse = [(shard, results) for i, (shard, results) in enumerate(shards)
+                  if i % n == k and not os.path.isfile(results)]
+    print(f"Analysing {len(to_analyse)} of the {len(shards)} shards ({len(shards) - len(to_analyse)} done already "
+          f"or for other machines), with the results going to {folder}\n")
+    for _, results_path in to_analyse:
+        os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    num_engines = max(1, min(jobs, len(to_analyse)))
+    args = [(shard, results, feature, bounds, analysis, analyse_position) for shard, results in to_analyse]
+    if num_engines == 1:
+        init_worker(None, num_engines, syzygy_path)
+        num_hits = [analyse_shard(*x) for x in args]
+        _close_worker()
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        lock = multiprocessing.Lock()
+        with ProcessPoolExecutor(max_workers=num_engines, initializer=init_worker,
+                                 initargs=(lock, num_engines, syzygy_path)) as executor:
+            num_hits = list(executor.map(analyse_shard, *zip(*args)))
+    print(f"Found {sum(num_hits)} hits in {len(to_analyse)} shards. Once every shard is analysed, write the "
+          f"results files with 'python3 main.py --join={folder}'\n")
+
+class JoinedHits:
+    """Phase three, for a source: the hits phase two found in its positions, by the game and ply they're at."""
+
+    def __init__(self, results_folder: str, repeats_path: str, num_games: int) -> None:
+        self._num_games = num_games
+        self._games: set[tuple[int, int]] = set()
+        """The number and offset of each game with hits."""
+        self._hits: dict[tuple[int, int], list[AnalysisResult]] = {}
+        hits_by_fen: dict[str, list[AnalysisResult]] = {}
+        for path in sorted(glob.glob(os.path.join(results_folder, '*.jsonl'))):
+            with open(path) as f:
+                for line in f:
+                    if (data := json.loads(line))["satisfied"]:
+                        results = hits_by_fen[data["fen"]] = [AnalysisResult.from_json(x) for x in data["analyses"]]
+                        for ref in data["refs"]:
+                            self._add(ref, results)
+        if os.path.isfile(repeats_path):
+            with open(repeats_path) as f:
+                for line in f:
+                    fen, ref = line.rstrip("\n").split("\t")
+                    if (results := hits_by_fen.get(fen)) is not None:
+                        self._add(ref, results)
+        self._next_games = sorted(self._games, reverse=True)
+
+    def _add(self, ref: str, results: list[AnalysisResult]) -> None:
+        game_num, offset, ply = (int(x) for x in ref.split(':'))
+        self._games.add((game_num, offset))
+        self._hits[(offset, ply)] = results
+
+    def next_game(self) -> tuple[int, Optional[int]]:
+        """Returns the number and byte offset of the next game with hits. Once every one has been read, returns
+           one more than the number of games in the source, and None for the offset."""
+        if not self._next_games:
+            return self._num_games + 1, None
+        return self._next_games.pop()
+
+    def results(self, game_offset: int, ply: int) -> Optional[list[AnalysisResult]]:
+        """Returns the results of the checks of the position at the ply of the game, if it's a hit."""
+        return self._hits.get((game_offset, ply))
+
+def join(results_folder: str, process_pgn: Callable[..., None]) -> None:
+    """Phase three: writes the results files of each source from the hits in `results_folder`."""
+    with open(os.path.join(results_folder, META_FILE)) as f:
+        meta = json.load(f)
+    sources = extracted_sources(os.path.dirname(os.path.normpath(results_folder)))
+    num_shards = sum(len(glob.glob(os.path.join(x, '*.epd'))) for x in sources)
+    num_analysed = sum(len(glob.glob(os.path.join(results_folder, os.path.basename(x), '*.jsonl'))) for x in sources)
+    if num_analysed < num_shards:
+        print(f"Warning: only {num_analysed} of the {num_shards} shards have been analysed, so hits in the rest "
+              f"are missing\n")
+    for source_folder, source in sources.items():
+        specs = deepcopy(source.specs)
+        specs.set_output_filename(str(time.time_ns()))
+        specs.set_extract_dir(None)
+        specs.stop_skipping_games()
+        specs.set_joined_hits(JoinedHits(os.path.join(results_folder, os.path.basename(source_folder)),
+                                         os.path.join(source_folder, REPEATS_FILE), source.num_games))
+        for clear in (specs.set_position_selection, specs.set_trajectory_pruner, specs.set_prefilter,
+                      specs.set_dedup_path, specs.set_memory_monitor, specs.set_sample):
+            clear(None)
+        # The positions were already selected in phase one, and hits are only looked up now.
+        with console_lock():
+            print(f"Results for {specs.pgn()}:\n\n")
+        process_pgn(specs, *source.process_args[:3], meta["bounds"])
+        with console_lock():
+            print("****===================================****\n\n")
+
+def part_from_option(option: Optional[str]) -> tuple[int, int]:
+    """Returns (k, n) for the `--part=K/N` option (K counting from 1), or (0, 1) for all of the shards."""
+    if option is None:
+        return 0, 1
+    k, _, n = option.partition('/')
+    assert 1 <= int(k) <= int(n)
+    return int(k) - 1, int(n)
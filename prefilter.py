@@ -0,0 +1,103 @@
+"""A cheap first look at a position (its static eval, or a search of a few nodes), to skip the full
+bound checks for positions whose eval is too far outside the bounds to ever satisfy them."""
+
+from __future__ import annotations
+import math
+from typing import TYPE_CHECKING, Callable, Optional
+
+if TYPE_CHECKING:
+    from models import Stockfish
+
+MATE_SCORE = 100.0
+"""The eval (in pawns) a forced mate counts as."""
+
+class Prefilter:
+    SAMPLE_SIZE = 200
+    """The margin is learned from the error of the cheap eval on this many positions, during which
+       nothing is rejected yet."""
+    REFERENCE_DEPTH = 15
+    """The depth of the search the cheap eval is compared against while learning the margin."""
+    QUANTILE = 0.99
+    """The margin is this quantile of the cheap eval's errors in the sample (but at least MIN_MARGIN)."""
+    MIN_MARGIN = 0.2
+    VALIDATION_INTERVAL = 20
+    """Every this many rejected positions, the full check is done anyway, to measure the false reject rate."""
+
+    def __init__(self, kind: str = 'static', nodes: int = 0) -> None:
+        assert kind in ('static', 'nodes') and (kind == 'nodes') == (nodes > 0)
+        self._kind = kind
+        self._nodes = nodes
+        self._errors: list[float] = []
+        self._margin: Optional[float] = None
+        self._num_checked = self._num_rejected = self._num_validated = self._num_false_rejects = 0
+
+    def margin(self) -> Optional[float]:
+        """Returns the learned margin in pawns, or None while it's still being learned."""
+        return self._margin
+
+    def _eval(self, stockfish: Stockfish, eval_multiplier: int, num_nodes: int = 0,
+              depth: Optional[int] = None) -> Optional[float]:
+        """Returns the eval in the same terms as does_position_satisfy_bounds: the static eval if neither
+           `num_nodes` nor `depth` is given, else the top move's eval from a search with that limit."""
+        if not num_nodes and depth is None:
+            static_eval = stockfish.get_static_eval()
+            return None if static_eval is None else static_eval * eval_multiplier
+        if depth is not None:
+            old_depth = stockfish.get_depth()
+            stockfish.set_depth(depth)
+        top_moves = stockfish.get_top_moves(1, num_nodes=num_nodes)
+        if depth is not None:
+            stockfish.set_depth(old_depth)
+        if not top_moves:
+            return None
+        if top_moves[0]["Mate"] is not None:
+            return math.copysign(MATE_SCORE, top_moves[0]["Mate"] * eval_multiplier)
+        return top_moves[0]["Centipawn"] * eval_multiplier * 0.01
+
+    def check(self, stockfish: Stockfish, fen: str, lower_bound: Optional[float], upper_bound: Optional[float],
+              full_check: Callable[[], bool]) -> bool:
+        """Returns whether the position satisfies `full_check`, which is skipped (returning False) if the
+           cheap eval is further than the margin outside the top move's bounds. The engine must already
+           be set to the position."""
+        if lower_bound is None and upper_bound is None:
+            return full_check()
+        self._num_checked += 1
+        eval_multiplier = 1 if "w" in fen else -1
+        estimate = self._eval(stockfish, eval_multiplier, self._nodes)
+        if self._margin is None:
+            reference = self._eval(stockfish, eval_multiplier, depth=self.REFERENCE_DEPTH)
+            if estimate is not None and reference is not None and max(abs(estimate), abs(reference)) < MATE_SCORE:
+                self._errors.append(abs(estimate - reference))
+                if len(self._errors) == self.SAMPLE_SIZE:
+                    self._errors.sort()
+                    self._margin = max(self.MIN_MARGIN,
+                                       self._errors[math.ceil(self.QUANTILE * len(self._errors)) - 1])
+            return full_check()
+        if estimate is None or not (
+            (lower_bound is not None and estimate + self._margin < lower_bound) or
+            (upper_bound is not None and estimate - self._margin > upper_bound)
+        ):
+            return full_check()
+        self._num_rejected += 1
+        if self._num_rejected % self.VALIDATION_INTERVAL:
+            return False
+        self._num_validated += 1
+        if satisfied := full_check():
+            self._num_false_rejects += 1
+        return satisfied
+
+    def report(self) -> str:
+        if self._margin is None:
+            return (f"Prefilter: still learning its margin ({len(self._errors)} of {self.SAMPLE_SIZE} "
+                    f"sample positions), so nothing was rejected")
+        false_reject_rate = self._num_false_rejects / self._num_validated if self._num_validated else 0.0
+        return (f"Prefilter ({self._kind} eval, margin {self._margin:.2f}): rejected {self._num_rejected} of "
+                f"{self._num_checked} positions; {self._num_false_rejects} of the {self._num_validated} "
+                f"rejects checked in full would have been hits (false reject rate {false_reject_rate:.1%})")
+
+def prefilter_from_option(option: Optional[str]) -> Optional[Prefilter]:
+    """Returns the prefilter for the `--prefilter=static|nodes:N` option (None if it wasn't given)."""
+    if option is None:
+        return None
+    kind, _, value = (option or 'static').lower().partition(':')
+    return Prefilter(kind, int(value or '0'))
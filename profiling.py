@@ -0,0 +1,128 @@
+"""Timers and counters for the stages of a search (parsing the pgn, pushing moves, building fens, talking
+to the engine, writing output), cheap enough to always be on. With `--profile`, they're written
+periodically to a json file and a Prometheus text-format file next to the results file."""
+
+from __future__ import annotations
+import functools
+import json
+import os
+import time
+from typing import Any, Callable, TypeVar
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+class Timer:
+    __slots__ = ('calls', 'seconds', '_start')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        self._start = 0.0
+
+    def __enter__(self) -> Timer:
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.seconds += time.perf_counter() - self._start
+        self.calls += 1
+
+_timers: dict[str, Timer] = {}
+_counters: dict[str, int] = {}
+_start_time = time.time()
+
+def timer(stage: str) -> Timer:
+    """Returns the timer for the stage, to time a block of code with `with timer(stage):`. The blocks
+       timed for one stage shouldn't be nested, but the stages can be (e.g., engine searches within a check)."""
+    if (t := _timers.get(stage)) is None:
+        t = _timers[stage] = Timer()
+    return t
+
+def timed(stage: str) -> Callable[[F], F]:
+    """Decorates a function to time each call of it for the stage. Since the timer itself costs about a
+       microsecond per call, this is for the likes of searches and checks rather than each line the
+       engine prints."""
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with timer(stage):
+                return func(*args, **kwargs)
+        return wrapper # type: ignore[return-value]
+    return decorator
+
+def count(name: str, n: int = 1) -> None:
+    _counters[name] = _counters.get(name, 0) + n
+
+def counter(name: str) -> int:
+    return _counters.get(name, 0)
+
+def reset() -> None:
+    global _start_time
+    _timers.clear()
+    _counters.clear()
+    _start_time = time.time()
+
+def snapshot() -> dict:
+    return {
+        "elapsed_seconds": time.time() - _start_time,
+        "stages": {name: {"calls": t.calls, "seconds": t.seconds} for name, t in sorted(_timers.items())},
+        "counters": dict(sorted(_counters.items())),
+    }
+
+def prometheus_text(source: str) -> str:
+    """Returns the snapshot in the Prometheus text exposition format, with the source as a label."""
+    source = source.replace('\\', '\\\\').replace('"', '\\"')
+    data = snapshot()
+    lines = [
+        "# HELP position_finder_elapsed_seconds Seconds since the search started.",
+        "# TYPE position_finder_elapsed_seconds gauge",
+        f'position_finder_elapsed_seconds{{source="{source}"}} {data["elapsed_seconds"]:.3f}',
+        "# HELP position_finder_stage_seconds_total Seconds spent in each stage.",
+        "# TYPE position_finder_stage_seconds_total counter",
+        *(f'position_finder_stage_seconds_total{{source="{source}",stage="{name}"}} {t["seconds"]:.6f}'
+          for name, t in data["stages"].items()),
+        "# HELP position_finder_stage_calls_total Times each stage was entered.",
+        "# TYPE position_finder_stage_calls_total counter",
+        *(f'position_finder_stage_calls_total{{source="{source}",stage="{name}"}} {t["calls"]}'
+          for name, t in data["stages"].items()),
+        "# HELP position_finder_events_total Counts of games, positions, engine commands, etc.",
+        "# TYPE position_finder_events_total counter",
+        *(f'position_finder_events_total{{source="{source}",event="{name}"}} {n}'
+          for name, n in data["counters"].items()),
+    ]
+    return "\n".join(lines) + "\n"
+
+def summary() -> str:
+    """Returns the share of the elapsed time spent in each stage, largest first. Some stages are within
+       others (e.g., engine searches within checks), so their shares overlap."""
+    data = snapshot()
+    elapsed = max(data["elapsed_seconds"], 1e-9)
+    return "Time per stage: " + ", ".join(
+        f"{name} {t['seconds']:.1f}s ({t['seconds'] / elapsed:.0%})"
+        for name, t in sorted(data["stages"].items(), key=lambda x: -x[1]["seconds"])
+    )
+
+def _write_atomically(path: str, text: str) -> None:
+    with open(temp_path := f"{path}.tmp", "w") as f:
+        f.write(text)
+    os.replace(temp_path, path)
+    # So a scraper never reads a half-written file.
+
+class Exporter:
+    """Writes the timers and counters to `{path_prefix}.json` and `{path_prefix}.prom` every `interval` seconds."""
+
+    def __init__(self, path_prefix: str, source: str, interval: float) -> None:
+        self._path_prefix = path_prefix
+        self._source = source
+        self._interval = interval
+        self._last_write_time = time.monotonic()
+
+    def maybe_write(self) -> None:
+        if time.monotonic() - self._last_write_time >= self._interval:
+            self.write()
+
+    def write(self) -> None:
+        os.makedirs(os.path.dirname(self._path_prefix) or '.', exist_ok=True)
+        _write_atomically(f"{self._path_prefix}.json", json.dumps({"source": self._source, **snapshot()}, indent=2))
+        _write_atomically(f"{self._path_prefix}.prom", prometheus_text(self._source))
+        self._last_write_time = time.monotonic()
@@ -0,0 +1,40 @@
+"""A live progress line for each pgn source being searched (throughput, cache hit rate and ETA), written to
+stderr at most once per interval so that reporting costs next to nothing even on a fast 'name' search."""
+
+from __future__ import annotations
+import datetime
+import sys
+import time
+from typing import Optional
+
+from output_obj import console_lock
+import profiling
+
+class ProgressReporter:
+    def __init__(self, source: str, interval: float) -> None:
+        self._source = source
+        self._interval = interval
+        self._start_time = self._last_time = time.monotonic()
+        self._last_counts = (0, 0, 0)
+
+    def due(self) -> bool:
+        """Returns whether it's time for the next report (which is all that's checked for most games)."""
+        return time.monotonic() - self._last_time >= self._interval
+
+    def report(self, fraction: float, num_games: int, cache_hit_rate: Optional[float] = None) -> None:
+        """`fraction` is how much of the source has been searched (e.g., by the bytes read so far)."""
+        now = time.monotonic()
+        counts = (num_games, profiling.counter('positions'), profiling.timer('engine_search').calls)
+        seconds = max(now - self._last_time, 1e-9)
+        games_rate, positions_rate, searches_rate = ((x - y) / seconds for x, y in zip(counts, self._last_counts))
+        # The rates since the last report, so that they follow the search's current speed.
+        elapsed = now - self._start_time
+        eta = datetime.timedelta(seconds=round(elapsed * max(0.0, 1 - fraction) / fraction)) if fraction > 0 else '-'
+        # The pgn is read ahead of the games being searched, so `fraction` can reach 1 a little early.
+        line = (f"{self._source}: {fraction:.1%}, {counts[0]} games ({games_rate:.0f}/s), {counts[1]} positions "
+                f"({positions_rate:.0f}/s), {searches_rate:.1f} engine searches/s")
+        if cache_hit_rate is not None:
+            line += f", cache hits {cache_hit_rate:.0%}"
+        with console_lock():
+            print(f"{line}, ETA {eta}", file=sys.stderr, flush=True)
+        self._last_time, self._last_counts = now, counts
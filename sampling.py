@@ -0,0 +1,86 @@
+"""A sampling mode for estimating what a full search of a source would take before committing to it: a
+random (but reproducible, for the same seed) subset of the source's games is searched, and the number of
+hits and the time the whole source would take are extrapolated from it, with confidence intervals."""
+
+from __future__ import annotations
+import datetime
+import math
+import random
+import statistics
+from typing import Optional
+
+import pgn_index
+
+class Sample:
+    Z_95 = 1.96
+    """For 95% confidence intervals, from the normal approximation to the distribution of the sample's mean."""
+
+    def __init__(self, path: str, start_offset: int, num_games: int, seed: int) -> None:
+        """Samples `num_games` of the games from byte `start_offset` of the pgn on (or all of them, if there
+           aren't that many), by the byte offsets of the starts of the games."""
+        assert num_games > 0
+        offsets = [x for x in pgn_index.game_offsets(path) if x >= start_offset]
+        self._population = len(offsets)
+        self._offsets = sorted(random.Random(seed).sample(offsets, min(num_games, len(offsets))))
+        # In file order, so that the file is still read front to back.
+        self._next_index = 0
+        self._seconds: list[float] = []
+        self._hits: dict[str, list[int]] = {}
+
+    def population(self) -> int:
+        return self._population
+
+    def next_offset(self) -> Optional[int]:
+        """Returns the byte offset of the next game to search, or None once the whole sample has been."""
+        if self._next_index == len(self._offsets):
+            return None
+        self._next_index += 1
+        return self._offsets[self._next_index - 1]
+
+    def fraction_searched(self) -> float:
+        return len(self._seconds) / max(1, len(self._offsets))
+
+    def record(self, seconds: float, hits: dict[str, int]) -> None:
+        """Records the time the game just searched took, and its number of hits of each kind."""
+        self._seconds.append(seconds)
+        for kind, num_hits in hits.items():
+            self._hits.setdefault(kind, []).append(num_hits)
+
+    def estimate(self, values: list[float]) -> tuple[float, float, float]:
+        """Returns the estimated total of the values over all the games of the source, and the bounds of its
+           95% confidence interval."""
+        n, total = len(values), self._population * statistics.fmean(values)
+        if not any(values):
+            return 0.0, 0.0, 3 * self._population / n
+            # The rule of three: with nothing in n games, the rate is below 3/n with 95% confidence (where the
+            # normal approximation would claim an interval of just 0).
+        if n < 2:
+            return total, 0.0, math.inf
+        half_width = (self.Z_95 * self._population * statistics.stdev(values) / math.sqrt(n) *
+                      math.sqrt(1 - n / self._population))
+        # With the finite population correction, since the sample is drawn without replacement (so a sample
+        # of the whole source has no uncertainty left).
+        return total, max(0.0, total - half_width), total + half_width
+
+    def report(self) -> Optional[str]:
+        if not self._seconds:
+            return None
+        lines = [f"Sampled {len(self._seconds)} of the {self._population} games (estimates for all of them, "
+                 f"with 95% confidence intervals):"]
+        for kind, values in self._hits.items():
+            total, low, high = self.estimate([float(x) for x in values])
+            lines.append(f"    {kind}: {total:.0f} ({low:.0f} to {high:.0f}), {sum(values)} in the sample")
+        total, low, high = self.estimate(self._seconds)
+        lines.append(f"    time: {format_seconds(total)} ({format_seconds(low)} to {format_seconds(high)})")
+        return "\n".join(lines)
+
+def format_seconds(seconds: float) -> str:
+    return str(datetime.timedelta(seconds=round(seconds))) if math.isfinite(seconds) else '?'
+
+def sample_from_option(option: Optional[str]) -> Optional[tuple[int, int]]:
+    """Returns the number of games and the seed for the `--sample[=GAMES[:SEED]]` option (None if it wasn't
+       given)."""
+    if option is None:
+        return None
+    num_games, _, seed = (option or '1000').partition(':')
+    return int(num_games), int(seed or '0')
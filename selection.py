@@ -0,0 +1,76 @@
+"""Narrows down which positions of a game are checked, beyond the move to begin at: up to an end ply, only
+every so many plies, only quiet positions (not in check, and not in the middle of an exchange, where evals
+swing meaninglessly), and at most so many per game. Since these are decided before the engine sees the
+position, each position left out is a search (or several) saved."""
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import chess
+
+class PositionSelection:
+    def __init__(self, end_ply: Optional[int] = None, stride: int = 1, quiet: bool = False,
+                 max_per_game: Optional[int] = None) -> None:
+        assert stride > 0 and (max_per_game is None or max_per_game > 0)
+        self._end_ply = end_ply
+        self._stride = stride
+        self._quiet = quiet
+        self._max_per_game = max_per_game
+        self._num_selected = 0
+        self._num_skipped = {reason: 0 for reason in ('end ply', 'stride', 'check', 'pending capture',
+                                                      'max per game')}
+
+    def is_game_done(self, ply: int, num_selected_in_game: int, last_ply: int) -> bool:
+        """Returns whether no more positions of the game are to be checked, with the game's positions from
+           `ply` up to `last_ply` counted as skipped if so."""
+        for reason, is_done in (('end ply', self._end_ply is not None and ply > self._end_ply),
+                                ('max per game', self._max_per_game is not None and
+                                                 num_selected_in_game >= self._max_per_game)):
+            if is_done:
+                self._num_skipped[reason] += max(0, last_ply - ply + 1)
+                return True
+        return False
+
+    def selects(self, board: chess.Board, plies_since_first: int) -> bool:
+        """Returns whether the position is to be checked, where `plies_since_first` counts from the first
+           position of the game that could be (so that the stride starts from it)."""
+        if plies_since_first % self._stride:
+            reason: Optional[str] = 'stride'
+        elif self._quiet and board.is_check():
+            reason = 'check'
+        elif self._quiet and is_capture_pending(board):
+            reason = 'pending capture'
+        else:
+            reason = None
+        if reason is not None:
+            self._num_skipped[reason] += 1
+            return False
+        self._num_selected += 1
+        return True
+
+    def report(self) -> Optional[str]:
+        if not (num_skipped := sum(self._num_skipped.values())):
+            return None
+        return (f"Position selection: {num_skipped} of {num_skipped + self._num_selected} positions skipped (" +
+                ", ".join(f"{reason}: {n}" for reason, n in self._num_skipped.items() if n) + ")")
+
+def is_capture_pending(board: chess.Board) -> bool:
+    """Returns whether the last move was a capture that the side to move can recapture."""
+    if not board.move_stack:
+        return False
+    last_move = board.pop()
+    try:
+        was_capture = board.is_capture(last_move)
+    finally:
+        board.push(last_move)
+    return was_capture and any(board.generate_legal_captures(to_mask=1 << last_move.to_square))
+
+def selection_from_options(end_ply: Optional[str], stride: Optional[str], quiet: Optional[str],
+                           max_per_game: Optional[str]) -> Optional[PositionSelection]:
+    """Returns the selection for the `--end-ply=N`, `--ply-stride=N`, `--quiet` and `--max-positions=N`
+       options (None if none of them were given)."""
+    if end_ply is None and stride is None and quiet is None and max_per_game is None:
+        return None
+    return PositionSelection(None if end_ply is None else int(end_ply), int(stride or '1'), quiet is not None,
+                             None if max_per_game is None else int(max_per_game))
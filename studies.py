@@ -1,20 +1,183 @@
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
 import requests
+import requests.adapters
+
+LOCAL_URL = 'http://localhost:9663'
+REMOTE_URL = 'https://lichess.org'
+MAX_CONCURRENT_FETCHES = 8
+CACHE_FOLDER = 'lichess-cache'
+OBJECTS_FOLDER = os.path.join(CACHE_FOLDER, 'objects')
+"""Holds each distinct copy of a study once, named by the sha256 of its contents."""
+POINTER_FILENAME = 'current.json'
+"""In each study's folder: names the study's current copy, along with the validators it was sent with."""
+MAX_CACHE_BYTES = 1 << 30
+MAX_UNUSED_SECONDS = 30 * 24 * 60 * 60
+
+_session: Optional[requests.Session] = None
+_updated_studies: set[str] = set()
+"""The studies whose cached copy has already been brought up to date (or attempted to be) in this process."""
 
 def get_api_key() -> str:
     with open('api-key.txt') as f:
         return f.readline().strip('\n')
 
-def get_study_pgn(study_id) -> str:
-    local_response = requests.get(
-        f'http://localhost:9663/api/study/{study_id}.pgn?source=true'
-    )
-    if local_response.status_code == 200:
-        return local_response.text
-    remote_response = requests.get(
-        f'https://lichess.org/api/study/{study_id}.pgn?source=true',
+def session() -> requests.Session:
+    """Returns a session shared by all study requests, so connections get reused."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=MAX_CONCURRENT_FETCHES)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+def cache_dir(study_id: str) -> str:
+    return os.path.join(CACHE_FOLDER, study_id)
+
+def _pointer_path(study_id: str) -> str:
+    return os.path.join(cache_dir(study_id), POINTER_FILENAME)
+
+def _read_pointer(study_id: str) -> dict[str, str]:
+    """Returns the name of the study's current copy in the objects folder (key 'object'), the url it
+       came from, and the 'ETag' and/or 'Last-Modified' headers it was sent with."""
+    try:
+        with open(_pointer_path(study_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return _import_old_copies(study_id)
+
+def _write_atomically(path: str, data: bytes) -> None:
+    with open(temp_path := f"{path}.{os.getpid()}.tmp", 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def _store(data: bytes) -> str:
+    """Adds the data to the objects folder (if an identical copy isn't there already), and returns its name."""
+    os.makedirs(OBJECTS_FOLDER, exist_ok=True)
+    name = f"{hashlib.sha256(data).hexdigest()}.pgn"
+    if os.path.isfile(path := os.path.join(OBJECTS_FOLDER, name)):
+        os.utime(path)
+    else:
+        _write_atomically(path, data)
+    return name
+
+def _import_old_copies(study_id: str) -> dict[str, str]:
+    """Moves the copies from before the objects folder existed (the '<study id>-<time>.pgn' files) into it,
+       with the most recent one becoming the current copy."""
+    if not os.path.isdir(cache_dir(study_id)) or not (old_copies := sorted(
+        (os.path.join(cache_dir(study_id), x) for x in os.listdir(cache_dir(study_id)) if x.endswith('.pgn')),
+        key=os.path.getmtime
+    )):
+        return {}
+    for path in old_copies:
+        with open(path, 'rb') as f:
+            name = _store(f.read())
+        os.remove(path)
+    pointer = {'object': name}
+    _write_atomically(_pointer_path(study_id), json.dumps(pointer).encode())
+    return pointer
+
+def _conditional_headers(pointer: dict[str, str], url: str) -> dict[str, str]:
+    if pointer.get('url') != url:
+        return {}
+    headers = {}
+    if 'ETag' in pointer:
+        headers['If-None-Match'] = pointer['ETag']
+    if 'Last-Modified' in pointer:
+        headers['If-Modified-Since'] = pointer['Last-Modified']
+    return headers
+
+def _get(url: str, pointer: dict[str, str], headers: Optional[dict[str, str]] = None) -> requests.Response:
+    return session().get(url, headers=(headers or {}) | _conditional_headers(pointer, url))
+
+def get_study_pgn(study_id: str) -> Optional[requests.Response]:
+    """Requests the study from the local server, or from lichess if the local server doesn't have it.
+       Returns None if the study hasn't changed since it was cached (i.e., the response was a 304)."""
+    pointer = _read_pointer(study_id)
+    local_response = _get(f'{LOCAL_URL}/api/study/{study_id}.pgn?source=true', pointer)
+    if local_response.status_code in (200, 304):
+        return local_response if local_response.status_code == 200 else None
+    remote_response = _get(
+        f'{REMOTE_URL}/api/study/{study_id}.pgn?source=true', pointer,
         headers={"Authorization": f"Bearer {get_api_key()}"}
     )
-    if remote_response.status_code == 200:
-        return remote_response.text
+    if remote_response.status_code in (200, 304):
+        return remote_response if remote_response.status_code == 200 else None
     raise RuntimeError(f"lichess api response status code is {remote_response.status_code}")
+
+def update_cached_study(study_id: str) -> None:
+    """Points the study's cache at its latest copy, which is only stored if it's a new one."""
+    os.makedirs(cache_dir(study_id), exist_ok=True)
+    _updated_studies.add(study_id)
+    try:
+        response = get_study_pgn(study_id)
+    except requests.exceptions.ConnectionError:
+        return
+    if response is None:
+        return
+    pointer = {k: response.headers[k] for k in ('ETag', 'Last-Modified') if k in response.headers}
+    pointer |= {'object': _store(response.content), 'url': response.url}
+    _write_atomically(_pointer_path(study_id), json.dumps(pointer).encode())
+
+def _checkpointed_copies() -> set[str]:
+    """Returns the names of the copies that saved checkpoints are searching (and so will resume from)."""
+    import checkpoint
+    if not os.path.isdir(checkpoint.CHECKPOINTS_FOLDER):
+        return set()
+    names = set()
+    for filename in os.listdir(checkpoint.CHECKPOINTS_FOLDER):
+        if filename.endswith('.checkpoint'):
+            path = checkpoint.load(os.path.join(checkpoint.CHECKPOINTS_FOLDER, filename)).specs.pgn()
+            if os.path.abspath(os.path.dirname(path)) == os.path.abspath(OBJECTS_FOLDER):
+                names.add(os.path.basename(path))
+    return names
+
+def evict_old_copies() -> None:
+    """Removes the copies that no study currently points to (and no checkpoint is searching), if they haven't
+       been used in MAX_UNUSED_SECONDS or (least recently used first) while the objects folder is bigger than
+       MAX_CACHE_BYTES."""
+    if not os.path.isdir(OBJECTS_FOLDER):
+        return
+    current = {
+        _read_pointer(study_id).get('object') for study_id in os.listdir(CACHE_FOLDER)
+        if os.path.isfile(_pointer_path(study_id))
+    } | _checkpointed_copies()
+    stats = {name: os.stat(os.path.join(OBJECTS_FOLDER, name)) for name in os.listdir(OBJECTS_FOLDER)}
+    total_size = sum(x.st_size for x in stats.values())
+    for name, stat in sorted(stats.items(), key=lambda x: x[1].st_mtime):
+        if name in current or (total_size <= MAX_CACHE_BYTES and time.time() - stat.st_mtime <= MAX_UNUSED_SECONDS):
+            continue
+        os.remove(os.path.join(OBJECTS_FOLDER, name))
+        total_size -= stat.st_size
+
+def update_cached_studies(study_ids: list[str]) -> None:
+    """Brings the cached copies of the studies up to date, fetching several at once."""
+    study_ids = [x for x in dict.fromkeys(study_ids) if x not in _updated_studies]
+    session() # Creating the shared session before the threads could race to do so.
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES) as executor:
+        list(executor.map(update_cached_study, study_ids))
+    evict_old_copies()
+
+def cached_copy(study_id: str) -> Optional[str]:
+    """Returns the path of the study's current cached copy, or None if there isn't one."""
+    if 'object' not in (pointer := _read_pointer(study_id)):
+        return None
+    return os.path.join(OBJECTS_FOLDER, pointer['object'])
+
+def cached_study_path(study_id: str) -> str:
+    """Returns the path of the study's current cached copy, after updating it if that hasn't been
+       done yet in this process."""
+    if study_id not in _updated_studies:
+        update_cached_study(study_id)
+    if (path := cached_copy(study_id)) is None:
+        raise FileNotFoundError(f"There's no cached copy of the study {study_id}")
+    os.utime(path)
+    # So that eviction goes by when a copy was last used.
+    return path
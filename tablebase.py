@@ -0,0 +1,67 @@
+"""Answers the checks for positions with few enough pieces from a directory of Syzygy tablebases, which
+are exact and much quicker than the engine's searches. Positions the tables don't cover are left to the engine."""
+
+from __future__ import annotations
+from typing import Any, Optional
+
+import chess
+import chess.syzygy
+
+class Tablebase:
+    def __init__(self, tables: Any, max_pieces: int) -> None:
+        """`tables` is a chess.syzygy.Tablebase, and `max_pieces` the most pieces (kings included) of its tables."""
+        self._tables = tables
+        self._max_pieces = max_pieces
+        self._num_answered = 0
+
+    def _outcome_after(self, board: chess.Board, move: chess.Move) -> tuple[int, int]:
+        """Returns the outcome of the move for the player making it (1 for a win, 0 for a draw, -1 for a loss),
+           and how many plies until the loser's pieces or pawns last change (or they're mated) with best play."""
+        board.push(move)
+        try:
+            wdl = -self._tables.probe_wdl(board)
+            dtz = abs(self._tables.probe_dtz(board)) if abs(wdl) == 2 else 0
+            halfmove_clock = board.halfmove_clock
+        finally:
+            board.pop()
+        if abs(wdl) < 2 or halfmove_clock + dtz > 100:
+            return 0, 0 # Drawn by the fifty-move rule (a cursed win or blessed loss is a wdl of 1 or -1).
+        return wdl // 2, dtz + 1
+
+    def top_moves(self, fen: str) -> Optional[list[dict]]:
+        """Returns all the legal moves from best to worst, as the dicts of a verbose call to get_top_moves.
+           Since the tables have the distance to a zeroing move rather than to mate, a win (or loss) is given
+           as a mate in the moves until then. Returns None if the tables don't cover the position."""
+        board = chess.Board(fen)
+        if chess.popcount(board.occupied) > self._max_pieces or board.castling_rights:
+            return None
+        try:
+            outcomes = [(move, *self._outcome_after(board, move)) for move in board.legal_moves]
+        except KeyError: # chess.syzygy.MissingTableError, for a table that isn't in the directory.
+            return None
+        outcomes.sort(key=lambda x: (-x[1], x[1] * x[2]))
+        # Wins first (the quickest first), then draws, then losses (the slowest first).
+        self._num_answered += 1
+        return [
+            {
+                "Move": move.uci(),
+                "Centipawn": 0 if outcome == 0 else None,
+                "Mate": None if outcome == 0 else outcome * ((plies + 1) // 2),
+                "WDL": {1: "1000 0 0", 0: "0 1000 0", -1: "0 0 1000"}[outcome],
+            }
+            for move, outcome, plies in outcomes
+        ]
+
+    def report(self) -> str:
+        return f"Tablebase: answered the checks of {self._num_answered} positions"
+
+    def close(self) -> None:
+        self._tables.close()
+
+def open_tablebase(directory: str) -> Tablebase:
+    """Returns the tablebase for the `--syzygy=DIRECTORY` option."""
+    tables = chess.syzygy.open_tablebase(directory)
+    max_pieces = max((len(name) - 1 for name in tables.wdl), default=0)
+    # A table's name is like 'KRPvKR', for a position with those five pieces.
+    assert max_pieces, f"There are no Syzygy tables in {directory}."
+    return Tablebase(tables, max_pieces)
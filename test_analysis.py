@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import chess
+import pytest
+
+import analysis
+import main
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+def run_checks(scheduler: analysis.BudgetScheduler, clock: Clock, num_checks: int,
+               seconds_per_check: float, progress_per_check: float, progress: float) -> float:
+    for _ in range(num_checks):
+        scheduler.set_progress(progress)
+        clock.now += seconds_per_check
+        progress += progress_per_check
+        scheduler.record_check()
+    return progress
+
+class FakeStockfish:
+    """Finds the same two moves at every depth, and counts its searches."""
+
+    def __init__(self) -> None:
+        self.fen = chess.STARTING_FEN
+        self.depth = 0
+        self.num_searches = 0
+
+    def get_fen_position(self) -> str:
+        return self.fen
+
+    def set_depth(self, depth: int) -> None:
+        self.depth = depth
+
+    def get_top_moves(self, num_top_moves: int, verbose: bool, searchmoves=None) -> list[dict]:
+        self.num_searches += 1
+        return [
+            {"Move": move, "Centipawn": cp, "Mate": None, "Depth": str(self.depth), "Nodes": "20000",
+             "Time": "12", "WDL": "90 870 40"}
+            for move, cp in (("e2e4", 35), ("d2d4", 30))
+        ][:num_top_moves]
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(analysis.time, 'time', clock.time)
+    return clock
+
+def test_movetime_shrinks_when_behind_schedule(clock):
+    scheduler = analysis.BudgetScheduler(100)
+    # 1% of the pgn in 20 seconds: at this rate the search would take 2000 seconds.
+    run_checks(scheduler, clock, 20, 1.0, 0.0005, 0.0)
+    # Halved, and then capped at the ~40 ms per check that the remaining 80 seconds allow.
+    assert 30 < scheduler.movetime_ms() < 50
+
+def test_movetime_grows_when_ahead_of_schedule(clock):
+    scheduler = analysis.BudgetScheduler(1000)
+    # 10% of the pgn in 2 seconds: at this rate the search would take 20 of the 1000 seconds.
+    run_checks(scheduler, clock, 20, 0.1, 0.005, 0.0)
+    assert scheduler.movetime_ms() == analysis.BudgetScheduler.INITIAL_MOVETIME_MS * 2
+    assert scheduler.seconds_used() == pytest.approx(2.0)
+
+def test_budget_is_shared_out(clock):
+    profile = analysis.profile_from_options(None, '2h')
+    share = profile.with_budget_share(0.25)
+    assert share.scheduler() is not None and share.scheduler() is not profile.scheduler()
+    assert share.scheduler().seconds() == 1800
+
+def test_profiles_from_options():
+    assert analysis.profile_from_options(None, None).kind() == 'depth'
+    assert analysis.profile_from_options('nodes:500000', None).kind() == 'nodes'
+    assert (profile := analysis.profile_from_options('movetime:300', None)).report() == "No searches were done"
+    for depth in (14, 9, 16):
+        profile._record_depth(depth)
+    assert profile.report() == "Effective depth: 13.0 on average (from 9 to 16) over 3 searches"
+    assert analysis.parse_duration('90m') == analysis.parse_duration('5400') == 5400
+    with pytest.raises(AssertionError):
+        analysis.profile_from_options('movetime:300', '2h')
+
+def test_check_result_is_reused():
+    stockfish, cache = FakeStockfish(), analysis.AnalysisCache()
+    result = main.check_bounds(stockfish, chess.STARTING_FEN, [0.2, 0.5, None, 0.4], analysis.AnalysisProfile(), cache)
+    assert result is not None and result.satisfied and stockfish.num_searches == 3
+    assert (result.limit, result.depth, result.nodes, result.time_ms) == ("depth: 15", 15, 20000, 12)
+    assert result.moves[1].wdl == (90, 870, 40)
+    assert result.top_moves() == [{"Move": "e2e4", "Centipawn": 35, "Mate": None},
+                                  {"Move": "d2d4", "Centipawn": 30, "Mate": None}]
+    assert main.check_bounds(stockfish, chess.STARTING_FEN, [0.2, 0.5, None, 0.4], analysis.AnalysisProfile(),
+                             cache) is result
+    assert stockfish.num_searches == 3
+
+    result = main.check_bounds(stockfish, chess.STARTING_FEN, [0.5, None], analysis.AnalysisProfile(), cache)
+    assert result is not None and not result.satisfied and result.depth == 8
+    assert result.to_json()["moves"] == [{"move": "e2e4", "centipawn": 35, "mate": None, "wdl": (90, 870, 40)}]
@@ -0,0 +1,37 @@
+from __future__ import annotations
+import json
+
+from Args import Args
+import autotune
+import engine
+
+def test_candidates_fit_the_machine(monkeypatch):
+    monkeypatch.setattr(engine, 'hash_size_mb', lambda num_engines: 256 // num_engines)
+    candidates = autotune.candidates(4)
+    assert all(n * threads <= 4 and hash_mb <= 256 // n for n, threads, hash_mb in candidates)
+    assert {(n, threads) for n, threads, _ in candidates} == {(1, 1), (1, 2), (1, 4), (2, 1), (2, 2), (4, 1)}
+    assert (1, 4, 256) in candidates and (4, 1, 64) in candidates
+
+def test_profile_is_loaded_for_the_number_of_engines(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine, 'PROFILE_FILE', str(tmp_path / 'profile.json'))
+    engine.calibrated_profile.cache_clear()
+    assert engine.calibrated_jobs() is None
+    assert engine.engine_parameters(2)["Threads"] == 1
+
+    measurements = [
+        autotune.Measurement(1, 4, 256, 4000000, 10.0),
+        autotune.Measurement(1, 2, 64, 2000000, 12.0),
+        autotune.Measurement(4, 1, 64, 4000000, 15.0),
+        autotune.Measurement(4, 1, 16, 4000000, 14.0),
+    ]
+    with open(engine.PROFILE_FILE, 'w') as f:
+        json.dump(autotune.best_settings(measurements), f)
+    engine.calibrated_profile.cache_clear()
+
+    assert engine.calibrated_jobs() == 4
+    assert Args(['main.py', '--jobs=auto']).jobs() == Args(['main.py', '--jobs=0']).jobs() == 4
+    assert Args(['main.py']).jobs() == 1 and Args(['main.py', '--jobs=3']).jobs() == 3
+    # Only processing several sources at once when asked to.
+    assert engine.engine_parameters(1) == engine.engine_parameters(3) == {"Threads": 2, "Hash": 64}
+    assert engine.engine_parameters(8) == {"Threads": 1, "Hash": 64}
+    engine.calibrated_profile.cache_clear()
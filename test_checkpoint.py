@@ -0,0 +1,117 @@
+from __future__ import annotations
+import os
+
+import chess
+import pytest
+
+from analysis import AnalysisCache, AnalysisResult, MoveAnalysis
+import checkpoint
+import main
+from output_obj import Output
+from Specs import Specs
+
+class Crash(Exception):
+    pass
+
+def write_pgn(path: str, num_games: int) -> None:
+    with open(path, 'w') as f:
+        for i in range(num_games):
+            black = 'Kasparov, Garry' if i % 3 == 0 else f'Player {i}'
+            f.write(f'[Event "Event {i}"]\n[White "White {i}"]\n[Black "{black}"]\n[Result "*"]\n\n'
+                    f'1. e4 e5 2. Nf3 Nc6 *\n\n')
+
+def name_specs(output_filename: str, checkpoint_interval: float | None) -> Specs:
+    specs = Specs('name')
+    specs.set_verbose_name_feature(False)
+    specs.set_substrs_name_feature(['kasparov'])
+    specs.set_output_filename(output_filename)
+    specs.set_pgn('db.pgn')
+    specs.set_checkpoint_interval(checkpoint_interval)
+    return specs
+
+def shed_at(monkeypatch, specs: Specs, games: list[int]) -> None:
+    """Has the search's output moved to its spill files at the start of each of `games`."""
+    prep_for_new_game = Output.prep_for_new_game
+
+    def prep_and_shed(self: Output) -> None:
+        prep_for_new_game(self)
+        if self.num_games() in games:
+            self.shed_memory(specs)
+
+    monkeypatch.setattr(Output, 'prep_for_new_game', prep_and_shed)
+
+def run_until_crash(monkeypatch, specs: Specs, num_checkpoints: int, crash_at_game: int,
+                    shed_at_games: list[int] | None = None) -> None:
+    """Searches with a checkpoint after each of the first `num_checkpoints` games, and then crashes
+       partway through game `crash_at_game` (so well after the last checkpoint)."""
+    save, prep_for_new_game = checkpoint.save, Output.prep_for_new_game
+    checkpoints_saved = 0
+
+    def save_the_first_few(*args, **kwargs) -> None:
+        nonlocal checkpoints_saved
+        if checkpoints_saved < num_checkpoints:
+            save(*args, **kwargs)
+            checkpoints_saved += 1
+
+    monkeypatch.setattr(checkpoint, 'save', save_the_first_few)
+    shed_at(monkeypatch, specs, shed_at_games or [])
+    prep_and_shed = Output.prep_for_new_game
+
+    def crash(self: Output) -> None:
+        prep_and_shed(self)
+        if self.num_games() == crash_at_game:
+            raise Crash()
+
+    monkeypatch.setattr(Output, 'prep_for_new_game', crash)
+    with pytest.raises(Crash):
+        main.process_pgn(specs, ['kasparov'], None, None, None)
+    monkeypatch.setattr(checkpoint, 'save', save)
+    monkeypatch.setattr(Output, 'prep_for_new_game', prep_for_new_game)
+
+def test_a_resumed_search_finds_the_same_hits_as_an_uninterrupted_one(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_pgn('db.pgn', 100)
+    main.process_pgn(name_specs('uninterrupted', None), ['kasparov'], None, None, None)
+    run_until_crash(monkeypatch, name_specs('resumed', 0.0), 30, 45)
+    assert os.path.isfile(checkpoint.path_for(name_specs('resumed', None)))
+    checkpoint.resume(None, main.process_pgn)
+    assert not os.listdir(checkpoint.CHECKPOINTS_FOLDER)
+    with open(os.path.join('results', 'uninterrupted.pgn')) as f, \
+         open(os.path.join('results', 'resumed.pgn')) as resumed:
+        assert resumed.read() == (expected := f.read())
+    assert expected.endswith("#Games parsed: 100\nHit counter: 34\n\n")
+
+def test_hits_moved_to_the_spill_files_after_the_checkpoint_are_not_repeated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_pgn('db.pgn', 100)
+    main.process_pgn(name_specs('uninterrupted', None), ['kasparov'], None, None, None)
+    run_until_crash(monkeypatch, name_specs('resumed', 0.0), 30, 45, [20, 40])
+    shed_at(monkeypatch, name_specs('resumed', None), [60])
+    checkpoint.resume(None, main.process_pgn)
+    with open(os.path.join('results', 'uninterrupted.pgn')) as f, \
+         open(os.path.join('results', 'resumed.pgn')) as resumed:
+        assert resumed.read() == f.read()
+    assert not [name for name in os.listdir('results') if name.endswith('.spill')]
+
+def test_leftover_spill_files_are_overwritten(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_pgn('db.pgn', 100)
+    main.process_pgn(name_specs('uninterrupted', None), ['kasparov'], None, None, None)
+    run_until_crash(monkeypatch, name_specs('resumed', 0.0), 30, 45, [40])
+    # The spill files are first used after the last checkpoint, so the resumed search doesn't know of them.
+    shed_at(monkeypatch, name_specs('resumed', None), [60])
+    checkpoint.resume(None, main.process_pgn)
+    with open(os.path.join('results', 'uninterrupted.pgn')) as f, \
+         open(os.path.join('results', 'resumed.pgn')) as resumed:
+        assert resumed.read() == f.read()
+
+def test_the_analysis_cache_is_resumed_too(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = AnalysisCache()
+    result = AnalysisResult(chess.STARTING_FEN, "depth: 8", True, [MoveAnalysis("e2e4", 30, None, None)])
+    cache.put(result, bounds := [0.0, 1.0])
+    specs = name_specs('cached', 0.0)
+    checkpoint.save(specs, (['kasparov'], None, None, bounds), 'db.pgn', 0, Output(), cache)
+    resumed_with = []
+    checkpoint.resume(None, lambda *args, **kwargs: resumed_with.append(kwargs['cache']))
+    assert len(resumed_with) == 1 and resumed_with[0].get(chess.STARTING_FEN, bounds) == result
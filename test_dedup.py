@@ -0,0 +1,82 @@
+from __future__ import annotations
+import io
+
+import chess.pgn
+
+import dedup
+import main
+from Specs import Specs
+
+TWIC_GAME = """[Event "Norway Chess"]
+[White "Carlsen, Magnus"]
+[Black "Nakamura, Hikaru"]
+[Date "2023.06.01"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. 0-0 Be7 1-0
+
+"""
+LICHESS_GAME = """[Event "Broadcast"]
+[White "Magnus Carlsen"]
+[Black "Hikaru Nakamura"]
+[Date "2023.??.??"]
+[Result "1-0"]
+
+1. e4 { [%clk 0:10:00]
+
+a comment over several lines } 1... e5 2. Nf3!? (2. Bc4 Bc5 (2... Nf6)) 2... Nc6 $1 3. Bb5 a6
+4. Ba4 Nf6 5. O-O+ Be7 1-0
+"""
+
+def test_game_text_is_read_like_python_chess_reads_games():
+    pgn_text = TWIC_GAME + "\n\n% an escaped line\n" + LICHESS_GAME + "\n" + TWIC_GAME.replace("Be7", "b5")
+    pgn = io.StringIO(pgn_text)
+    keys = []
+    while (game_text := dedup.read_game_text(pgn)) is not None:
+        keys.append(dedup.game_key(game_text))
+    assert len(keys) == 3 and keys[0] == keys[1] != keys[2]
+    games, reference = io.StringIO(pgn_text), io.StringIO(pgn_text)
+    while (game := chess.pgn.read_game(reference)) is not None:
+        assert (game_text := dedup.read_game_text(games)) is not None
+        assert games.tell() == reference.tell()
+        assert str(chess.pgn.read_game(io.StringIO(game_text.text))) == str(game)
+    assert dedup.read_game_text(games) is None
+    assert dedup.mainline_moves(LICHESS_GAME.split("\n\n", 1)[1]) == ["e4", "e5", "Nf3", "Nc6", "Bb5", "a6", "Ba4",
+                                                                     "Nf6", "O-O", "Be7"]
+
+def test_castling_is_read_the_same_however_it_is_written():
+    game = TWIC_GAME.replace("5. 0-0 Be7", "5. Nc3 Be7 6. d3 b5 7. Bb3 O-O 8. Bg5 d6 9. Qd2 h6 10. O-O-O+")
+    zeros = game.replace("7. Bb3 O-O", "7. Bb3 0-0").replace("10. O-O-O+", "10.0-0-0+")
+    keys = [dedup.game_key(dedup.read_game_text(io.StringIO(x))) for x in (game, zeros)]
+    assert keys[0] == keys[1]
+    assert dedup.mainline_moves(zeros.split("\n\n", 1)[1])[-6:] == ["O-O", "Bg5", "d6", "Qd2", "h6", "O-O-O"]
+
+def test_games_are_duplicates_only_of_games_first_seen_elsewhere(tmp_path):
+    games = dedup.GameSet(path := str(tmp_path / 'games.sqlite'))
+    key = dedup.game_key(dedup.read_game_text(io.StringIO(TWIC_GAME)))
+    assert not games.is_duplicate(key, 'twic.pgn', 0)
+    assert not games.is_duplicate(key, 'twic.pgn', 0) # The same game, read again after resuming.
+    assert games.is_duplicate(key, 'lichess.pgn', 500)
+    games.close()
+    later_search = dedup.GameSet(path)
+    assert later_search.is_duplicate(key, 'twic.pgn', 100)
+    assert later_search.report() == "Dedup: skipped 1 of 1 games as duplicates of games seen before"
+    later_search.close()
+    dedup.remove_game_set(path)
+    assert not list(tmp_path.iterdir())
+
+def test_duplicates_are_sampled_as_games_without_hits(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    with open('games.pgn', 'w') as f:
+        f.write((TWIC_GAME + LICHESS_GAME + "\n" + TWIC_GAME.replace("Be7", "b5")) * 2)
+    specs = Specs('name')
+    specs.set_verbose_name_feature(False)
+    specs.set_substrs_name_feature(['nakamura'])
+    specs.set_output_filename('dedup')
+    specs.set_pgn('games.pgn')
+    specs.set_sample((100, 0))
+    specs.set_dedup_path(str(tmp_path / 'games.sqlite'))
+    main.process_pgn(specs, ['nakamura'], None, None, None)
+    output = capsys.readouterr().out
+    assert "Dedup: skipped 4 of 6 games as duplicates of games seen before" in output
+    assert "Sampled 6 of the 6 games" in output and "hits: 2 (2 to 2), 2 in the sample" in output
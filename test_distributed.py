@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import multiprocessing
+import socket
+import threading
+import time
+from multiprocessing.connection import Client
+
+import distributed
+import main
+from output_obj import Output
+from Specs import Specs
+
+AUTHKEY = b'test'
+
+def write_pgn(path: str, num_games: int) -> None:
+    with open(path, 'w') as f:
+        for i in range(num_games):
+            black = 'Kasparov, Garry' if i % 3 == 0 else f'Player {i}'
+            f.write(f'[Event "Event {i}"]\n[White "White {i}"]\n[Black "{black}"]\n[Result "*"]\n\n'
+                    f'1. e4 e5 2. Nf3 Nc6 *\n\n')
+
+def name_specs(pgn: str) -> Specs:
+    specs = Specs('name')
+    specs.set_verbose_name_feature(False)
+    specs.set_substrs_name_feature(['kasparov'])
+    specs.set_output_filename('distributed')
+    specs.set_pgn(pgn)
+    return specs
+
+def free_address() -> tuple[str, int]:
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return ('localhost', s.getsockname()[1])
+
+def dead_worker(address: tuple[str, int]) -> None:
+    """Takes a shard, then disconnects without finishing it."""
+    with Client(address, authkey=AUTHKEY) as conn:
+        conn.send(('ready',))
+        conn.recv()
+
+def test_workers_on_localhost(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_pgn('db.pgn', 100)
+    expected = Output()
+    main.process_pgn(name_specs('db.pgn'), ['kasparov'], None, None, None, output_data=expected)
+
+    address = free_address()
+    outputs: list[Output] = []
+    coordinator = threading.Thread(target=lambda: outputs.extend(distributed.coordinate(
+        [name_specs('db.pgn')], (['kasparov'], None, None, None), address, AUTHKEY, 7
+    )))
+    coordinator.start()
+    while True:
+        try:
+            socket.create_connection(address).close()
+            break
+        except ConnectionRefusedError:
+            pass
+    workers = [multiprocessing.Process(target=dead_worker, args=(address,))] + [
+        multiprocessing.Process(target=distributed.run_worker, args=(address, AUTHKEY, main.process_pgn))
+        for _ in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    coordinator.join(timeout=60)
+    for worker in workers:
+        worker.join(timeout=10)
+
+    assert not coordinator.is_alive()
+    assert outputs[0].output_str() == expected.output_str()
+    assert outputs[0].num_hits() == expected.num_hits() == 34
+    assert outputs[0].num_games() == 100
+
+def test_a_worker_stays_alive_during_a_long_game(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(distributed, 'WORKER_TIMEOUT', 0.5)
+    monkeypatch.setattr(distributed, 'HEARTBEAT_INTERVAL', 0.1)
+    write_pgn('db.pgn', 10)
+
+    def slow_process_pgn(*args, **kwargs) -> None:
+        time.sleep(1.5) # As if a game had a long search, with no hits or new games to send.
+        main.process_pgn(*args, **kwargs)
+
+    address = free_address()
+    outputs: list[Output] = []
+    coordinator = threading.Thread(target=lambda: outputs.extend(distributed.coordinate(
+        [name_specs('db.pgn')], (['kasparov'], None, None, None), address, AUTHKEY, 10
+    )), daemon=True)
+    coordinator.start()
+    while True:
+        try:
+            socket.create_connection(address).close()
+            break
+        except ConnectionRefusedError:
+            pass
+    # The only worker, so the scan can only finish if its shard isn't taken from it.
+    worker = threading.Thread(target=distributed.run_worker, args=(address, AUTHKEY, slow_process_pgn), daemon=True)
+    worker.start()
+    coordinator.join(timeout=30)
+    worker.join(timeout=10)
+    assert not coordinator.is_alive() and not worker.is_alive()
+    assert outputs[0].num_hits() == 4 and outputs[0].num_games() == 10
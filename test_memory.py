@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import memory
+from output_obj import Output
+from Specs import Specs
+
+def test_load_is_shed_over_the_ceiling_and_then_only_with_more_growth(monkeypatch):
+    rss = [100.0]
+    monkeypatch.setattr(memory, 'rss_mb', lambda: rss[0])
+    monitor = memory.MemoryMonitor(ceiling_mb=500)
+    sheds: list[int] = []
+    for num_games, rss[0] in ((100, 400.0), (150, 600.0), (200, 510.0), (300, 520.0), (400, 530.0), (500, 600.0)):
+        monitor.after_game(num_games, 'db.pgn', lambda: sheds.append(num_games))
+    assert sheds == [200, 500]
+    assert monitor.report() == "Memory: peak RSS 600 MB (ceiling 500 MB), load shed 2 times"
+
+def test_shed_output_is_still_written(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    specs = Specs('name')
+    specs.set_output_filename('out')
+    specs.set_pgn('db.pgn')
+    specs.set_verbose_name_feature(True)
+    output = Output()
+    output.add_newest_hit("first hit")
+    output.shed_memory(specs)
+    assert output.output_str() == ''
+    output.clear_newest_hit()
+    output.add_newest_hit("second hit")
+    output.print_and_write_data(specs)
+    assert (tmp_path / 'results' / 'out.pgn').read_text().startswith("first hit\n\n\nsecond hit\n\n\n#Games parsed")
+    output.remove_spill_files()
+    assert sorted(x.name for x in (tmp_path / 'results').iterdir()) == ['out.pgn']
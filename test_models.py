@@ -0,0 +1,139 @@
+from __future__ import annotations
+import importlib.util
+import os
+import stat
+import sys
+
+import chess
+import pytest
+
+from engine import LazyEngine
+from models import Stockfish
+
+FAKE_ENGINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'fake_uci_engine.py')
+
+def write_engine(path: str, comment: str = '') -> None:
+    """Writes an executable running the fake UCI engine (with `comment` just to change the binary)."""
+    with open(path, 'w') as f:
+        f.write(f"#!{sys.executable}\nimport runpy\n"
+                f"runpy.run_path({FAKE_ENGINE!r}, run_name='__main__')\n# {comment}\n")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+@pytest.fixture
+def engine_path(tmp_path, monkeypatch) -> str:
+    monkeypatch.setattr(Stockfish, 'PROBE_CACHE_FILE', str(tmp_path / 'probes.json'))
+    monkeypatch.setattr(Stockfish, '_probe_cache', None)
+    monkeypatch.setenv('FAKE_UCI_LOG', str(tmp_path / 'commands.log'))
+    write_engine(path := str(tmp_path / 'stockfish'))
+    return path
+
+def commands_sent(engine_path: str) -> list[str]:
+    with open(os.path.join(os.path.dirname(engine_path), 'commands.log')) as f:
+        commands = f.read().splitlines()
+    os.remove(os.path.join(os.path.dirname(engine_path), 'commands.log'))
+    return commands
+
+def test_probes_are_cached_by_binary_but_uci_is_still_sent_first(engine_path):
+    stockfish = Stockfish(engine_path)
+    assert stockfish.does_current_engine_version_have_wdl_option()
+    stockfish.send_quit_command()
+    key = stockfish._probe_cache_key()
+    assert key is not None and key.startswith(os.path.realpath(engine_path) + '|')
+    assert list(Stockfish._loaded_probe_cache()) == [key]
+    commands_sent(engine_path)
+
+    Stockfish._probe_cache = None # As in a later process, which reads the cache file.
+    stockfish = Stockfish(engine_path)
+    assert stockfish.does_current_engine_version_have_wdl_option() and stockfish._probe_cache_key() == key
+    stockfish.send_quit_command()
+    assert commands_sent(engine_path)[0] == 'uci'
+    assert list(Stockfish._loaded_probe_cache()) == [key]
+
+    os.utime(engine_path, ns=(os.stat(engine_path).st_atime_ns, os.stat(engine_path).st_mtime_ns + 10**9))
+    Stockfish(engine_path).send_quit_command()
+    write_engine(engine_path, 'a rebuilt engine')
+    Stockfish(engine_path).send_quit_command()
+    assert len(Stockfish._loaded_probe_cache()) == 3
+    # A new probe each time the binary changed (by its modification time, and then by its size too).
+
+def fake_engine_module():
+    spec = importlib.util.spec_from_file_location('fake_uci_engine', FAKE_ENGINE)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_top_moves_are_parsed_from_the_final_multipv_lines(engine_path):
+    stockfish = Stockfish(engine_path, depth=6)
+    fen = "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5Q2/PPPP1PPP/RNB1K1NR w KQkq - 2 3"
+    stockfish.set_fen_position(fen)
+    board = chess.Board(fen)
+    fake_engine = fake_engine_module()
+    expected = sorted(((fake_engine.score_move(board, m), m.uci()) for m in board.legal_moves),
+                      key=lambda x: (x[0][0] != "mate", -x[0][1]))[:4]
+    assert [(x["Move"], x["Mate"] if x["Mate"] is not None else x["Centipawn"]) for x in stockfish.get_top_moves(4)] \
+           == [(move, value) for (_, value), move in expected]
+    assert stockfish.get_top_moves(1)[0] == {"Move": "f3f7", "Centipawn": None, "Mate": 1}
+    verbose = stockfish.get_top_moves(2, verbose=True, num_nodes=3000)
+    assert [x["MultiPVLine"] for x in verbose] == ["1", "2"] and verbose[0]["Depth"] == "10"
+    # The last lines of the search (which the fake engine always runs to depth 10) with at least 3000 nodes.
+    assert verbose[0]["WDL"] == "500 400 100" and verbose[0]["SelectiveDepth"] == "12"
+    assert {x["Move"] for x in stockfish.get_top_moves(3, searchmoves=["a2a3", "h2h4"])} == {"a2a3", "h2h4"}
+
+    stockfish.set_turn_perspective(False)
+    stockfish.set_fen_position("rnbqkbnr/pppp1ppp/8/4p3/6P1/5P2/PPPPP2P/RNBQKBNR b KQkq g3 0 2")
+    assert stockfish.get_top_moves(1, verbose=True)[0] == {
+        "Move": "d8h4", "Centipawn": None, "Mate": -1, "Depth": "6", "SelectiveDepth": "8", "Time": "6",
+        "Nodes": "6000", "NodesPerSecond": "1000000", "MultiPVLine": "1", "WDL": "100 400 500"
+    }
+    # From White's perspective, so the mate and the wdl are the other way around.
+    stockfish.set_fen_position("8/P6k/8/8/8/8/8/K7 w - - 0 1")
+    assert stockfish.get_top_moves(1)[0]["Move"] == "a7a8q"
+    stockfish.set_fen_position("rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3")
+    assert stockfish.get_top_moves(3) == []
+    stockfish.send_quit_command()
+
+def engine_fen(stockfish: Stockfish) -> str:
+    """Returns the fen of the engine's own position, rather than its local mirror's."""
+    mirror, stockfish._board = stockfish._board, None
+    try:
+        return stockfish.get_fen_position()
+    finally:
+        stockfish._board = mirror
+
+def test_the_mirror_stays_in_sync_with_the_engine(engine_path):
+    stockfish = Stockfish(engine_path, depth=2)
+    stockfish.set_position(["e2e4", "e7e5"])
+    stockfish.make_moves_from_current_position(["g1f3", "b8c6", "f1b5"])
+    assert stockfish.get_fen_position() == engine_fen(stockfish) == \
+           "r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3"
+    assert stockfish.get_what_is_on_square("b5") == Stockfish.Piece.WHITE_BISHOP
+    assert stockfish.is_move_correct("a7a6") and not stockfish.is_move_correct("a7a5a")
+    with pytest.raises(ValueError):
+        stockfish.make_moves_from_current_position(["a7a6", "b5a4", "e8e6"])
+    assert stockfish.get_fen_position() == engine_fen(stockfish) == \
+           "r1bqkbnr/1ppp1ppp/p1n5/4p3/B3P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 1 4"
+    # The moves before the illegal one were made, in both.
+    stockfish.flip()
+    assert stockfish.get_fen_position() == engine_fen(stockfish)
+    stockfish.set_fen_position(fen := "8/P6k/8/8/8/8/8/K7 w - - 0 1")
+    assert stockfish.get_fen_position() == engine_fen(stockfish) == fen
+    assert not stockfish.is_fen_valid("8/P6k/8/8 w - - 0 1")
+    assert stockfish.get_fen_position() == engine_fen(stockfish) == fen
+    stockfish.set_game_position(chess.STARTING_FEN, ["d2d4"], True)
+    stockfish.set_game_position(chess.STARTING_FEN, ["d2d4", "d7d5"])
+    stockfish.set_game_position(chess.STARTING_FEN, ["e2e4"])
+    assert stockfish.get_fen_position() == engine_fen(stockfish) == \
+           "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+    assert stockfish._mirror_of("not a fen") is None
+    # For a position python-chess can't read, the engine is asked instead.
+    stockfish.send_quit_command()
+
+def test_a_lazy_engine_is_quit_when_closed(engine_path):
+    engine = LazyEngine(engine_path)
+    engine.close() # Never started, so there's nothing to quit.
+    stockfish = engine.get()
+    engine.close()
+    assert commands_sent(engine_path)[-1] == 'quit' and stockfish._stockfish.poll() is not None
+    assert engine.get() is not stockfish
+    engine.close()
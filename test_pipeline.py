@@ -0,0 +1,77 @@
+from __future__ import annotations
+import json
+import os
+
+import chess
+
+from analysis import AnalysisProfile, AnalysisResult, MoveAnalysis
+import pipeline
+from Specs import Specs
+
+def test_positions_are_written_once_and_their_hits_joined_back_to_the_games(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, 'POSITIONS_PER_SHARD', 2)
+    monkeypatch.setattr('builtins.input', lambda _: '') # Not skipping any games.
+    specs = Specs('top moves')
+    specs.set_pgn(pgn := str(tmp_path / 'games.pgn'))
+    writer = pipeline.PositionWriter(str(tmp_path), specs, (None, None, None, [0.0, 1.0, None, None]))
+    board = chess.Board()
+    board.push_uci("e2e4")
+    writer.add(board, 1, 0, 1)
+    writer.add(board, 2, 500, 1) # The same position, in another game.
+    board.push_uci("e7e5")
+    writer.add(board, 2, 500, 2)
+    board.push_uci("g1f3")
+    writer.add(board, 2, 500, 3)
+    board.pop()
+    writer.add(board, 3, 900, 2) # In a shard already written, so just its reference is.
+    assert not pipeline.is_extracted(str(tmp_path), pgn)
+    assert writer.close(3).startswith("Extracted 5 positions of 3 games to 2 shards")
+    assert pipeline.is_extracted(str(tmp_path), pgn) and pipeline.extracted_feature(str(tmp_path)) == 'top moves'
+    source_folder = os.path.join(str(tmp_path), pipeline.source_key(pgn))
+    with open(os.path.join(source_folder, '00000.epd')) as f:
+        assert f.readline().endswith('id "1:0:1 2:500:1";\n')
+
+    result = AnalysisResult(board.fen(), "depth: 8", True, [MoveAnalysis("g1f3", 50, None, (400, 500, 100))])
+    assert AnalysisResult.from_json(json.loads(json.dumps(result.to_json()))) == result
+    results_folder = tmp_path / 'analysis' / pipeline.source_key(pgn)
+    results_folder.mkdir(parents=True)
+    (results_folder / '00000.jsonl').write_text(json.dumps(
+        {"fen": board.fen(), "refs": ["2:500:2"], "satisfied": True, "analyses": [result.to_json()]}
+    ) + "\n")
+    hits = pipeline.JoinedHits(str(results_folder), os.path.join(source_folder, pipeline.REPEATS_FILE), 3)
+    assert hits.results(500, 2) == hits.results(900, 2) == [result] and hits.results(0, 1) is None
+    assert hits.next_game() == (2, 500)
+    assert hits.next_game() == (3, 900)
+    assert hits.next_game() == (4, None)
+
+def test_shards_analysed_in_a_process_share_its_engine_and_cache(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(pipeline, 'POSITIONS_PER_SHARD', 1)
+    monkeypatch.setattr('builtins.input', lambda _: '')
+    monkeypatch.setattr(pipeline.LazyEngine, 'get', lambda self: self)
+    specs = Specs('top moves')
+    specs.set_pgn(str(tmp_path / 'games.pgn'))
+    writer = pipeline.PositionWriter(str(tmp_path), specs, (None, None, None, [0.0, 1.0, None, None]))
+    board = chess.Board()
+    for move in ("e2e4", "e7e5", "g1f3"):
+        board.push_uci(move)
+        writer.add(board, 1, 0, board.ply())
+    writer.close(1)
+    analysed_with = []
+
+    def analyse_position(engine, fen, feature, bounds, analysis, cache, tablebase):
+        analysed_with.append((engine, cache))
+        return False, []
+
+    pipeline.analyse(str(tmp_path), [0.0, 1.0, None, None], AnalysisProfile(), None, None, (0, 1), 1,
+                     analyse_position)
+    assert len(analysed_with) == 3
+    assert len({id(engine) for engine, _ in analysed_with}) == len({id(cache) for _, cache in analysed_with}) == 1
+    assert "Found 0 hits in 3 shards" in capsys.readouterr().out
+
+def test_analysis_settings_and_parts():
+    bounds = [0.0, 1.0, None, None]
+    assert (pipeline.analysis_folder('ext', 'top moves', bounds, None, None) ==
+            pipeline.analysis_folder('ext', 'top moves', list(bounds), None, None) !=
+            pipeline.analysis_folder('ext', 'top moves', bounds, 'depth=20', None))
+    assert pipeline.part_from_option(None) == (0, 1)
+    assert pipeline.part_from_option('2/3') == (1, 3)
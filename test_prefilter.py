@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from prefilter import Prefilter
+
+class FakeStockfish:
+    """Its static eval is off from its searches' eval by `error` pawns."""
+
+    def __init__(self) -> None:
+        self.eval = 0.0
+        self.error = 0.0
+        self.depth = 15
+
+    def get_static_eval(self) -> float:
+        return self.eval + self.error
+
+    def get_depth(self) -> int:
+        return self.depth
+
+    def set_depth(self, depth: int) -> None:
+        self.depth = depth
+
+    def get_top_moves(self, num_top_moves: int, num_nodes: int = 0) -> list[dict]:
+        return [{"Move": "e2e4", "Centipawn": round(self.eval * 100), "Mate": None}]
+
+def test_learns_margin_then_rejects_and_validates():
+    stockfish, prefilter = FakeStockfish(), Prefilter()
+    full_checks: list[float] = []
+    def full_check() -> bool:
+        full_checks.append(stockfish.eval)
+        return 1 <= stockfish.eval <= 2
+
+    for i in range(Prefilter.SAMPLE_SIZE):
+        stockfish.eval, stockfish.error = 5.0, (0.5 if i % 2 else -0.5)
+        assert not prefilter.check(stockfish, "8/8/8/8/8/8/8/8 w - - 0 1", 1, 2, full_check)
+    assert prefilter.margin() == 0.5
+    assert len(full_checks) == Prefilter.SAMPLE_SIZE
+
+    full_checks.clear()
+    stockfish.error = 0.4
+    stockfish.eval = 2.05 # Outside the bounds, but its static eval is within the margin of them.
+    assert not prefilter.check(stockfish, "8/8/8/8/8/8/8/8 w - - 0 1", 1, 2, full_check)
+    assert len(full_checks) == 1
+    stockfish.eval = 1.5
+    assert prefilter.check(stockfish, "8/8/8/8/8/8/8/8 w - - 0 1", 1, 2, full_check)
+    assert len(full_checks) == 2
+
+    stockfish.eval = -3.0
+    for _ in range(Prefilter.VALIDATION_INTERVAL * 3):
+        assert not prefilter.check(stockfish, "8/8/8/8/8/8/8/8 w - - 0 1", 1, 2, full_check)
+    assert len(full_checks) == 2 + 3
+    assert "false reject rate 0.0%" in prefilter.report()
+
+def test_validation_keeps_and_counts_false_rejects():
+    stockfish, prefilter = FakeStockfish(), Prefilter()
+    for _ in range(Prefilter.SAMPLE_SIZE):
+        prefilter.check(stockfish, "8/8/8/8/8/8/8/8 b - - 0 1", None, 0.5, lambda: True)
+    stockfish.eval = -5.0 # With black to move, this is +5 in the bounds' terms.
+    results = [prefilter.check(stockfish, "8/8/8/8/8/8/8/8 b - - 0 1", None, 0.5, lambda: True)
+               for _ in range(Prefilter.VALIDATION_INTERVAL)]
+    assert results == [False] * (Prefilter.VALIDATION_INTERVAL - 1) + [True]
+    assert "false reject rate 100.0%" in prefilter.report()
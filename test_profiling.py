@@ -0,0 +1,31 @@
+from __future__ import annotations
+import json
+
+import profiling
+
+def test_stages_are_timed_and_exported(tmp_path):
+    profiling.reset()
+
+    @profiling.timed("engine_read")
+    def read_line() -> str:
+        return "readyok"
+
+    for _ in range(3):
+        with profiling.timer("pgn_parse"):
+            assert read_line() == "readyok"
+        profiling.count("games")
+    data = profiling.snapshot()
+    assert data["stages"]["pgn_parse"]["calls"] == data["stages"]["engine_read"]["calls"] == 3
+    assert data["stages"]["pgn_parse"]["seconds"] >= data["stages"]["engine_read"]["seconds"]
+    assert data["counters"] == {"games": 3}
+
+    exporter = profiling.Exporter(str(tmp_path / "run-profile"), 'C:\\dbs\\"big".pgn', 3600)
+    exporter.maybe_write()
+    assert not (tmp_path / "run-profile.json").exists()
+    exporter.write()
+    assert json.loads((tmp_path / "run-profile.json").read_text())["counters"] == {"games": 3}
+    prom = (tmp_path / "run-profile.prom").read_text()
+    assert '# TYPE position_finder_stage_seconds_total counter\n' in prom
+    assert 'position_finder_stage_calls_total{source="C:\\\\dbs\\\\\\"big\\".pgn",stage="pgn_parse"} 3\n' in prom
+    assert 'position_finder_events_total{source="C:\\\\dbs\\\\\\"big\\".pgn",event="games"} 3\n' in prom
+    profiling.reset()
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import main
+from output_obj import Output
+import profiling
+import progress
+from Specs import Specs
+
+def test_reports_are_throttled_and_have_rates_and_eta(monkeypatch, capsys):
+    now = [100.0]
+    monkeypatch.setattr(progress.time, 'monotonic', lambda: now[0])
+    profiling.reset()
+    reporter = progress.ProgressReporter('big.pgn', 5)
+    now[0] += 4
+    assert not reporter.due()
+    now[0] += 1
+    assert reporter.due()
+    profiling.count('positions', 500)
+    reporter.report(0.25, 100, 0.1)
+    assert not reporter.due()
+    line = capsys.readouterr().err
+    assert line == ("big.pgn: 25.0%, 100 games (20/s), 500 positions (100/s), 0.0 engine searches/s, "
+                    "cache hits 10%, ETA 0:00:15\n")
+    now[0] += 10
+    reporter.report(1.0, 300)
+    assert capsys.readouterr().err == ("big.pgn: 100.0%, 300 games (20/s), 500 positions (0/s), "
+                                       "0.0 engine searches/s, ETA 0:00:00\n")
+    profiling.reset()
+
+def test_a_search_with_a_reporter_refreshes_its_results_by_time(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open('db.pgn', 'w') as f:
+        for i in range(30):
+            f.write(f'[White "{"Kasparov, Garry" if i < 2 else "White"}"]\n[Black "Black"]\n[Result "*"]\n\n*\n\n')
+    monkeypatch.setattr(Specs, 'default_output_interval', lambda self: 10)
+    writes = []
+    print_and_write_data = Output.print_and_write_data
+
+    def count_writes(self: Output, specs: Specs) -> None:
+        writes.append(self.num_games())
+        print_and_write_data(self, specs)
+
+    monkeypatch.setattr(Output, 'print_and_write_data', count_writes)
+    for progress_interval, expected_writes in ((None, [1, 2, 10, 20, 30]), (1e9, [1, 2]), (0.0, list(range(1, 31)))):
+        specs = Specs('name')
+        specs.set_verbose_name_feature(False)
+        specs.set_substrs_name_feature(['kasparov'])
+        specs.set_output_filename(f'progress-{progress_interval}')
+        specs.set_pgn('db.pgn')
+        specs.set_progress_interval(progress_interval)
+        writes.clear()
+        main.process_pgn(specs, ['kasparov'], None, None, None)
+        assert writes == expected_writes
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import pytest
+
+import pgn_index
+import sampling
+
+def write_pgn(path, num_games: int) -> None:
+    path.write_text("".join(f'[Event "{i}"]\n[Result "*"]\n\n1. e4 *\n\n' for i in range(num_games)))
+
+def test_sample_is_reproducible_and_in_file_order(tmp_path):
+    write_pgn(pgn := tmp_path / 'db.pgn', 50)
+    offsets = list(pgn_index.game_offsets(str(pgn)))
+    first, second, other_seed = (sampling.Sample(str(pgn), offsets[10], 5, seed) for seed in (7, 7, 8))
+    sampled = list(iter(first.next_offset, None))
+    assert first.population() == 40
+    assert sampled == sorted(sampled) and len(set(sampled)) == 5 and set(sampled) <= set(offsets[10:])
+    assert list(iter(second.next_offset, None)) == sampled
+    assert list(iter(other_seed.next_offset, None)) != sampled
+    assert len(list(iter(sampling.Sample(str(pgn), 0, 100, 0).next_offset, None))) == 50
+
+def test_estimates_extrapolate_with_confidence_intervals(tmp_path):
+    write_pgn(pgn := tmp_path / 'db.pgn', 100)
+    sample = sampling.Sample(str(pgn), 0, 4, 0)
+    total, low, high = sample.estimate([0.0, 1.0, 2.0, 1.0])
+    assert total == 100 and 0 < low < total < high and high - total == pytest.approx(total - low)
+    assert sample.estimate([0.0] * 4) == (0.0, 0.0, 75.0) # The rule of three.
+    whole = sampling.Sample(str(pgn), 0, 100, 0)
+    assert whole.estimate([float(i % 2) for i in range(100)]) == (50.0, 50.0, 50.0)
+    for hits in (0, 1, 0, 2):
+        sample.record(1.5, {"hits": hits})
+    assert sample.fraction_searched() == 1.0
+    assert sample.report() == ("Sampled 4 of the 100 games (estimates for all of them, with 95% confidence "
+                               "intervals):\n    hits: 75 (0 to 167), 3 in the sample\n"
+                               "    time: 0:02:30 (0:02:30 to 0:02:30)")
+    assert sampling.sample_from_option('') == (1000, 0) and sampling.sample_from_option('200:3') == (200, 3)
+    assert sampling.sample_from_option(None) is None
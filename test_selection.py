@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import chess
+
+import selection
+
+def board_after(*moves: str) -> chess.Board:
+    board = chess.Board()
+    for move in moves:
+        board.push_san(move)
+    return board
+
+def test_quiet_positions_exclude_checks_and_pending_recaptures():
+    exchange = board_after('e4', 'd5', 'exd5')
+    assert selection.is_capture_pending(exchange)
+    assert not selection.is_capture_pending(board_after('e4', 'd5', 'exd5', 'Qxd5')) # Nothing attacks d5.
+    assert not selection.is_capture_pending(board_after('e4', 'e5')) # No capture to recapture.
+    assert not selection.is_capture_pending(board_after('e4', 'f5', 'exf5')) # A capture that can't be taken back.
+    quiet = selection.PositionSelection(quiet=True)
+    assert not quiet.selects(exchange, 0)
+    assert not quiet.selects(board_after('e4', 'f5', 'Qh5+'), 0)
+    assert quiet.selects(board_after('e4', 'e5'), 0)
+    assert quiet.report() == "Position selection: 2 of 3 positions skipped (check: 1, pending capture: 1)"
+
+def test_end_ply_stride_and_max_per_game():
+    selected: list[int] = []
+    stride = selection.PositionSelection(end_ply=30, stride=3, max_per_game=4)
+    board = chess.Board()
+    for ply in range(10, 60):
+        if stride.is_game_done(ply, len(selected), 59):
+            break
+        if stride.selects(board, ply - 10):
+            selected.append(ply)
+    assert selected == [10, 13, 16, 19]
+    assert stride.report() == "Position selection: 46 of 50 positions skipped (stride: 6, max per game: 40)"
+    ended = selection.PositionSelection(end_ply=12)
+    assert [ply for ply in range(10, 20) if not ended.is_game_done(ply, 0, 19)] == [10, 11, 12]
+    assert selection.selection_from_options(None, None, None, None) is None
+    assert selection.selection_from_options(None, '2', '', None).report() is None
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import checkpoint
+from output_obj import Output
+from Specs import Specs
+import studies
+
+STUDY_PGNS = {f'study{i:03d}': f'[Event "Study {i}"]\n\n1. e4 *\n\n' for i in range(12)}
+
+class StudyServer(BaseHTTPRequestHandler):
+    """A stand-in for the local lichess server, which sends an ETag for each study."""
+
+    requests_seen: list[tuple[str, bool]] = []
+
+    def do_GET(self) -> None:
+        study_id = self.path.split('/')[-1].split('.pgn')[0]
+        etag = f'"{hash(STUDY_PGNS[study_id])}"'
+        StudyServer.requests_seen.append((study_id, 'If-None-Match' in self.headers))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = STUDY_PGNS[study_id].encode()
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    StudyServer.requests_seen = []
+    httpd = ThreadingHTTPServer(('localhost', 0), StudyServer)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(studies, 'LOCAL_URL', f'http://localhost:{httpd.server_address[1]}')
+    monkeypatch.setattr(studies, '_updated_studies', set())
+    yield httpd
+    httpd.shutdown()
+
+def test_fetches_all_studies(server):
+    studies.update_cached_studies(list(STUDY_PGNS))
+    assert sorted(x[0] for x in StudyServer.requests_seen) == sorted(STUDY_PGNS)
+    for study_id, pgn in STUDY_PGNS.items():
+        with open(studies.cached_study_path(study_id)) as f:
+            assert f.read() == pgn
+    assert len(StudyServer.requests_seen) == len(STUDY_PGNS)
+
+def test_unchanged_studies_are_not_downloaded_again(server, monkeypatch):
+    studies.update_cached_studies(list(STUDY_PGNS))
+    monkeypatch.setattr(studies, '_updated_studies', set())
+    monkeypatch.setitem(STUDY_PGNS, 'study000', '[Event "Changed"]\n\n1. d4 *\n\n')
+    studies.update_cached_studies(list(STUDY_PGNS))
+
+    assert all(sent_validator for _, sent_validator in StudyServer.requests_seen[len(STUDY_PGNS):])
+    assert len(os.listdir(studies.OBJECTS_FOLDER)) == len(set(STUDY_PGNS.values())) + 1
+    with open(studies.cached_study_path('study000')) as f:
+        assert f.read() == STUDY_PGNS['study000']
+
+def test_identical_studies_are_stored_once(server, monkeypatch):
+    monkeypatch.setitem(STUDY_PGNS, 'study001', STUDY_PGNS['study000'])
+    studies.update_cached_studies(['study000', 'study001'])
+    assert studies.cached_study_path('study000') == studies.cached_study_path('study001')
+    assert len(os.listdir(studies.OBJECTS_FOLDER)) == 1
+
+def test_old_copies_are_evicted(server, monkeypatch):
+    studies.update_cached_studies(['study000'])
+    old_copy = studies.cached_study_path('study000')
+    monkeypatch.setattr(studies, '_updated_studies', set())
+    monkeypatch.setitem(STUDY_PGNS, 'study000', '[Event "Changed"]\n\n1. d4 *\n\n')
+    studies.update_cached_studies(['study000'])
+    assert os.path.isfile(old_copy)
+    monkeypatch.setattr(studies, 'MAX_CACHE_BYTES', 0)
+    studies.evict_old_copies()
+    assert not os.path.isfile(old_copy)
+    assert os.listdir(studies.OBJECTS_FOLDER) == [os.path.basename(studies.cached_study_path('study000'))]
+
+def test_copies_being_searched_by_checkpoints_are_kept(server, monkeypatch):
+    studies.update_cached_studies(['study000'])
+    specs = Specs('name')
+    specs.set_output_filename('search')
+    checkpoint.save(specs, (['kasparov'], None, None, None), old_copy := studies.cached_study_path('study000'), 0,
+                    Output())
+    monkeypatch.setattr(studies, '_updated_studies', set())
+    monkeypatch.setitem(STUDY_PGNS, 'study000', '[Event "Changed"]\n\n1. d4 *\n\n')
+    monkeypatch.setattr(studies, 'MAX_CACHE_BYTES', 0)
+    studies.update_cached_studies(['study000'])
+    assert os.path.isfile(old_copy)
+    checkpoint.remove(specs)
+    studies.evict_old_copies()
+    assert not os.path.isfile(old_copy)
+
+def test_old_cache_layout_is_imported(server):
+    os.makedirs(studies.cache_dir('study000'))
+    with open(os.path.join(studies.cache_dir('study000'), 'study000-1.pgn'), 'w') as f:
+        f.write('[Event "Old"]\n\n1. c4 *\n\n')
+    with open(studies.cached_copy('study000') or '') as f:
+        assert f.read() == '[Event "Old"]\n\n1. c4 *\n\n'
+    assert os.listdir(studies.cache_dir('study000')) == [studies.POINTER_FILENAME]
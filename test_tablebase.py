@@ -0,0 +1,77 @@
+from __future__ import annotations
+import os
+
+import chess
+import pytest
+
+from analysis import AnalysisCache, AnalysisProfile
+import main
+from tablebase import Tablebase, open_tablebase
+
+SYZYGY_FIXTURES = os.environ.get('SYZYGY_FIXTURES', os.path.join(os.path.dirname(__file__), 'test-data', 'syzygy'))
+"""A directory with the 3-4 piece tables, for the tests against real tables (which are skipped without it)."""
+
+class FakeTables:
+    """Gives the (wdl, dtz) for preset positions (by their board part of the fen), with the rest drawn."""
+
+    def __init__(self, outcomes: dict[str, tuple[int, int]]) -> None:
+        self.outcomes = outcomes
+
+    def probe_wdl(self, board: chess.Board) -> int:
+        return self.outcomes.get(board.board_fen(), (0, 0))[0]
+
+    def probe_dtz(self, board: chess.Board) -> int:
+        return self.outcomes.get(board.board_fen(), (0, 0))[1]
+
+    def close(self) -> None:
+        pass
+
+def board_after(fen: str, move: str) -> str:
+    board = chess.Board(fen)
+    board.push_uci(move)
+    return board.board_fen()
+
+UNDERPROMOTION_FEN = "8/2P5/8/8/8/8/k7/2K5 w - - 0 1"
+
+def test_moves_are_ranked_and_mapped_to_evals():
+    tables = FakeTables({
+        board_after(UNDERPROMOTION_FEN, "c7c8n"): (-2, -5),
+        board_after(UNDERPROMOTION_FEN, "c7c8r"): (-2, -11),
+        board_after(UNDERPROMOTION_FEN, "c1c2"): (-2, -20),
+        board_after(UNDERPROMOTION_FEN, "c1d1"): (2, 8),
+        board_after(UNDERPROMOTION_FEN, "c1d2"): (-1, -30), # A cursed win.
+    })
+    top_moves = Tablebase(tables, 5).top_moves(UNDERPROMOTION_FEN)
+    assert top_moves is not None
+    assert [(m["Move"], m["Centipawn"], m["Mate"]) for m in top_moves[:4]] == [
+        ("c7c8n", None, 3), ("c7c8r", None, 6), ("c1c2", None, 11), (top_moves[3]["Move"], 0, None)
+    ]
+    assert top_moves[-1]["Move"] == "c1d1" and top_moves[-1]["Mate"] == -5 and top_moves[-1]["WDL"] == "0 0 1000"
+    assert next(m for m in top_moves if m["Move"] == "c1d2")["Centipawn"] == 0
+
+    # With the halfmove clock at 85, the king move's win takes too long, unlike the promotion's (a pawn move).
+    top_moves = Tablebase(tables, 5).top_moves(UNDERPROMOTION_FEN.replace(" 0 1", " 85 60"))
+    assert top_moves is not None and top_moves[0]["Mate"] == 3
+    assert next(m for m in top_moves if m["Move"] == "c1c2")["Centipawn"] == 0
+    assert Tablebase(tables, 2).top_moves(UNDERPROMOTION_FEN) is None
+
+def test_checks_are_answered_without_the_engine():
+    tablebase = Tablebase(FakeTables({board_after(UNDERPROMOTION_FEN, "c7c8n"): (-2, -5)}), 5)
+    board = chess.Board(UNDERPROMOTION_FEN)
+    assert main.is_underpromotion_best(object(), board, AnalysisProfile(), tablebase) == "c7c8n"
+    result = main.check_bounds(object(), UNDERPROMOTION_FEN, [3.0, None, None, 0.5], AnalysisProfile(),
+                               AnalysisCache(), tablebase=tablebase)
+    assert result is not None and result.satisfied and result.limit == "tablebase"
+    assert result.moves[0].wdl == (1000, 0, 0)
+
+    tablebase = Tablebase(FakeTables({}), 5)
+    assert main.is_underpromotion_best(object(), board, AnalysisProfile(), tablebase) is False
+
+@pytest.mark.skipif(not os.path.isdir(SYZYGY_FIXTURES), reason="The Syzygy fixtures aren't available")
+def test_real_tables():
+    tablebase = open_tablebase(SYZYGY_FIXTURES)
+    top_moves = tablebase.top_moves("8/8/8/8/8/2k5/8/K2Q4 w - - 0 1")
+    assert top_moves is not None and top_moves[0]["Mate"] is not None and top_moves[0]["Mate"] > 0
+    assert tablebase.top_moves("8/8/8/8/8/2k5/8/K2N4 w - - 0 1")[0]["Centipawn"] == 0
+    assert tablebase.top_moves("8/8/8/8/8/2k5/8/KRRR4 w - - 0 1") is None # 5 pieces.
+    tablebase.close()
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from analysis import AnalysisResult, MoveAnalysis
+import trajectory
+
+WHITE_FEN = "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3"
+BLACK_FEN = "r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3"
+
+def result(fen: str, *moves: tuple[str, int], satisfied: bool = False) -> AnalysisResult:
+    return AnalysisResult(fen, "depth: 8", satisfied, [MoveAnalysis(move, cp, None) for move, cp in moves])
+
+def test_positions_far_outside_the_bounds_are_skipped_along_the_game():
+    pruner = trajectory.TrajectoryPruner(1.0)
+    assert not pruner.is_out_of_range(20, "e2e4", WHITE_FEN, -1.0, 1.0) # Nothing to go on yet.
+    pruner.record(result(WHITE_FEN, ("f1b5", 600), ("f1c4", 550)))
+    assert pruner.is_out_of_range(21, "f1b5", BLACK_FEN, -1.0, 1.0) # About +6 after the top move.
+    assert pruner.is_out_of_range(22, "a7a6", WHITE_FEN, -1.0, 1.0)
+    # Black's move can't have done better than the +6 (give or take 2 plies' threshold) it was predicted at.
+    assert not pruner.is_out_of_range(23, "b5a4", BLACK_FEN, -1.0, 1.0)
+    # But White's move could have thrown it all away.
+    pruner.record(result(BLACK_FEN, ("g8f6", 100)))
+    assert pruner.is_out_of_range(24, "g8f6", WHITE_FEN, 1.0, None) # About -1, and the lower bound is +1.
+    assert not pruner.is_out_of_range(25, "e1g1", BLACK_FEN, 1.0, None)
+    # White's move can at best keep the eval, which was at most 0, so it's at most +1 (not clearly below +1).
+    pruner.record(result(BLACK_FEN, ("g8f6", 100)))
+    assert not pruner.is_out_of_range(26, "b8c6", WHITE_FEN, 1.0, None)
+    # Black played a move worse than g8f6, so the eval is only known to be above -1.
+    pruner.new_game()
+    assert not pruner.is_out_of_range(27, "f1b5", BLACK_FEN, -1.0, 1.0)
+    assert pruner.report() == ("Trajectory pruning (threshold 1.00): skipped 3 of 8 positions; 0 of the 0 "
+                               "checked in full anyway were hits (false skip rate 0.0%)")
+
+def test_every_so_often_a_skip_is_checked_in_full():
+    pruner = trajectory.TrajectoryPruner(0.5)
+    outcomes = []
+    for i in range(trajectory.TrajectoryPruner.VALIDATION_INTERVAL * 2):
+        pruner.new_game()
+        pruner.is_out_of_range(30, "e2e4", WHITE_FEN, None, 1.0)
+        pruner.record(result(WHITE_FEN, ("f1b5", 300)))
+        outcomes.append(pruner.is_out_of_range(31, "f1b5", BLACK_FEN, None, 1.0))
+        pruner.record(result(BLACK_FEN, ("a7a6", -90), satisfied=True) if not outcomes[-1] else None)
+    assert outcomes.count(False) == 2 and not outcomes[19] and not outcomes[39]
+    assert pruner.report().endswith("2 of the 2 checked in full anyway were hits (false skip rate 100.0%)")
+    assert trajectory.pruner_from_option(None) is None
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import chess
+
+from analysis import AnalysisProfile
+import main
+
+class FakeStockfish:
+    """Scores each move by a preset centipawn eval, and records the searches it's asked to do."""
+
+    def __init__(self, fen: str, scores: dict[str, int]) -> None:
+        self.fen = fen
+        self.scores = scores
+        self.searches: list[list[str]] = []
+
+    def get_fen_position(self) -> str:
+        return self.fen
+
+    def set_depth(self, depth: int) -> None:
+        pass
+
+    def get_top_moves(self, num_top_moves: int, verbose: bool, searchmoves: list[str]) -> list[dict]:
+        self.searches.append(searchmoves)
+        best = max(searchmoves, key=lambda x: self.scores.get(x, 0))
+        return [{"Move": best, "Centipawn": self.scores.get(best, 0), "Mate": None}]
+
+def test_candidates_are_legal_underpromotions():
+    assert main.underpromotions(chess.Board()) == []
+    assert sorted(main.underpromotions(chess.Board("1n6/2P5/8/8/8/8/k7/2K5 w - - 0 1"))) == [
+        "c7b8b", "c7b8n", "c7b8r", "c7c8b", "c7c8n", "c7c8r"
+    ]
+    assert main.underpromotions(chess.Board("2n5/2P5/8/8/8/8/k7/2K5 w - - 0 1")) == []
+    assert sorted(main.underpromotions(chess.Board("8/8/8/8/8/K7/2p5/k7 b - - 0 1"))) == ["c2c1b", "c2c1n", "c2c1r"]
+
+def test_no_search_without_an_underpromotion():
+    stockfish = FakeStockfish(chess.STARTING_FEN, {})
+    assert main.is_underpromotion_best(lambda: stockfish, chess.Board(), AnalysisProfile()) is False
+    assert not stockfish.searches
+
+def test_underpromotion_against_best_other_move():
+    board = chess.Board("8/2P5/8/8/8/8/k7/2K5 w - - 0 1")
+    stockfish = FakeStockfish(board.fen(), {"c7c8r": 500, "c7c8q": 0})
+    assert main.is_underpromotion_best(lambda: stockfish, board, AnalysisProfile()) == "c7c8r"
+    assert len(stockfish.searches) == 6
+    assert all(sorted(x) == ["c7c8b", "c7c8n", "c7c8r"] for x in stockfish.searches[::2])
+    assert all("c7c8q" in x and "c7c8r" not in x for x in stockfish.searches[1::2])
+
+    stockfish = FakeStockfish(board.fen(), {"c7c8r": 500, "c7c8q": 900})
+    assert main.is_underpromotion_best(lambda: stockfish, board, AnalysisProfile()) is False
+    assert len(stockfish.searches) == 2
@@ -0,0 +1,97 @@
+"""Pruning by the eval trajectory of a game: consecutive positions of a game have similar evals, so the last
+analysis of a game (with the eval of the move actually played, if it was one of the top moves analysed) says
+roughly what the next position's eval is. If that's well outside the bounds for the top move, the next
+position is skipped without a search.
+
+Evals here are in the same terms as the bounds in does_position_satisfy_bounds (i.e., White's)."""
+
+from __future__ import annotations
+import math
+from typing import TYPE_CHECKING, Optional
+
+from prefilter import MATE_SCORE
+
+if TYPE_CHECKING:
+    from analysis import AnalysisResult
+
+class TrajectoryPruner:
+    VALIDATION_INTERVAL = 20
+    """Every this many pruned positions, the full check is done anyway, to measure the false skip rate."""
+
+    def __init__(self, threshold: float = 1.0) -> None:
+        """`threshold` is how far (in pawns) the next position's eval may stray from the one predicted for it,
+           per ply since the last position analysed."""
+        assert threshold >= 0
+        self._threshold = threshold
+        self._ply: Optional[int] = None
+        self._interval = (-math.inf, math.inf)
+        """What the eval of the position at self._ply is known to be within."""
+        self._white_to_move = True
+        self._move_evals: dict[str, float] = {}
+        """The evals of the position's top moves, if it was analysed."""
+        self._num_checked = self._num_pruned = self._num_validated = self._num_false_skips = 0
+        self._validating = False
+
+    def new_game(self) -> None:
+        self._ply = None
+
+    def _predict(self, ply: int, played_move: str) -> tuple[float, float]:
+        """Returns the interval the eval of the position after `played_move` is predicted to be within."""
+        if self._ply != ply - 1:
+            return -math.inf, math.inf
+        if played_move in self._move_evals:
+            eval_after = self._move_evals[played_move]
+            return eval_after - self._threshold, eval_after + self._threshold
+        if self._move_evals:
+            # Worse for the player who moved than the top moves analysed.
+            best = min(self._move_evals.values()) if self._white_to_move else max(self._move_evals.values())
+        else:
+            # At best the top move, which is what the position's eval is.
+            best = self._interval[1] if self._white_to_move else self._interval[0]
+        return (-math.inf, best + self._threshold) if self._white_to_move else (best - self._threshold, math.inf)
+
+    def is_out_of_range(self, ply: int, played_move: str, fen: str, lower_bound: Optional[float],
+                        upper_bound: Optional[float]) -> bool:
+        """Returns whether the position at `ply` (reached by `played_move`) is to be skipped, since its eval is
+           predicted to be outside the bounds for the top move. If not, its check's result is to be passed to
+           record()."""
+        low, high = self._predict(ply, played_move)
+        self._ply, self._interval, self._white_to_move, self._move_evals = ply, (low, high), 'w' in fen, {}
+        self._validating = False
+        self._num_checked += 1
+        if not ((lower_bound is not None and high < lower_bound) or (upper_bound is not None and low > upper_bound)):
+            return False
+        self._num_pruned += 1
+        if self._num_pruned % self.VALIDATION_INTERVAL:
+            return True
+        self._validating = True
+        self._num_validated += 1
+        return False
+
+    def record(self, result: Optional[AnalysisResult]) -> None:
+        """Records the check of the position is_out_of_range was last called for (None if it wasn't searched)."""
+        if result is None:
+            return
+        if self._validating and result.satisfied:
+            self._num_false_skips += 1
+        multiplier = 1 if self._white_to_move else -1
+        self._move_evals = {
+            m.move: (math.copysign(MATE_SCORE, m.mate * multiplier) if m.mate is not None else
+                     m.centipawn * multiplier * 0.01)
+            for m in result.moves if m.mate is not None or m.centipawn is not None
+        }
+        if self._move_evals:
+            best = max(self._move_evals.values()) if self._white_to_move else min(self._move_evals.values())
+            self._interval = (best, best)
+
+    def report(self) -> str:
+        false_skip_rate = self._num_false_skips / self._num_validated if self._num_validated else 0.0
+        return (f"Trajectory pruning (threshold {self._threshold:.2f}): skipped "
+                f"{self._num_pruned - self._num_validated} of {self._num_checked} positions; {self._num_false_skips} "
+                f"of the {self._num_validated} checked in full anyway were hits (false skip rate {false_skip_rate:.1%})")
+
+def pruner_from_option(option: Optional[str]) -> Optional[TrajectoryPruner]:
+    """Returns the pruner for the `--trajectory[=THRESHOLD]` option (None if it wasn't given)."""
+    if option is None:
+        return None
+    return TrajectoryPruner(float(option or '1.0'))